@@ -7,7 +7,8 @@ auth/challenge_response.py – Logik für Challenge-Response-Authentifizierung
 import hmac
 import hashlib
 import os
-from typing import Optional
+import threading
+from typing import Dict, Hashable, Iterable, Optional
 
 
 # Gemeinsamer Schlüssel (Testversion)
@@ -16,23 +17,107 @@ from typing import Optional
 
 SHARED_KEY: Optional[bytes] = None
 
+DEFAULT_KEY_ID = "shared"  # Slot im KeyStore für den globalen Shared Key
+
+
+class KeyStore:
+    """
+    Ein vorberechneter HMAC-SHA256-Kontext pro Gerät (Key-Setup nur einmal).
+    Pro Challenge wird der Kontext kopiert (.copy()), daher können beliebig
+    viele Sitzungen gleichzeitig prüfen; der Lock schützt nur das Dict.
+    """
+
+    def __init__(self):
+        self._keys: Dict[Hashable, bytes] = {}
+        self._contexts: Dict[Hashable, "hmac.HMAC"] = {}
+        self._lock = threading.Lock()
+
+    def set(self, key_id: Hashable, key: bytes) -> None:
+        key = bytes(key)
+        with self._lock:
+            current = self._keys.get(key_id)
+            if current is not None and hmac.compare_digest(current, key):
+                return  # gleicher Key -> Kontext bleibt
+        ctx = hmac.new(key, digestmod=hashlib.sha256)
+        with self._lock:
+            self._keys[key_id] = key
+            self._contexts[key_id] = ctx
+
+    def set_hex(self, key_id: Hashable, key_hex: str) -> None:
+        self.set(key_id, bytes.fromhex(key_hex))
+
+    def remove(self, key_id: Hashable) -> None:
+        with self._lock:
+            self._keys.pop(key_id, None)
+            self._contexts.pop(key_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._contexts.clear()
+
+    def __contains__(self, key_id: Hashable) -> bool:
+        return key_id in self._contexts
+
+    def __len__(self) -> int:
+        return len(self._contexts)
+
+    def _context(self, key_id: Hashable):
+        with self._lock:
+            ctx = self._contexts.get(key_id)
+            return ctx.copy() if ctx is not None else None
+
+    def expected(self, key_id: Hashable, challenge: bytes) -> bytes:
+        ctx = self._context(key_id)
+        if ctx is None:
+            raise KeyError(f"Kein Key für {key_id!r} hinterlegt.")
+        ctx.update(challenge)
+        return ctx.digest()
+
+    def verify(self, key_id: Hashable, challenge: bytes, response: bytes) -> bool:
+        try:
+            return hmac.compare_digest(response, self.expected(key_id, challenge))
+        except KeyError:
+            return False
+
+    def verify_any(self, challenge: bytes, response: bytes,
+                   key_ids: Optional[Iterable[Hashable]] = None) -> Optional[Hashable]:
+        """
+        Prüft eine Response gegen mehrere Kandidaten-Keys (Absender unbekannt).
+        Rückgabe: key_id des passenden Keys oder None. Es werden immer alle
+        Kandidaten geprüft, damit die Laufzeit nicht verrät, welcher passt.
+        """
+        with self._lock:
+            ids = list(self._contexts) if key_ids is None else [k for k in key_ids if k in self._contexts]
+            contexts = [(k, self._contexts[k].copy()) for k in ids]
+        match = None
+        for key_id, ctx in contexts:
+            ctx.update(challenge)
+            if hmac.compare_digest(response, ctx.digest()) and match is None:
+                match = key_id
+        return match
+
+
+key_store = KeyStore()
+
 # Optionaler Fallback für lokale Tests (z. B. export SHARED_KEY_HEX=... )
 _env_hex = os.getenv("SHARED_KEY_HEX")
 if _env_hex:
     try:
         SHARED_KEY = bytes.fromhex(_env_hex.strip())
+        key_store.set(DEFAULT_KEY_ID, SHARED_KEY)
     except Exception:
         SHARED_KEY = None
 
 def set_shared_key_hex(token_hex: str) -> None:
-    """Setzt den Shared Key aus einem Hex-String."""
-    global SHARED_KEY
-    SHARED_KEY = bytes.fromhex(token_hex)
+    """Setzt den Shared Key aus einem Hex-String (kompatibel; neu: key_store pro Gerät)."""
+    set_shared_key(bytes.fromhex(token_hex))
 
 def set_shared_key(key_bytes: bytes) -> None:
     """Setzt den Shared Key direkt als Bytes."""
     global SHARED_KEY
     SHARED_KEY = key_bytes
+    key_store.set(DEFAULT_KEY_ID, key_bytes)
 
 def require_key() -> bytes:
     """Liefert den aktuell gesetzten Key oder wirft einen klaren Fehler."""
@@ -40,17 +125,20 @@ def require_key() -> bytes:
         raise RuntimeError("Shared key not set. Fetch token from cloud first.")
     return SHARED_KEY
 
-def generate_expected_response(challenge: bytes) -> bytes:
+def generate_expected_response(challenge: bytes, key: Optional[bytes] = None) -> bytes:
     """
     Berechnet den erwarteten Response als HMAC-SHA256 über die Challenge.
-    Nutzt den zur Laufzeit gesetzten Shared Key.
+    Nutzt 'key' oder den zur Laufzeit gesetzten Shared Key (vorberechneter Kontext).
     """
-    key = require_key()
-    return hmac.new(key, challenge, hashlib.sha256).digest()
+    if key is not None:
+        return hmac.new(key, challenge, hashlib.sha256).digest()
+    require_key()
+    return key_store.expected(DEFAULT_KEY_ID, challenge)
 
-def verify_response(challenge: bytes, response: bytes) -> bool:
+def verify_response(challenge: bytes, response: bytes, key: Optional[bytes] = None) -> bool:
     """
     Prüft, ob die empfangene Response dem erwarteten Wert entspricht.
+    Für parallele Sitzungen besser key_store.verify(key_id, ...) verwenden.
     """
-    expected = generate_expected_response(challenge)
+    expected = generate_expected_response(challenge, key)
     return hmac.compare_digest(response, expected)
\ No newline at end of file
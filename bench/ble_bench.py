@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench/ble_bench.py – Benchmarks des echten main-Ablaufs gegen den BLE-Simulator
+
+Jedes Szenario läuft in einem eigenen Kindprozess (saubere Singletons, eigenes
+ru_maxrss): main.main() unverändert mit Backend 'sim' (ble/simulator.py), lokal
+vorbefüllter Geräteliste und Tokens (kein Cloud-Kontakt) bis zur ersten
+Freigabe (DIO6 -> 0). Gemessen werden:
+  time_to_unlock_s  Start des Scanners -> DIO6 grün (Simulatorzeit);
+                    'returning' = 'single_near' mit bekannten GATT-Handles
+  scan_cpu_ms       CPU-Zeit in der Advertisement-Verarbeitung (presence.update)
+  cpu_ms            CPU-Zeit des ganzen Prozesses
+  max_rss_kb        Spitzen-Speicher des Prozesses
+
+Aufruf aus dem Projektverzeichnis:
+  python -m bench.ble_bench                  # alle Szenarien
+  python -m bench.ble_bench crowd approach   # Auswahl
+  python -m bench.ble_bench --json           # Ergebnis als JSON
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_PREFIX = "BENCH_RESULT "
+SCENARIO_TIMEOUT_S = 40.0
+
+
+# ---------------------------------------------------------
+# Szenarien: Liste autorisierter Telefone + Fremdgeräte
+# ---------------------------------------------------------
+def _phone(sim, index: int, **kwargs):
+    device_id = bytes([0x6F, 0x0E, 0x2D, 0x2F, 0x34, 0xA1, 0xF4, index])
+    key = bytes([index]) * 32
+    return sim.SimPhone(f"5A:74:B4:51:A5:{index:02X}", device_id, key, name=f"Phone {index}", **kwargs)
+
+
+def build_scenario(name: str):
+    from ble import simulator as sim
+
+    if name in ("single_near", "returning"):
+        phones = [_phone(sim, 1, trajectory=sim.constant(-55.0))]
+    elif name == "approach":
+        phones = [_phone(sim, 1, trajectory=sim.approach(-92.0, -55.0, duration=4.0))]
+    elif name == "crowd":
+        phones = [_phone(sim, 1, trajectory=sim.approach(-92.0, -55.0, duration=4.0))]
+        phones += sim.background_devices(200, rssi=-78.0, adv_interval=0.1)
+    elif name == "multi_phone":
+        phones = [_phone(sim, 1, trajectory=sim.constant(-82.0)),
+                  _phone(sim, 2, trajectory=sim.walk_by(-95.0, -70.0, duration=6.0)),
+                  _phone(sim, 3, trajectory=sim.approach(-88.0, -55.0, duration=3.0, delay=1.0))]
+    elif name == "high_rate":
+        phones = [_phone(sim, 1, trajectory=sim.constant(-55.0), adv_interval=0.02)]
+        phones += sim.background_devices(50, rssi=-70.0, adv_interval=0.02)
+    else:
+        raise ValueError(f"Unbekanntes Szenario: {name}")
+    return sim.BleSimulator(phones, seed=1)
+
+
+SCENARIOS = ("single_near", "returning", "approach", "crowd", "multi_phone", "high_rate")
+
+
+# ---------------------------------------------------------
+# Kindprozess: ein Szenario messen
+# ---------------------------------------------------------
+class _Unlocked(BaseException):
+    """Beendet main() nach der ersten Freigabe (nicht von 'except Exception' gefangen)."""
+
+
+def run_child(name: str) -> dict:
+    os.environ.setdefault("RCU_DATA_DIR", tempfile.mkdtemp(prefix="rcu-bench-"))
+    sys.path.insert(0, ROOT)
+
+    from ble.backend import use_backend
+    simulator = build_scenario(name)
+    use_backend(simulator)
+
+    import main
+    from ble.presence import presence
+    from ble.registry import registry
+    from cloud.device_sync import smartphone_sync
+    from cloud.snapshot import snapshot_store
+    from cloud.token_cache import token_cache
+
+    # Geräteliste und Tokens wie aus einem frischen Snapshot – kein Cloud-Kontakt
+    authorized = [p for p in simulator.phones.values() if p.device_id is not None]
+    smartphones = [{"id": i + 1, "deviceId": p.device_id.hex(), "name": p.name, "status": "active"}
+                   for i, p in enumerate(authorized)]
+    smartphone_sync.restore({"smartphones": smartphones, "synced_at": time.time()})
+    registry.update(smartphone_sync.smartphones(), smartphone_sync.revision)
+    for i, p in enumerate(authorized):
+        token_cache.put(i + 1, p.key.hex())
+    if name == "returning":
+        # Bekanntes Telefon: GATT-Handles aus einer früheren Sitzung -> Connect ohne Service-Suche
+        from ble.gatt_cache import gatt_cache
+        from ble.simulator import _gatt_layout
+        from ble.gatt_client import CHAR_CHALLENGE, CHAR_RESPONSE
+        layout = _gatt_layout()
+        for p in authorized:
+            gatt_cache.put(p.address, layout.get_characteristic(CHAR_CHALLENGE).handle,
+                           layout.get_characteristic(CHAR_RESPONSE).handle)
+
+    result = {"scenario": name, "devices": len(simulator.phones), "unlocked": False,
+              "time_to_unlock_s": None, "winner": None}
+    scan_cpu = [0.0]
+
+    # Messpunkte statt Hardware/Cloud
+    def dio6_set(value, wait=False):
+        if int(value) == 0 and result["time_to_unlock_s"] is None:
+            result["time_to_unlock_s"] = simulator.now()
+
+    async def check_remote_mode_async(rcu_id):
+        return False
+
+    async def start_unlocked_mode(device_name, device_id, address=None):
+        result["unlocked"] = True
+        result["winner"] = device_name
+        raise _Unlocked()
+
+    def update(device, adv, _inner=presence.update):
+        t0 = time.thread_time()
+        try:
+            return _inner(device, adv)
+        finally:
+            scan_cpu[0] += time.thread_time() - t0
+
+    main.dio6_set = dio6_set
+    main.check_remote_mode_async = check_remote_mode_async
+    main.start_unlocked_mode = start_unlocked_mode
+    main.init_devices_from_cloud = lambda rcu_id=None: registry
+    main.notify_rcu_event = lambda *args, **kwargs: None
+    snapshot_store.persist = lambda: False
+    presence.update = update  # vor ensure_scanning(): der Scanner bindet die Methode beim Start
+
+    usage0 = resource.getrusage(resource.RUSAGE_SELF)
+
+    async def bench():
+        try:
+            await asyncio.wait_for(main.main(), SCENARIO_TIMEOUT_S)
+        except (_Unlocked, asyncio.TimeoutError):
+            pass
+
+    try:
+        asyncio.run(bench())
+    except _Unlocked:
+        pass
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    result.update({
+        "scan_cpu_ms": round(scan_cpu[0] * 1000.0, 1),
+        "cpu_ms": round((usage.ru_utime - usage0.ru_utime + usage.ru_stime - usage0.ru_stime) * 1000.0, 1),
+        "max_rss_kb": usage.ru_maxrss,
+        "advertisements": simulator.stats["advertisements"],
+        "connects": simulator.stats["connects"],
+    })
+    if result["time_to_unlock_s"] is not None:
+        result["time_to_unlock_s"] = round(result["time_to_unlock_s"], 3)
+    return result
+
+
+# ---------------------------------------------------------
+# Elternprozess: Szenarien nacheinander starten und auswerten
+# ---------------------------------------------------------
+def run_scenario(name: str) -> dict:
+    proc = subprocess.run([sys.executable, "-m", "bench.ble_bench", "--child", name],
+                          cwd=ROOT, capture_output=True, text=True, timeout=SCENARIO_TIMEOUT_S + 30.0)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    tail = (proc.stderr or proc.stdout).strip().splitlines()[-5:]
+    return {"scenario": name, "error": " | ".join(tail) or f"exit {proc.returncode}"}
+
+
+def _print_table(results) -> None:
+    print(f"{'Szenario':<12} {'Geräte':>6} {'Unlock s':>9} {'Scan-CPU ms':>12} {'CPU ms':>8} "
+          f"{'RSS MB':>7} {'Adv':>7}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['scenario']:<12} FEHLER: {r['error']}")
+            continue
+        ttu = f"{r['time_to_unlock_s']:.2f}" if r["time_to_unlock_s"] is not None else "–"
+        print(f"{r['scenario']:<12} {r['devices']:>6} {ttu:>9} {r['scan_cpu_ms']:>12.1f} {r['cpu_ms']:>8.1f} "
+              f"{r['max_rss_kb'] / 1024.0:>7.1f} {r['advertisements']:>7}")
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="RCU-Benchmarks mit simuliertem BLE")
+    parser.add_argument("scenarios", nargs="*", help=f"Auswahl aus {', '.join(SCENARIOS)}")
+    parser.add_argument("--json", action="store_true", help="Ergebnisse als JSON ausgeben")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_child(args.child)
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+        os._exit(0)  # Hintergrund-Threads (Outbox, Prefetch) nicht abwarten
+
+    results = [run_scenario(name) for name in (args.scenarios or SCENARIOS)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results)
+    return 0 if all("error" not in r for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
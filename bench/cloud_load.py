@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench/cloud_load.py – Lasttreiber: viele virtuelle RCUs gegen den Ersatz-Server
+
+Jede virtuelle RCU durchläuft mit dem echten Client-Code (cloud/*) den
+Cloud-Teil eines Entsperr-Zyklus:
+  sync     Geräteliste bedingt abgleichen (SmartphoneSync, ETag/Delta)
+  status   Remote-Status abfragen (check_remote_mode)
+  token    Tokens aller aktiven Telefone holen (fetch_token_by_numeric_id)
+  event    'Entriegelt' in die Outbox legen (notify_rcu_event)
+  sse      Unlocked-SSE bis LOCK bzw. Remote-SSE bis EXIT (SSEClient)
+Gemessen werden Dauer und Fehler pro Phase (Perzentile), Reconnects der
+SSE-Streams sowie CPU-Zeit und Speicher pro RCU auf Client- und Serverseite.
+
+  python -m bench.cloud_load --rcus 200 --duration 60 --latency-ms 150 --error-rate 0.05 --sse-drop-rate 0.1
+  python -m bench.cloud_load --url http://127.0.0.1:8080 --rcus 20   # gegen laufenden Server
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from bench.cloud_server import add_config_arguments, rcu_ids
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ("sync", "status", "token", "event", "sse", "cycle")
+SSE_WAIT_S = 60.0
+SERVER_OPTIONS = ("rcus", "phones", "latency_ms", "jitter_ms", "error_rate", "hang_rate", "hang_s",
+                  "sse_drop_rate", "sse_heartbeat_s", "lock_after_s", "remote_rate", "churn_per_min", "seed")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _fetch_stats(url: str) -> dict:
+    with urllib.request.urlopen(f"{url}/bench/stats", timeout=5) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def start_server_process(argv: List[str]):
+    """Server als eigener Prozess, damit seine CPU-Zeit getrennt messbar bleibt."""
+    port = _free_port()
+    proc = subprocess.Popen([sys.executable, "-m", "bench.cloud_server", "--port", str(port)] + argv,
+                            cwd=ROOT, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10.0
+    while time.monotonic() < deadline:
+        try:
+            _fetch_stats(url)
+            return proc, url
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Ersatz-Server startet nicht")
+
+
+def _server_argv(args) -> List[str]:
+    """Server-Optionen aus den eigenen Argumenten (siehe add_config_arguments)."""
+    argv = []
+    for dest in SERVER_OPTIONS:
+        value = getattr(args, dest)
+        if value is not None:
+            argv += [f"--{dest.replace('_', '-')}", str(value)]
+    for spec in args.endpoint:
+        argv += ["--endpoint", spec]
+    return argv
+
+
+def _percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"n": len(ordered), "p50_ms": round(pick(0.5) * 1000.0, 1), "p95_ms": round(pick(0.95) * 1000.0, 1),
+            "p99_ms": round(pick(0.99) * 1000.0, 1), "max_ms": round(ordered[-1] * 1000.0, 1)}
+
+
+class LoadRun:
+
+    def __init__(self, rcus: List[str], duration_s: float, workers: int):
+        # Cloud-Module erst hier importieren: RCU_CLOUD_URL muss vorher gesetzt sein
+        from cloud.device_sync import SmartphoneSync
+        self.rcus = rcus
+        self.duration_s = duration_s
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load")
+        self.syncs = {rcu: SmartphoneSync(rcu_id=rcu) for rcu in rcus}
+        self.timings: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+        self.failures: Dict[str, int] = {phase: 0 for phase in PHASES}
+        self.sse_stats = {"connects": 0, "idle_timeouts": 0, "failures": 0, "events": 0, "lost": 0}
+        self.cycles = 0
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _phase(self, phase: str, coro):
+        """Misst eine Phase; Rückgabe (ok, Wert) – eine Exception zählt hier als Fehler."""
+        t0 = time.monotonic()
+        try:
+            return True, await coro
+        except Exception:
+            self.failures[phase] += 1
+            return False, None
+        finally:
+            self.timings[phase].append(time.monotonic() - t0)
+
+    async def _wait_sse(self, path: str, until: str) -> bool:
+        from cloud.sse import SSEClient
+        client = SSEClient(path)
+        try:
+            async with contextlib.aclosing(client.events()) as events:
+                async for event in events:
+                    if event.data.strip().upper() == until:
+                        return True
+            return False
+        finally:
+            for key in ("connects", "idle_timeouts", "failures", "events"):
+                self.sse_stats[key] += client.stats[key]
+
+    async def cycle(self, rcu: str) -> None:
+        from cloud.notify import notify_rcu_event
+        from cloud.remote_check import check_remote_mode
+        from cloud.token_client import fetch_token_by_numeric_id
+
+        t0 = time.monotonic()
+        sync = self.syncs[rcu]
+        ok, changed = await self._phase("sync", self._call(sync.sync))
+        if ok and changed is None:
+            self.failures["sync"] += 1  # sync() liefert None statt zu werfen
+        ok, remote = await self._phase("status", self._call(check_remote_mode, rcu))
+        if ok and not isinstance(remote, bool):
+            self.failures["status"] += 1  # check_remote_mode liefert [] statt zu werfen
+
+        if remote is True:
+            ok, seen = await self._phase("sse", asyncio.wait_for(
+                self._wait_sse(f"/api/rcu/remote/sse/{rcu}", "EXIT"), SSE_WAIT_S))
+        else:
+            phones = [p for p in sync.smartphones() if p.get("status") == "active"]
+            for phone in phones:
+                await self._phase("token", self._call(fetch_token_by_numeric_id, int(phone["id"])))
+            await self._phase("event", self._call(notify_rcu_event, rcu, "Load", "0", "Entriegelt"))
+            ok, seen = await self._phase("sse", asyncio.wait_for(
+                self._wait_sse(f"/api/rcu/sse/{rcu}", "LOCK"), SSE_WAIT_S))
+        if not (ok and seen):
+            self.sse_stats["lost"] += 1
+        self.timings["cycle"].append(time.monotonic() - t0)
+        self.cycles += 1
+
+    async def _rcu_loop(self, rcu: str, index: int, deadline: float) -> None:
+        # Start staffeln, damit nicht alle RCUs in derselben Millisekunde anfragen
+        await asyncio.sleep((index / max(1, len(self.rcus))) * min(2.0, self.duration_s / 4))
+        while time.monotonic() < deadline:
+            await self.cycle(rcu)
+
+    async def run(self) -> None:
+        deadline = time.monotonic() + self.duration_s
+        await asyncio.gather(*(self._rcu_loop(rcu, i, deadline) for i, rcu in enumerate(self.rcus)))
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Lasttest der Cloud-Anbindung mit virtuellen RCUs")
+    parser.add_argument("--url", help="Laufenden Server verwenden statt einen zu starten")
+    parser.add_argument("--duration", type=float, default=30.0, help="Laufzeit in Sekunden")
+    parser.add_argument("--workers", type=int, default=64, help="Threads für blockierende Cloud-Aufrufe")
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    parser.add_argument("--verbose", action="store_true", help="Ausgaben des Client-Codes anzeigen")
+    add_config_arguments(parser)
+    parser.set_defaults(lock_after_s=2.0)
+    args = parser.parse_args(argv)
+
+    proc = None
+    url = args.url
+    if url is None:
+        proc, url = start_server_process(_server_argv(args))
+
+    os.environ["RCU_CLOUD_URL"] = url
+    os.environ.setdefault("RCU_DATA_DIR", tempfile.mkdtemp(prefix="rcu-load-"))
+    sys.path.insert(0, ROOT)
+
+    from requests.adapters import HTTPAdapter
+    from cloud.http_client import cloud_client
+    from cloud.notify import outbox
+    # Eine echte RCU hat eine eigene Session; hier teilen sich alle virtuellen RCUs einen größeren Pool
+    cloud_client.session.mount("http://", HTTPAdapter(pool_connections=args.workers, pool_maxsize=args.workers))
+
+    rcus = rcu_ids(args.rcus)
+    server_before = _fetch_stats(url)
+    usage0 = resource.getrusage(resource.RUSAGE_SELF)
+    load = LoadRun(rcus, args.duration, args.workers)
+    sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.monotonic()
+    try:
+        with sink:
+            asyncio.run(load.run())
+            outbox.flush(timeout=5.0)
+    finally:
+        elapsed = time.monotonic() - started
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        server_after = _fetch_stats(url)
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=5)
+
+    client_cpu_ms = (usage.ru_utime - usage0.ru_utime + usage.ru_stime - usage0.ru_stime) * 1000.0
+    server_cpu_ms = server_after["cpu_ms"] - server_before["cpu_ms"]
+    result = {
+        "rcus": len(rcus),
+        "duration_s": round(elapsed, 1),
+        "cycles": load.cycles,
+        "phases": {phase: dict(_percentiles(load.timings[phase]), failures=load.failures[phase])
+                   for phase in PHASES},
+        "sse": load.sse_stats,
+        "client": {"cpu_ms_per_rcu": round(client_cpu_ms / len(rcus), 1),
+                   "cpu_ms_per_cycle": round(client_cpu_ms / max(1, load.cycles), 2),
+                   "max_rss_kb": usage.ru_maxrss,
+                   "endpoints": cloud_client.stats()},
+        "server": {"cpu_ms_per_rcu": round(server_cpu_ms / len(rcus), 1),
+                   "cpu_ms_per_cycle": round(server_cpu_ms / max(1, load.cycles), 2),
+                   "max_rss_kb": server_after["max_rss_kb"],
+                   "events": server_after["events"] - server_before["events"],
+                   "endpoints": server_after["endpoints"]},
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    print(f"{result['rcus']} RCUs, {result['cycles']} Zyklen in {result['duration_s']} s")
+    print(f"{'Phase':<8} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'Fehler':>7}")
+    for phase, p in result["phases"].items():
+        if p["n"]:
+            print(f"{phase:<8} {p['n']:>6} {p['p50_ms']:>8} {p['p95_ms']:>8} {p['p99_ms']:>8} "
+                  f"{p['max_ms']:>8} {p['failures']:>7}")
+    sse = result["sse"]
+    print(f"SSE: {sse['connects']} Verbindungen, {sse['failures']} Fehler, {sse['idle_timeouts']} Idle, "
+          f"{sse['lost']} ohne LOCK/EXIT")
+    for side in ("client", "server"):
+        r = result[side]
+        print(f"{side:<7} CPU {r['cpu_ms_per_rcu']} ms/RCU, {r['cpu_ms_per_cycle']} ms/Zyklus, "
+              f"RSS {r['max_rss_kb'] / 1024.0:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
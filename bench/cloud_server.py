@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench/cloud_server.py – Lokaler Ersatz für die Cloud (nur Standardbibliothek)
+
+Bildet alle Endpunkte nach, die die RCU benutzt:
+  GET|POST /api/rcu/{id}/smartphones   Liste, ETag/If-None-Match (304), ?since=<version> (Delta)
+  GET      /api/devices/token/{id}     {"token": "<hex>"} (deterministisch pro Gerät)
+  POST     /api/rcu/events/add|bulk    Events annehmen und zählen
+  GET      /api/rcu/status/{id}        {"status": "remote mode requested" | "idle"}
+  GET      /api/rcu/sse/{id}           SSE Unlocked-Mode (LOCK nach lock_after_s)
+  GET      /api/rcu/remote/sse/{id}    SSE Remote-Mode (UNLOCK, LOCK, EXIT)
+Steuerung für Benchmarks:
+  GET  /bench/stats                    Zähler und Antwortzeiten pro Endpunkt
+  POST /bench/rcu/{id}/push?stream=unlocked|remote&data=LOCK   Event einspeisen
+
+Fehlerinjektion (ServerConfig): Latenz + Jitter, HTTP-503-Quote, hängende
+Antworten (länger als das Client-Timeout), abgebrochene SSE-Streams,
+Flottengröße (RCUs x Telefone) und Änderungsrate der Gerätelisten.
+
+  python -m bench.cloud_server --port 8080 --rcus 500 --latency-ms 80 --error-rate 0.02
+  RCU_CLOUD_URL=http://127.0.0.1:8080 python main.py
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import resource
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+TOKEN_SECRET = b"rcu-bench"
+
+
+class ServerConfig:
+
+    def __init__(self, rcus: int = 10, phones_per_rcu: int = 3, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0, hang_rate: float = 0.0,
+                 hang_s: float = 20.0, sse_drop_rate: float = 0.0, sse_heartbeat_s: float = 5.0,
+                 lock_after_s: float = 10.0, remote_rate: float = 0.0, churn_per_min: float = 0.0,
+                 endpoints: Optional[Dict[str, dict]] = None, seed: Optional[int] = None):
+        self.rcus = rcus
+        self.phones_per_rcu = phones_per_rcu
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate          # Anteil Antworten mit 503
+        self.hang_rate = hang_rate            # Anteil Antworten, die hang_s blockieren
+        self.hang_s = hang_s
+        self.sse_drop_rate = sse_drop_rate    # Wahrscheinlichkeit pro Heartbeat, den Stream hart zu trennen
+        self.sse_heartbeat_s = sse_heartbeat_s
+        self.lock_after_s = lock_after_s      # Unlocked-SSE: LOCK nach so vielen Sekunden (0 = nie)
+        self.remote_rate = remote_rate        # Anteil RCUs, deren Status Remote-Mode anfordert
+        self.churn_per_min = churn_per_min    # Geräteänderungen pro Minute über die ganze Flotte
+        self.endpoints = endpoints or {}      # Überschreibungen pro Endpunkt, z. B. {"token": {"error_rate": 0.5}}
+        self.seed = seed
+
+    def get(self, endpoint: str, name: str):
+        return self.endpoints.get(endpoint, {}).get(name, getattr(self, name))
+
+
+def rcu_ids(count: int) -> List[str]:
+    return [f"B{i:05d}" for i in range(count)]
+
+
+def token_for(device_numeric_id: int) -> str:
+    return hashlib.sha256(TOKEN_SECRET + str(device_numeric_id).encode()).hexdigest()
+
+
+def device_id_for(device_numeric_id: int) -> str:
+    return hashlib.sha256(b"dev" + str(device_numeric_id).encode()).hexdigest()[:16]
+
+
+# ---------------------------------------------------------
+# Flotte: Gerätelisten mit Versionen und Änderungsprotokoll
+# ---------------------------------------------------------
+class Fleet:
+    LOG_MAX = 64  # so viele Versionen pro RCU als Delta auslieferbar
+
+    def __init__(self, config: ServerConfig, rng: random.Random):
+        self.rng = rng
+        self._lock = threading.Lock()
+        self._phones: Dict[str, Dict[int, dict]] = {}
+        self._version: Dict[str, int] = {}
+        self._log: Dict[str, deque] = {}  # (version, id, entry oder None)
+        next_id = 1
+        for rcu in rcu_ids(config.rcus):
+            phones = {}
+            for _ in range(config.phones_per_rcu):
+                phones[next_id] = {"id": next_id, "deviceId": device_id_for(next_id),
+                                   "name": f"Phone {next_id}", "status": "active"}
+                next_id += 1
+            self._phones[rcu] = phones
+            self._version[rcu] = 1
+            self._log[rcu] = deque(maxlen=self.LOG_MAX)
+        self._next_id = next_id
+
+    def known(self, rcu: str) -> bool:
+        return rcu in self._phones
+
+    def ensure(self, rcu: str) -> None:
+        """Unbekannte RCU-IDs (z. B. die echte RCU) bekommen eine leere Liste."""
+        with self._lock:
+            if rcu not in self._phones:
+                self._phones[rcu] = {}
+                self._version[rcu] = 1
+                self._log[rcu] = deque(maxlen=self.LOG_MAX)
+
+    def version(self, rcu: str) -> int:
+        return self._version[rcu]
+
+    def full(self, rcu: str) -> List[dict]:
+        with self._lock:
+            return [dict(p) for p in self._phones[rcu].values()]
+
+    def delta(self, rcu: str, since: int) -> Optional[dict]:
+        """Änderungen seit 'since' oder None, wenn das Protokoll nicht weit genug zurückreicht."""
+        with self._lock:
+            log = self._log[rcu]
+            current = self._version[rcu]
+            if since == current:
+                return {"version": current, "changes": [], "removed": []}
+            if since > current or not log or log[0][0] > since + 1:
+                return None
+            changes, removed = {}, []
+            for version, device_id, entry in log:
+                if version <= since:
+                    continue
+                if entry is None:
+                    changes.pop(device_id, None)
+                    removed.append(device_id)
+                else:
+                    changes[device_id] = dict(entry)
+                    if device_id in removed:
+                        removed.remove(device_id)
+            return {"version": current, "changes": list(changes.values()), "removed": removed}
+
+    def churn(self) -> None:
+        """Eine zufällige Änderung: Status umschalten, Telefon hinzufügen oder entfernen."""
+        with self._lock:
+            rcu = self.rng.choice(list(self._phones))
+            phones = self._phones[rcu]
+            action = self.rng.random()
+            if phones and action < 0.6:
+                entry = phones[self.rng.choice(list(phones))]
+                entry["status"] = "inactive" if entry["status"] == "active" else "active"
+                change = (entry["id"], dict(entry))
+            elif phones and action < 0.8:
+                device_id = self.rng.choice(list(phones))
+                del phones[device_id]
+                change = (device_id, None)
+            else:
+                device_id, self._next_id = self._next_id, self._next_id + 1
+                entry = phones[device_id] = {"id": device_id, "deviceId": device_id_for(device_id),
+                                             "name": f"Phone {device_id}", "status": "active"}
+                change = (device_id, dict(entry))
+            self._version[rcu] += 1
+            self._log[rcu].append((self._version[rcu],) + change)
+
+
+# ---------------------------------------------------------
+# Server
+# ---------------------------------------------------------
+class _Stats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, dict] = {}
+        self.events = 0
+        self.sse_open = 0
+
+    def record(self, endpoint: str, status: int, elapsed_s: float) -> None:
+        ms = elapsed_s * 1000.0
+        with self._lock:
+            s = self._data.setdefault(endpoint, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                                 "status": {}})
+            s["count"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+            s["status"][str(status)] = s["status"].get(str(status), 0) + 1
+            if status >= 500:
+                s["errors"] += 1
+
+    def add(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            endpoints = {k: dict(v, status=dict(v["status"]),
+                                 avg_ms=v["total_ms"] / v["count"] if v["count"] else 0.0)
+                         for k, v in self._data.items()}
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            return {"endpoints": endpoints, "events": self.events, "sse_open": self.sse_open,
+                    "cpu_ms": (usage.ru_utime + usage.ru_stime) * 1000.0, "max_rss_kb": usage.ru_maxrss}
+
+
+class CloudStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 512
+
+    def __init__(self, address, config: ServerConfig, verbose: bool = False):
+        super().__init__(address, _Handler)
+        self.config = config
+        self.verbose = verbose
+        self.rng = random.Random(config.seed)
+        self.rng_lock = threading.Lock()
+        self.fleet = Fleet(config, random.Random(config.seed))
+        self.stats = _Stats()
+        self.remote = {rcu for rcu in rcu_ids(config.rcus) if self.rng.random() < config.remote_rate}
+        self._pushed: Dict[tuple, deque] = {}
+        self._push_lock = threading.Condition()
+        self._closing = threading.Event()
+        self._churn_thread = None
+        if config.churn_per_min > 0:
+            self._churn_thread = threading.Thread(target=self._churn_loop, name="cloud-churn", daemon=True)
+            self._churn_thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def random(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def push(self, rcu: str, stream: str, data: str) -> None:
+        with self._push_lock:
+            self._pushed.setdefault((rcu, stream), deque()).append(data)
+            self._push_lock.notify_all()
+
+    def pop_pushed(self, rcu: str, stream: str, timeout: float) -> Optional[str]:
+        with self._push_lock:
+            queue = self._pushed.get((rcu, stream))
+            if not queue:
+                self._push_lock.wait(timeout)
+                queue = self._pushed.get((rcu, stream))
+            return queue.popleft() if queue else None
+
+    def _churn_loop(self) -> None:
+        interval = 60.0 / self.config.churn_per_min
+        while not self._closing.wait(interval):
+            self.fleet.churn()
+
+    def server_close(self) -> None:
+        self._closing.set()
+        with self._push_lock:
+            self._push_lock.notify_all()
+        super().server_close()
+
+
+_ROUTES = [
+    ("smartphones", re.compile(r"^/api/rcu/([^/]+)/smartphones$")),
+    ("token", re.compile(r"^/api/devices/token/(\d+)$")),
+    ("events", re.compile(r"^/api/rcu/events/(add|bulk)$")),
+    ("status", re.compile(r"^/api/rcu/status/([^/]+)$")),
+    ("sse_remote", re.compile(r"^/api/rcu/remote/sse/([^/]+)$")),
+    ("sse", re.compile(r"^/api/rcu/sse/([^/]+)$")),
+    ("bench_stats", re.compile(r"^/bench/stats$")),
+    ("bench_push", re.compile(r"^/bench/rcu/([^/]+)/push$")),
+]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Header und Body getrennt geschrieben: sonst ~40 ms Delayed-ACK pro Antwort
+    server: CloudStandIn
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            print(f"[CLOUD-SIM] {self.address_string()} {fmt % args}")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    # ---------------------------------------------------------
+    # Routing, Latenz und Fehler
+    # ---------------------------------------------------------
+    def _dispatch(self, method: str) -> None:
+        start = time.monotonic()
+        parts = urlsplit(self.path)
+        self.query = parse_qs(parts.query)
+        body = self._read_body()
+        for endpoint, pattern in _ROUTES:
+            match = pattern.match(parts.path)
+            if match is None:
+                continue
+            arg = unquote(match.group(1)) if match.groups() else None
+            if endpoint.startswith("bench_"):
+                status = getattr(self, f"_{endpoint}")(arg)
+            else:
+                status = self._inject(endpoint)
+                if status is None:
+                    status = getattr(self, f"_{endpoint}")(method, arg, body)
+            self.server.stats.record(endpoint, status, time.monotonic() - start)
+            return
+        self._json(404, {"error": "not found"})
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _inject(self, endpoint: str) -> Optional[int]:
+        """Latenz, hängende Antwort oder 503 – None = normal weiter."""
+        group = "sse" if endpoint.startswith("sse") else endpoint
+        cfg = self.server.config
+        delay_ms = cfg.get(group, "latency_ms")
+        jitter_ms = cfg.get(group, "jitter_ms")
+        if jitter_ms:
+            delay_ms += self.server.random() * jitter_ms
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+        if self.server.random() < cfg.get(group, "hang_rate"):
+            time.sleep(cfg.get(group, "hang_s"))  # Client läuft ins Lese-Timeout
+        if self.server.random() < cfg.get(group, "error_rate"):
+            self._json(503, {"error": "injected"})
+            return 503
+        return None
+
+    def _json(self, status: int, payload, headers: Optional[Dict[str, str]] = None) -> int:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+        return status
+
+    # ---------------------------------------------------------
+    # Cloud-Endpunkte
+    # ---------------------------------------------------------
+    def _smartphones(self, method: str, rcu: str, body: bytes) -> int:
+        fleet = self.server.fleet
+        fleet.ensure(rcu)
+        version = fleet.version(rcu)
+        etag = f'"{rcu}-{version}"'
+        headers = {"ETag": etag, "X-Version": str(version)}
+        if self.headers.get("If-None-Match") == etag:
+            return self._json(304, None, headers)
+        since = self.query.get("since", [None])[0]
+        if since is not None and since.isdigit():
+            delta = fleet.delta(rcu, int(since))
+            if delta is not None:
+                return self._json(200, delta, headers)
+        return self._json(200, fleet.full(rcu), headers)
+
+    def _token(self, method: str, device_numeric_id: str, body: bytes) -> int:
+        return self._json(200, {"token": token_for(int(device_numeric_id))})
+
+    def _events(self, method: str, kind: str, body: bytes) -> int:
+        if method != "POST":
+            return self._json(405, {"error": "POST only"})
+        try:
+            payload = json.loads(body.decode("utf-8") or "null")
+        except ValueError:
+            return self._json(400, {"error": "invalid json"})
+        self.server.stats.add("events", len(payload) if isinstance(payload, list) else 1)
+        return self._json(200, {"ok": True})
+
+    def _status(self, method: str, rcu: str, body: bytes) -> int:
+        status = "remote mode requested" if rcu in self.server.remote else "idle"
+        return self._json(200, {"status": status})
+
+    def _sse(self, method: str, rcu: str, body: bytes) -> int:
+        lock_after = self.server.config.lock_after_s
+        script = [(lock_after, "LOCK")] if lock_after > 0 else []
+        return self._stream(rcu, "unlocked", script)
+
+    def _sse_remote(self, method: str, rcu: str, body: bytes) -> int:
+        lock_after = self.server.config.lock_after_s
+        script = [(lock_after / 3, "UNLOCK"), (2 * lock_after / 3, "LOCK"), (lock_after, "EXIT")] \
+            if lock_after > 0 else []
+        return self._stream(rcu, "remote", script)
+
+    def _stream(self, rcu: str, stream: str, script) -> int:
+        """
+        text/event-stream ohne Content-Length, Ende durch Schließen der Verbindung.
+        Heartbeats als Kommentar; ein Resume per Last-Event-ID überspringt bereits
+        gesendete Skript-Events.
+        """
+        cfg = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self.server.stats.add("sse_open")
+
+        last_id = self.headers.get("Last-Event-ID")
+        sent = int(last_id) if last_id and last_id.isdigit() else 0
+        opened = time.monotonic()
+        try:
+            self.wfile.write(b"retry: 1000\n\n")
+            self.wfile.flush()
+            while not self.server._closing.is_set():
+                elapsed = time.monotonic() - opened
+                if sent < len(script) and elapsed >= script[sent][0]:
+                    data = script[sent][1]
+                    sent += 1
+                    self.wfile.write(f"id: {sent}\ndata: {data}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    continue
+                wait = cfg.sse_heartbeat_s
+                if sent < len(script):
+                    wait = min(wait, max(0.0, script[sent][0] - elapsed))
+                pushed = self.server.pop_pushed(rcu, stream, wait)
+                if pushed is not None:
+                    self.wfile.write(f"data: {pushed}\n\n".encode("utf-8"))
+                elif self.server.random() < cfg.sse_drop_rate:
+                    return 200  # Stream hart abbrechen (Client muss mit Last-Event-ID fortsetzen)
+                else:
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client hat getrennt
+        finally:
+            self.server.stats.add("sse_open", -1)
+        return 200
+
+    # ---------------------------------------------------------
+    # Benchmark-Steuerung
+    # ---------------------------------------------------------
+    def _bench_stats(self, arg) -> int:
+        return self._json(200, self.server.stats.snapshot())
+
+    def _bench_push(self, rcu: str) -> int:
+        stream = self.query.get("stream", ["unlocked"])[0]
+        data = self.query.get("data", ["LOCK"])[0]
+        self.server.push(rcu, stream, data)
+        return self._json(200, {"ok": True})
+
+
+def start_server(config: ServerConfig, host: str = "127.0.0.1", port: int = 0,
+                 verbose: bool = False) -> CloudStandIn:
+    """Startet den Server in einem Hintergrund-Thread (port=0 -> freier Port)."""
+    server = CloudStandIn((host, port), config, verbose=verbose)
+    threading.Thread(target=server.serve_forever, name="cloud-standin", daemon=True).start()
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--rcus", type=int, default=10, help="Anzahl RCUs in der Flotte")
+    parser.add_argument("--phones", type=int, default=3, help="Telefone pro RCU")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Anteil 503-Antworten")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Anteil hängender Antworten")
+    parser.add_argument("--hang-s", type=float, default=20.0)
+    parser.add_argument("--sse-drop-rate", type=float, default=0.0, help="Abbruchwahrscheinlichkeit pro Heartbeat")
+    parser.add_argument("--sse-heartbeat-s", type=float, default=5.0)
+    parser.add_argument("--lock-after-s", type=float, default=10.0)
+    parser.add_argument("--remote-rate", type=float, default=0.0, help="Anteil RCUs im Remote-Mode")
+    parser.add_argument("--churn-per-min", type=float, default=0.0)
+    parser.add_argument("--endpoint", action="append", default=[], metavar="NAME:KEY=VALUE",
+                        help="Überschreibung pro Endpunkt, z. B. token:error_rate=0.5")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args) -> ServerConfig:
+    endpoints: Dict[str, dict] = {}
+    for spec in args.endpoint:
+        name, _, assignment = spec.partition(":")
+        key, _, value = assignment.partition("=")
+        endpoints.setdefault(name, {})[key] = float(value)
+    return ServerConfig(rcus=args.rcus, phones_per_rcu=args.phones, latency_ms=args.latency_ms,
+                        jitter_ms=args.jitter_ms, error_rate=args.error_rate, hang_rate=args.hang_rate,
+                        hang_s=args.hang_s, sse_drop_rate=args.sse_drop_rate,
+                        sse_heartbeat_s=args.sse_heartbeat_s, lock_after_s=args.lock_after_s,
+                        remote_rate=args.remote_rate, churn_per_min=args.churn_per_min,
+                        endpoints=endpoints, seed=args.seed)
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Lokaler Ersatz-Server für die RCU-Cloud")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--verbose", action="store_true")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = CloudStandIn((args.host, args.port), config_from_args(args), verbose=args.verbose)
+    print(f"[CLOUD-SIM] Lausche auf {server.url} ({args.rcus} RCUs x {args.phones} Telefone, "
+          f"z. B. {rcu_ids(1)[0] if args.rcus else '-'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/adapters.py – Aufteilung der Bluetooth-Adapter nach Aufgabe
+Mit zwei Controllern scannt einer dauerhaft (Anwesenheitstabelle), der andere
+übernimmt GATT-Verbindungen und das Advertising im Unlocked-Mode – Scan und
+Connect konkurrieren dann nicht mehr um dieselbe Funkzeit. Mit nur einem
+Controller macht dieser alles (bisheriges Verhalten).
+Kennt der Connect-Adapter ein Telefon noch nicht, wird über den Scan-Adapter
+verbunden statt dort erst zu scannen (siehe ConnectionManager._target).
+Überschreibbar per RCU_SCAN_ADAPTER / RCU_CONNECT_ADAPTER.
+"""
+
+import os
+import re
+from typing import List, Optional
+
+SYSFS_BLUETOOTH = "/sys/class/bluetooth"
+DEFAULT_ADAPTER = "hci0"
+
+_HCI_RE = re.compile(r"^hci(\d+)$")
+
+
+def discover_adapters() -> List[str]:
+    """Vorhandene Controller (hci0, hci1, ...) aus sysfs, nach Index sortiert."""
+    try:
+        names = os.listdir(SYSFS_BLUETOOTH)
+    except OSError:
+        return []
+    # Einträge wie 'hci0:64' sind Verbindungen, keine Adapter
+    found = [(int(m.group(1)), name) for name in names for m in [_HCI_RE.match(name)] if m]
+    return [name for _, name in sorted(found)]
+
+
+class AdapterPool:
+
+    def __init__(self):
+        self._scan: Optional[str] = None
+        self._connect: Optional[str] = None
+
+    def _resolve(self) -> None:
+        adapters = discover_adapters()
+        scan = os.getenv("RCU_SCAN_ADAPTER")
+        connect = os.getenv("RCU_CONNECT_ADAPTER")
+        if scan is None:
+            scan = adapters[0] if adapters else DEFAULT_ADAPTER
+        if connect is None:
+            others = [a for a in adapters if a != scan]
+            connect = others[0] if others else scan
+        self._scan, self._connect = scan, connect
+        if scan != connect:
+            print(f"[BLE] Adapter: Scan auf {scan}, Verbindungen/Advertising auf {connect}.")
+        else:
+            print(f"[BLE] Adapter: nur {scan} – Scan, Verbindungen und Advertising gemeinsam.")
+
+    @property
+    def scan(self) -> str:
+        if self._scan is None:
+            self._resolve()
+        return self._scan
+
+    @property
+    def connect(self) -> str:
+        if self._connect is None:
+            self._resolve()
+        return self._connect
+
+    @property
+    def advertise(self) -> str:
+        return self.connect
+
+    @property
+    def dedicated(self) -> bool:
+        """True, wenn Scannen und Verbinden auf getrennten Controllern laufen."""
+        return self.scan != self.connect
+
+    def in_use(self) -> List[str]:
+        return [self.scan] if not self.dedicated else [self.scan, self.connect]
+
+    def fallback(self, failed: str) -> None:
+        """Adapter ausgefallen -> alle Aufgaben auf den verbleibenden legen."""
+        if not self.dedicated or failed not in self.in_use():
+            return
+        remaining = self.connect if failed == self.scan else self.scan
+        print(f"[BLE] Adapter {failed} ausgefallen – weiter nur mit {remaining}.")
+        self._scan = self._connect = remaining
+
+    @staticmethod
+    def path(adapter: str) -> str:
+        return f"/org/bluez/{adapter}"
+
+
+adapter_pool = AdapterPool()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/auth_scheduler.py – Parallele Authentifizierung mehrerer Telefone
+Kommen mehrere Bediener gleichzeitig an die Maschine, wird nicht mehr ein
+Telefon pro Main-Loop-Durchlauf bedient: bis zu MAX_CONNECTION_SLOTS
+Sitzungen (Challenge-Response + Warten auf die Entsperr-Schwelle) laufen
+gleichzeitig. Freie Slots gehen an den Kandidaten mit dem aktuell höchsten
+RSSI. Sobald ein Telefon gewinnt, werden die übrigen Sitzungen abgebrochen
+und deren Links getrennt.
+"""
+
+import asyncio
+import contextlib
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from ble.connection import MAX_CONNECTION_SLOTS, connection_manager
+from ble.presence import presence
+from telemetry.tracing import span
+
+Candidate = Tuple[object, str, Optional[int]]  # (device, deviceId-Hex, RSSI beim Scan)
+
+
+class AuthScheduler:
+
+    def __init__(self, max_slots: int = MAX_CONNECTION_SLOTS):
+        self.max_slots = max(1, max_slots)
+        self.stats = {"runs": 0, "sessions": 0, "cancelled": 0, "wins": 0}
+
+    @staticmethod
+    def _priority(candidate: Candidate) -> int:
+        # Aktueller RSSI aus dem Dauer-Scanner, sonst der Wert vom Scan
+        rssi = presence.rssi(candidate[0].address)
+        if rssi is None:
+            rssi = candidate[2]
+        return rssi if rssi is not None else -999
+
+    async def run(self, candidates: List[Candidate],
+                  attempt: Callable[[Candidate], Awaitable[object]]) -> Optional[Tuple[Candidate, object]]:
+        """
+        Führt 'attempt' für die Kandidaten aus, höchstens max_slots gleichzeitig.
+        attempt(candidate) liefert einen wahren Wert, wenn das Telefon gewonnen
+        hat (authentifiziert und nah genug), sonst einen falschen.
+        Rückgabe: (candidate, ergebnis) des Gewinners oder None.
+        """
+        pending = list(candidates)
+        if not pending:
+            return None
+        self.stats["runs"] += 1
+        loop = asyncio.get_running_loop()
+        winner = loop.create_future()
+        fatal = []  # SystemExit o. ä. aus einer Sitzung – nach dem Aufräumen weiterreichen
+
+        async def worker():
+            while pending and not winner.done():
+                # Slot frei -> stärksten verbleibenden Kandidaten wählen
+                candidate = max(pending, key=self._priority)
+                pending.remove(candidate)
+                self.stats["sessions"] += 1
+                try:
+                    result = await attempt(candidate)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[AUTH] Sitzung mit {candidate[0].address} fehlgeschlagen: {e}")
+                    result = None
+                except BaseException as e:
+                    fatal.append(e)
+                    if not winner.done():
+                        winner.cancel()
+                    return
+                if result and not winner.done():
+                    winner.set_result((candidate, result))
+                    return
+
+        slots = min(self.max_slots, len(pending))
+        print(f"[AUTH] {len(pending)} Kandidaten, {slots} Verbindungs-Slots.")
+        with span("auth_scheduler", candidates=len(pending), slots=slots) as s:
+            workers = [asyncio.ensure_future(worker()) for _ in range(slots)]
+            all_done = asyncio.gather(*workers, return_exceptions=True)
+            try:
+                await asyncio.wait({winner, all_done}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not winner.done():
+                    winner.cancel()
+                for task in workers:
+                    if not task.done():
+                        task.cancel()
+                        self.stats["cancelled"] += 1
+                with contextlib.suppress(asyncio.CancelledError):
+                    await all_done
+
+            if fatal:
+                s.fail()
+                await connection_manager.release()
+                raise fatal[0]
+
+            if not winner.cancelled():
+                candidate, result = winner.result()
+                self.stats["wins"] += 1
+                s.set(winner=candidate[0].address)
+                # Verlierer-Links freigeben, der Gewinner-Link bleibt für RSSI/Unlock offen
+                await connection_manager.release_others(candidate[0].address)
+                return candidate, result
+
+            s.fail()
+            await connection_manager.release()
+            return None
+
+
+auth_scheduler = AuthScheduler()
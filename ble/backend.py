@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/backend.py – Austauschbares BLE-Backend
+presence (Scanner), connection (Client) und recovery (Adapter-Reset) holen
+ihre Klassen hier statt direkt aus bleak. Standard ist bleak/BlueZ; mit
+RCU_BLE_BACKEND=sim bzw. use_backend(...) läuft alles gegen den In-Process-
+Simulator aus ble/simulator.py (Benchmarks, Entwicklung ohne Telefon/BlueZ).
+"""
+
+import copy
+import os
+
+
+class BleakBackend:
+    """Echte Hardware über bleak (BlueZ/D-Bus). bleak wird erst bei Bedarf importiert."""
+    name = "bleak"
+
+    @property
+    def Scanner(self):
+        from bleak import BleakScanner
+        return BleakScanner
+
+    @property
+    def Client(self):
+        from bleak import BleakClient
+        return BleakClient
+
+    def __init__(self):
+        self._bus = None
+
+    async def resolve_device(self, device, adapter: str):
+        """
+        'device' (BLEDevice eines anderen Adapters) als Gerät von 'adapter', falls
+        BlueZ dort bereits ein Device1-Objekt hat – dann verbindet bleak direkt,
+        ohne vorher auf 'adapter' nach der Adresse zu scannen. Sonst None.
+        """
+        from dbus_fast import BusType
+        from dbus_fast.aio import MessageBus
+        path = f"/org/bluez/{adapter}/dev_{device.address.upper().replace(':', '_')}"
+        if self._bus is None or not self._bus.connected:
+            self._bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+        intro = await self._bus.introspect("org.bluez", path)
+        if not any(i.name == "org.bluez.Device1" for i in intro.interfaces):
+            return None
+        resolved = copy.copy(device)
+        resolved.details = dict(device.details, path=path)
+        return resolved
+
+    # Kein reset_adapter: ble/recovery.py schaltet den Adapter direkt über D-Bus.
+
+
+_backend = None
+
+
+def use_backend(impl) -> None:
+    """Backend setzen (vor dem ersten Scan/Connect)."""
+    global _backend
+    _backend = impl
+    print(f"[BLE] Backend: {impl.name}")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if os.getenv("RCU_BLE_BACKEND", "bleak") == "sim":
+            from ble.simulator import default_simulator
+            use_backend(default_simulator())
+        else:
+            _backend = BleakBackend()
+    return _backend
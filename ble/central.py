@@ -7,158 +7,143 @@ und liefert die Treffer an main.py zurück (main steuert Connect/Challenge).
 """
 
 import asyncio
-import contextlib
-from bleak import BleakScanner, BleakClient
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-# ---------------------------------------------------------
-# Zielparameter aus Cloud laden (Device-ID des Smartphones)
-# ---------------------------------------------------------
-TARGET_DEVICE_BYTES_LIST = []
+from ble.matcher import AdvertisementMatcher
+from ble.presence import presence, ensure_scanning
+from telemetry import log
 
 # Gesuchter Manufacturer Identifier (16-bit Company ID)
 TARGET_MANUFACTURER_ID = 0xFFFF
 
+# Nur Einträge berücksichtigen, die in den letzten Sekunden advertised haben
+PRESENCE_FRESH = 3.0
 
+# Wartezeit nach dem ersten Treffer auf weitere Telefone (Mehrfach-Authentifizierung)
+CANDIDATE_GRACE = 1.0
 
-async def find_best_authorized_device(devices_authorized: List[bytes], timeout: int = 10):
+# Position der deviceId im Manufacturer-Payload (None = unbekannt -> Aho-Corasick)
+DEVICE_ID_OFFSET: Optional[int] = None
+
+_matcher: Optional[AdvertisementMatcher] = None
+_matcher_key: Tuple[bytes, ...] = ()
+MATCH_CACHE_MAX = 4096
+_match_cache: Dict[str, Tuple[bytes, Optional[bytes]]] = {}  # address -> (payload, treffer)
+
+
+
+def _compile_matcher(devices_authorized: List[bytes]) -> AdvertisementMatcher:
+    """Baut den Matcher nur neu, wenn sich die Liste autorisierter IDs geändert hat."""
+    global _matcher, _matcher_key
+    # registry.device_ids liefert pro Snapshot dasselbe Tupel -> Identitätsvergleich genügt meist
+    key = devices_authorized if isinstance(devices_authorized, tuple) else tuple(devices_authorized)
+    if _matcher is None or (key is not _matcher_key and key != _matcher_key):
+        _matcher = AdvertisementMatcher(key, offset=DEVICE_ID_OFFSET)
+        _matcher_key = key
+        _match_cache.clear()
+    return _matcher
+
+
+def _match_entry(matcher: AdvertisementMatcher, entry) -> Optional[bytes]:
+    """Matcht ein Advertisement genau einmal pro neuem Payload (Cache pro Adresse)."""
+    payload = entry.manufacturer_data.get(TARGET_MANUFACTURER_ID)
+    if payload is None:
+        return None
+    cached = _match_cache.get(entry.address)
+    if cached is not None and cached[0] == payload:
+        return cached[1]
+    matched = matcher.match(payload)
+    if len(_match_cache) >= MATCH_CACHE_MAX:
+        _match_cache.clear()  # rotierende Privatadressen begrenzen
+    _match_cache[entry.address] = (payload, matched)
+    return matched
+
+
+async def _collect_hits(devices_authorized: List[bytes], timeout: float, grace: Optional[float]):
     """
-    Scannt BLE-Geräte über 'timeout' Sekunden und wählt das autorisierte Gerät
-    mit dem höchsten RSSI aus.
-    Rückgabe: (selected_device, matched_device_id_hex, scanner)
-              oder (None, None, None) bei keinem Treffer.
+    Sammelt autorisierte Treffer aus dem Dauer-Scanner.
+    grace=None: volles Zeitfenster abwarten; sonst nach dem ersten Treffer nur
+    noch 'grace' Sekunden (0 = sofort zurück).
+    Rückgabe: Liste (entry, matched_bytes) der am Ende noch advertisenden Treffer.
     """
-    print(f"[BLE] Scanning {timeout}s nach autorisierten Geräten ({len(devices_authorized)} known)...")
-    scanner = BleakScanner(adapter="hci0")
-    await scanner.start()
+    await ensure_scanning()
+    matcher = _compile_matcher(devices_authorized)
 
-    authorized_hits = []  # (device, rssi, matched_bytes)
+    authorized_hits = {}  # address -> (entry, matched_bytes)
     printed = set()
-
+    first_hit = asyncio.Event()
+
+    def on_advertisement(entry):
+        mdata = entry.manufacturer_data
+        if not mdata:
+            return
+
+        # Einmaliges Logging aller gefundenen Geräte (Debug, formatiert im Log-Thread)
+        if entry.address not in printed:
+            for comp_id, payload in mdata.items():
+                log.ble.debug("%s (%s) → CompanyID: 0x%04X", entry.name or "N/A", entry.address, comp_id,
+                              data=bytes(payload))
+            printed.add(entry.address)
+
+        # Matching autorisierter Devices
+        matched = _match_entry(matcher, entry)
+        if matched is None:
+            authorized_hits.pop(entry.address, None)
+            return
+        if entry.address not in authorized_hits:
+            log.ble.info("Autorisiertes Gerät erkannt: %s (%s)", entry.name or "N/A", entry.address,
+                         rssi=entry.rssi, key=entry.address, every=5.0)
+        authorized_hits[entry.address] = (entry, matched)
+        first_hit.set()
+
+    presence.add_listener(on_advertisement)
     try:
-        end_time = asyncio.get_event_loop().time() + timeout
-
-        # Wenn nur ein autorisiertes Gerät übergeben wurde
-        single_mode = len(devices_authorized) == 1
-        if single_mode:
-            print("[BLE] Nur ein autorisiertes Gerät vorhanden → Auswahl erfolgt beim ersten Treffer ohne RSSI-Vergleich.")
-
-
-        while asyncio.get_event_loop().time() < end_time:
-            await asyncio.sleep(0.4)
-
-            for d in await scanner.get_discovered_devices():
-                mdata = d.metadata.get("manufacturer_data", {})
-                if not mdata:
-                    continue
-
-                # Einmaliges Logging aller gefundenen Geräte
-                if d.address not in printed:
-                    name = d.name or "N/A"
-                    for comp_id, payload in mdata.items():
-                        try:
-                            payload_hex = payload.hex()
-                        except Exception:
-                            payload_hex = str(payload)
-                        print(f"{name} ({d.address}) → CompanyID: 0x{comp_id:04X}, Data: {payload_hex}")
-                    printed.add(d.address)
-
-                # Matching autorisierter Devices
-                for comp_id, payload in mdata.items():
-                    if comp_id != TARGET_MANUFACTURER_ID:
-                        continue
-                    for target_bytes in devices_authorized:
-                        if target_bytes in payload:
-                            if single_mode:
-                                matched_hex = target_bytes.hex()
-                                print(f"[BLE] → Autorisiertes Gerät erkannt: {d.name or 'N/A'} "
-                                      f"({d.address}) deviceId={matched_hex} (Single-Mode)")
-                                return d, matched_hex, scanner  # Direkt zurückgeben
-                            else:
-                                authorized_hits.append((d, d.rssi, target_bytes))
-                                print(f"[BLE] Autorisiertes Gerät erkannt: {d.name or 'N/A'} ({d.address}) RSSI={d.rssi}")
-                            break
-
-        if not authorized_hits:
-            print("[BLE] Kein autorisiertes Gerät innerhalb des Zeitfensters gefunden.")
-            await scanner.stop()
-            return None, None, None
-
-        # Gerät mit höchstem RSSI auswählen
-        selected_device, best_rssi, matched_bytes = max(authorized_hits, key=lambda x: x[1])
-        matched_hex = matched_bytes.hex()
-        print(f"[BLE] → Ausgewählt: {selected_device.name or 'N/A'} "
-              f"({selected_device.address}) mit RSSI={best_rssi} dBm "
-              f"und deviceId={matched_hex}")
-
-        # Scanner aktiv lassen (Challenge läuft danach)
-        return selected_device, matched_hex, scanner
+        # Bereits bekannte, aktuell advertisende Geräte einmalig übernehmen
+        for entry in presence.entries(max_age=PRESENCE_FRESH):
+            on_advertisement(entry)
+
+        if grace is None:
+            await asyncio.sleep(timeout)
+        else:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            try:
+                await asyncio.wait_for(first_hit.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            if grace > 0 and authorized_hits:
+                await asyncio.sleep(max(0.0, min(grace, deadline - loop.time())))
+
+        # Nur Treffer berücksichtigen, die am Ende des Fensters noch advertisen
+        return [(e, m) for e, m in authorized_hits.values() if e.age() <= PRESENCE_FRESH]
 
     except Exception as e:
         print(f"[BLE] Fehler beim Scan: {e}")
-        with contextlib.suppress(Exception):
-            await scanner.stop()
         raise
+    finally:
+        presence.remove_listener(on_advertisement)
 
 
+def _rssi_key(hit) -> int:
+    return hit[0].rssi if hit[0].rssi is not None else -999
 
 
-
-
-
-"""
-async def find_target_device_keep_scanning(timeout: int = 10):
-    
-    print(f"Scanning for BLE devices for {timeout} s (Scanner bleibt aktiv) ...")
-    scanner = BleakScanner(adapter="hci0")
-    await scanner.start()
-
-    selected = None
-    try:
-        end = asyncio.get_event_loop().time() + timeout
-        printed = set()
-
-        while asyncio.get_event_loop().time() < end and selected is None:
-            await asyncio.sleep(0.4)
-            for d in await scanner.get_discovered_devices():
-                # Einmaliges Logging
-                if d.address not in printed:
-                    name = d.name or "N/A"
-                    mdata = d.metadata.get("manufacturer_data", {})
-                    if mdata:
-                        for comp_id, payload in mdata.items():
-                            try:
-                                payload_hex = payload.hex()
-                            except Exception:
-                                payload_hex = str(payload)
-                            print(f"{name} ({d.address}) → CompanyID: 0x{comp_id:04X}, Data: {payload_hex}")
-                    printed.add(d.address)
-
-                # Matching
-                mdata = d.metadata.get("manufacturer_data", {})
-                if not mdata:
-                    continue
-                for comp_id, payload in mdata.items():
-                    if comp_id != TARGET_MANUFACTURER_ID:
-                        continue
-                    if TARGET_DEVICE_BYTES is None:
-                        continue
-                    if TARGET_DEVICE_BYTES in payload:
-                        print(f"Matching device gefunden: {d.name or 'N/A'} ({d.address})")
-                        selected = d
-                        break
-                if selected:
-                    break
-
-        if selected is None:
-            await scanner.stop()
-            return None, None
-
-        # Scanner absichtlich NICHT stoppen – Aufrufer macht das später.
-        return selected, scanner
-
-    except Exception:
-        with contextlib.suppress(Exception):
-            await scanner.stop()
-        raise
-"""
\ No newline at end of file
+async def find_authorized_candidates(devices_authorized: List[bytes], timeout: int = 10,
+                                     grace: float = CANDIDATE_GRACE):
+    """
+    Wertet die Advertisements des Dauer-Scanners aus (Matching im
+    detection_callback, einmal pro neuem Advertisement) und liefert alle
+    autorisierten Geräte absteigend nach RSSI – für parallele
+    Authentifizierung mehrerer Telefone.
+    Nach dem ersten Treffer wird nur noch 'grace' Sekunden auf weitere gewartet.
+    Rückgabe: Liste (device, matched_device_id_hex, rssi), ggf. leer.
+    """
+    print(f"[BLE] Scanning bis {timeout}s nach autorisierten Geräten ({len(devices_authorized)} known)...")
+    hits = await _collect_hits(devices_authorized, timeout, grace=grace)
+    hits.sort(key=_rssi_key, reverse=True)
+    if not hits:
+        print("[BLE] Kein autorisiertes Gerät innerhalb des Zeitfensters gefunden.")
+    else:
+        print(f"[BLE] → {len(hits)} Kandidaten: "
+              + ", ".join(f"{e.address} ({e.rssi} dBm)" for e, _ in hits))
+    return [(e.device, m.hex(), e.rssi) for e, m in hits]
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/connection.py – Verwaltung der GATT-Verbindungen zu den Smartphones
+Die nach der Challenge-Response aufgebaute Verbindung bleibt offen: RSSI wird
+direkt über den Link gelesen und der Entsperr-Status auf demselben Link
+geschrieben. Neu verbunden wird nur, wenn der Link abgerissen ist. Mehrere
+Telefone können gleichzeitig verbunden sein (ein Link pro Adresse).
+"""
+
+import asyncio
+import contextlib
+import re
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ble.adapters import adapter_pool
+from ble.backend import get_backend
+from ble.presence import presence
+from telemetry.tracing import span
+
+CONNECT_TIMEOUT = 15.0
+RECONNECT_TIMEOUT = 10.0
+MAX_CONNECTION_SLOTS = 3    # gleichzeitige LE-Verbindungen (Controller/BlueZ-Limit)
+CONN_INFO_MIN_INTERVAL = 1.0  # s, höchstens ein btmgmt-Prozess pro Adresse und Intervall
+PRESENCE_RSSI_MAX_AGE = 1.5   # s, älterer Advertising-RSSI taugt nicht als Messwert
+
+_RSSI_RE = re.compile(r"RSSI\s+(-?\d+)")
+
+
+class _Link:
+    __slots__ = ("client", "device", "adapter", "lock")
+
+    def __init__(self):
+        self.client = None
+        self.device = None
+        self.adapter = None
+        self.lock = asyncio.Lock()
+
+
+class ConnectionManager:
+    """
+    Hält die offenen BleakClients der authentifizierten bzw. gerade
+    authentifizierenden Telefone (ein Link pro Adresse, höchstens
+    MAX_CONNECTION_SLOTS gleichzeitig – die Begrenzung übernimmt der Aufrufer,
+    siehe ble/auth_scheduler.py).
+    """
+
+    def __init__(self, adapter: Optional[str] = None, max_links: int = MAX_CONNECTION_SLOTS):
+        self._adapter = adapter
+        self.max_links = max_links
+        self._links: Dict[str, _Link] = {}
+        self._btmgmt = shutil.which("btmgmt")
+        self._conn_info: Dict[str, Tuple[float, Optional[int]]] = {}  # address -> (monotonic, RSSI)
+
+    @property
+    def adapter(self) -> str:
+        """Fest vorgegebener Adapter oder der Connect-Adapter des Pools."""
+        return self._adapter or adapter_pool.connect
+
+    # ---------------------------------------------------------
+    # Verbindung
+    # ---------------------------------------------------------
+    async def _target(self, device):
+        """
+        Ziel und Adapter für den Connect. Ein BLEDevice des Scan-Adapters kann
+        BlueZ nicht über den Connect-Adapter verbinden; per Adresse würde bleak
+        dort aber erst einen Discovery-Scan starten (kostet Sekunden). Daher:
+          - kennt der Connect-Adapter das Gerät schon -> dessen Device1-Objekt
+          - sonst über den Adapter verbinden, der das Gerät gesehen hat
+        Rückgabe: (Ziel, Adapter, Art) – Art für die Connect-Zeitmessung.
+        """
+        if isinstance(device, str):
+            return device, self.adapter, "address"
+        details = getattr(device, "details", None)
+        path = details.get("path", "") if isinstance(details, dict) else ""
+        if not path or path.startswith(adapter_pool.path(self.adapter) + "/"):
+            return device, self.adapter, "device"
+        resolve = getattr(get_backend(), "resolve_device", None)
+        if resolve is not None:
+            try:
+                resolved = await resolve(device, self.adapter)
+            except Exception as e:
+                resolved = None
+                print(f"[BLE] Gerät {device.address} auf {self.adapter} nicht auflösbar: {e}")
+            if resolved is not None:
+                return resolved, self.adapter, "resolved"
+        return device, path.split("/")[3], "scan_adapter"  # /org/bluez/<hciX>/dev_...
+
+    def _link(self, address: str) -> _Link:
+        key = address.lower()
+        link = self._links.get(key)
+        if link is None:
+            link = self._links[key] = _Link()
+        return link
+
+    def addresses(self) -> List[str]:
+        """Adressen mit aktuell verbundenem Link."""
+        return [a for a, link in self._links.items() if link.client is not None and link.client.is_connected]
+
+    def is_connected(self, address: Optional[str] = None) -> bool:
+        if address is None:
+            return bool(self.addresses())
+        link = self._links.get(address.lower())
+        return link is not None and link.client is not None and link.client.is_connected
+
+    async def connect(self, device, timeout: float = CONNECT_TIMEOUT, use_cache: bool = False):
+        """
+        Verbindet zu 'device' (BLEDevice oder Adresse) oder liefert den bestehenden Link.
+        use_cache: bekanntes Gerät (ble/gatt_cache.py) – Services aus dem BlueZ-Cache
+        übernehmen, statt auf die Service-Suche zu warten.
+        """
+        address = device if isinstance(device, str) else device.address
+        link = self._link(address)
+        async with link.lock:
+            if link.client is not None and link.client.is_connected:
+                return link.client
+            await self._disconnect(link)
+
+            target, adapter, kind = await self._target(device)
+            with span("ble_connect", adapter=adapter, target=kind, split=adapter_pool.dedicated,
+                      cached=use_cache):
+                client = get_backend().Client(target, timeout=timeout, adapter=adapter,
+                                              disconnected_callback=self._on_disconnect)
+                if use_cache:
+                    await client.connect(dangerous_use_bleak_cache=True)
+                else:
+                    await client.connect()
+            link.client = client
+            link.adapter = adapter
+            if not isinstance(device, str):
+                link.device = device
+            return client
+
+    async def ensure(self, address: str, timeout: float = RECONNECT_TIMEOUT):
+        """Bestehenden Link zu 'address' liefern, sonst neu verbinden."""
+        if self.is_connected(address):
+            return self._links[address.lower()].client
+        print(f"[BLE] Link zu {address} nicht verbunden – verbinde neu.")
+        link = self._links.get(address.lower())
+        device = link.device if link is not None else None
+        entry = presence.get(address)
+        if entry is not None and entry.device is not None:
+            device = entry.device
+        return await self.connect(device or address, timeout=timeout)
+
+    async def release(self, address: Optional[str] = None) -> None:
+        """Trennt den Link zu 'address' (ohne Adresse: alle Links)."""
+        keys = [address.lower()] if address is not None else list(self._links)
+        for key in keys:
+            link = self._links.pop(key, None)
+            self._conn_info.pop(key, None)
+            if link is not None:
+                async with link.lock:
+                    await self._disconnect(link)
+
+    async def release_others(self, address: str) -> None:
+        """Trennt alle Links außer dem zu 'address' (Verlierer nach der Auswahl)."""
+        for key in [k for k in self._links if k != address.lower()]:
+            await self.release(key)
+
+    async def _disconnect(self, link: _Link) -> None:
+        client, link.client = link.client, None
+        if client is not None:
+            with contextlib.suppress(Exception):
+                await client.disconnect()
+
+    def _on_disconnect(self, client) -> None:
+        for address, link in self._links.items():
+            if link.client is client:
+                print(f"[BLE] Verbindung zu {address} getrennt.")
+                link.client = None
+                return
+
+    # ---------------------------------------------------------
+    # Operationen auf dem Link
+    # ---------------------------------------------------------
+    async def write(self, address: str, char_uuid: str, payload: bytes) -> bool:
+        """Schreibt auf dem bestehenden Link (bei Abriss: ein Reconnect)."""
+        for attempt in (1, 2):
+            try:
+                client = await self.ensure(address)
+                await client.write_gatt_char(char_uuid, payload)
+                return True
+            except Exception as e:
+                print(f"[BLE] Schreiben an {address} fehlgeschlagen (Versuch {attempt}): {e}")
+                link = self._link(address)
+                async with link.lock:
+                    await self._disconnect(link)
+        return False
+
+    async def read_rssi(self, address: str) -> Optional[int]:
+        """
+        RSSI des verbundenen Links in dBm.
+        BlueZ stellt den Verbindungs-RSSI nicht über D-Bus bereit; gelesen wird
+        über mgmt 'Get Connection Information' (btmgmt conn-info), pro Adresse
+        höchstens alle CONN_INFO_MIN_INTERVAL s (sonst der letzte Wert). Ohne Link
+        oder ohne btmgmt -> Advertising-RSSI aus der Anwesenheitstabelle, sofern
+        nicht älter als PRESENCE_RSSI_MAX_AGE.
+        Clients mit eigener get_rssi() (Simulator) werden direkt gefragt.
+        """
+        link = self._links.get(address.lower())
+        get_rssi = getattr(link.client, "get_rssi", None) if link is not None else None
+        if get_rssi is not None and self.is_connected(address):
+            return await get_rssi()
+        if self._btmgmt and self.is_connected(address):
+            key = address.lower()
+            last = self._conn_info.get(key)
+            if last is not None and time.monotonic() - last[0] < CONN_INFO_MIN_INTERVAL:
+                rssi = last[1]
+            else:
+                rssi = await self._conn_info_rssi(address)
+                self._conn_info[key] = (time.monotonic(), rssi)
+            if rssi is not None:
+                return rssi
+        return presence.rssi(address, max_age=PRESENCE_RSSI_MAX_AGE)
+
+    async def _conn_info_rssi(self, address: str) -> Optional[int]:
+        addr_type = "le_random"
+        link = self._links.get(address.lower())
+        details = getattr(link.device if link is not None else None, "details", None)
+        if isinstance(details, dict):
+            props = details.get("props") or {}
+            if props.get("AddressType") == "public":
+                addr_type = "le_public"
+        adapter = (link.adapter if link is not None else None) or self.adapter
+        index = adapter[3:] if adapter.startswith("hci") else "0"
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                self._btmgmt, "--index", index, "conn-info", "-t", addr_type, address,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+            )
+        except OSError:
+            return None
+        try:
+            out, _ = await asyncio.wait_for(proc.communicate(), timeout=1.0)
+        except asyncio.TimeoutError:
+            with contextlib.suppress(ProcessLookupError):
+                proc.kill()
+            return None
+        m = _RSSI_RE.search(out.decode(errors="replace"))
+        return int(m.group(1)) if m else None
+
+
+connection_manager = ConnectionManager()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/gatt_cache.py – Persistenter Cache der GATT-Handles pro Smartphone
+Schlüssel ist die BLE-Adresse. Für bekannte Telefone verbindet der
+ConnectionManager mit bleaks 'dangerous_use_bleak_cache': BlueZ liefert die
+Services aus seinem Geräte-Cache, das Warten auf die Service-Suche
+(ServicesResolved) entfällt. CHAR_CHALLENGE/CHAR_RESPONSE werden dann direkt
+über die gecachten Handles aufgelöst (UUID wird gegengeprüft).
+Geschrieben wird nur bei neuem oder geändertem Eintrag (im Executor, nicht
+auf dem Event-Loop); ein fehlgeschlagener Zugriff über einen gecachten
+Handle invalidiert den Eintrag.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from config import DATA_DIR
+
+CACHE_FILE = os.path.join(DATA_DIR, "gatt_handles.json")
+CACHE_MAX = 512
+
+
+class GattHandleCache:
+
+    def __init__(self, path: str = CACHE_FILE, max_entries: int = CACHE_MAX):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # address -> {"challenge": handle, "response": handle}
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, address: str) -> Optional[dict]:
+        with self._lock:
+            return self._entries.get(address.lower())
+
+    def put(self, address: str, challenge_handle: int, response_handle: int) -> None:
+        """Merkt sich die Handles; gespeichert wird nur, wenn sich etwas geändert hat."""
+        entry = {"challenge": int(challenge_handle), "response": int(response_handle)}
+        key = address.lower()
+        with self._lock:
+            if self._entries.get(key) == entry:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._save_later()
+
+    def invalidate(self, address: str) -> None:
+        with self._lock:
+            if self._entries.pop(address.lower(), None) is None:
+                return
+        self._save_later()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._entries.update(data)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[BLE] GATT-Cache nicht lesbar ({e}) – starte leer.")
+
+    def _save_later(self) -> None:
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._save)
+        except RuntimeError:
+            self._save()  # kein Event-Loop (Tests, Werkzeuge)
+
+    def _save(self) -> None:
+        with self._lock:
+            data = dict(self._entries)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[BLE] GATT-Cache konnte nicht gespeichert werden: {e}")
+
+
+gatt_cache = GattHandleCache()
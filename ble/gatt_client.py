@@ -1,9 +1,14 @@
 # ble/gatt_client.py
 import asyncio
+import contextlib
 import os
-from bleak import BleakClient, BleakScanner
-from auth.challenge import verify_response
+import time
+from auth.challenge import DEFAULT_KEY_ID, key_store, verify_response
+from ble.connection import connection_manager
+from ble.gatt_cache import gatt_cache
 from config import RCU_ID
+from telemetry import log
+from telemetry.tracing import span
 
 SERVICE_UUID   = "0000aaa0-0000-1000-8000-aabbccddeeff"
 CHAR_CHALLENGE = "0000aaa2-0000-1000-8000-aabbccddeeff"
@@ -12,192 +17,343 @@ CHAR_RESPONSE  = "0000aaa1-0000-1000-8001-aabbccddeeff"
 EXPECTED_TOKEN = b"\xDE\xAD\xBE\xEF"
 
 RESPONSE_STATUS = False
+LAST_TIMINGS = {}           # Phasendauern (ms) der letzten Challenge-Response
 
-async def perform_challenge_response(device):
+# Zustände der Challenge-Response
+CONNECT, RESOLVE, EXCHANGE, AWAIT, VERIFY, DONE, FAILED = (
+    "CONNECT", "RESOLVE", "EXCHANGE", "AWAIT", "VERIFY", "DONE", "FAILED")
 
-    global RESPONSE_STATUS
-    RESPONSE_STATUS = False
+RESPONSE_TIMEOUT_MAX = 13.5     # s, unbekanntes Gerät
+RESPONSE_TIMEOUT_MIN = 2.0      # s, Untergrenze auch für schnelle Geräte
+RESPONSE_TIMEOUT_FACTOR = 3.0   # Vielfaches der typischen Antwortzeit
+RESPONSE_TIMEOUT_MARGIN = 1.0   # s Zuschlag
+RESPONSE_EWMA_ALPHA = 0.3
+READ_BACKOFF_S = (0.05, 0.1, 0.2, 0.4, 0.8)
 
-    """Challenge-Response – robust auch ohne vorheriges Pairing.
-    Erwartet, dass der aufrufende Code den Scanner bereits gestartet hat
-    und erst nach dem Connect stoppt.
-    """
-    await asyncio.sleep(0)  # Event loop flush
-    print(f"Starte Challenge-Response mit {device.name or 'N/A'} ({device.address})...")
+_response_ewma = {}  # address -> geglättete Antwortzeit (s)
 
-    dev = device  # kein zweiter Scan!
-    if not device:
-        print("Kein Gerät übergeben – Challenge-Response übersprungen.")
-        return False
 
+def _cached_characteristics(services, entry):
+    """Characteristics über gecachte Handles auflösen (O(1)), UUID wird gegengeprüft."""
     try:
-        # kurzer Moment, damit BlueZ Properties setzt
-        await asyncio.sleep(0.2)
-
-        async with BleakClient(dev, timeout=15.0, adapter="hci0") as client:
-            if not client.is_connected:
-                print("Verbindung fehlgeschlagen.")
-                return False
-
-            print("Verbunden – Suche nach Service und Characteristics ...")
+        char_challenge = services.get_characteristic(entry["challenge"])
+        char_response  = services.get_characteristic(entry["response"])
+    except Exception:
+        return None, None
+    if (not char_challenge or not char_response
+            or str(char_challenge.uuid).lower() != CHAR_CHALLENGE
+            or str(char_response.uuid).lower() != CHAR_RESPONSE):
+        return None, None
+    return char_challenge, char_response
+
+
+def _resolve_characteristics(services):
+    """Characteristics per UUID in der beim Verbinden gelesenen Service-Collection suchen."""
+    # Falls Bleak get_characteristic() hat:
+    get_char = getattr(services, "get_characteristic", None)
+    if callable(get_char):
+        return get_char(CHAR_CHALLENGE), get_char(CHAR_RESPONSE)
+
+    # Fallback: manuell filtern
+    all_chars = []
+    for s in services:
+        if hasattr(s, "characteristics"):
+            all_chars.extend(s.characteristics)
+    def find(uuid):
+        for c in all_chars:
+            if getattr(c, "uuid", "").lower() == uuid.lower():
+                return c
+        return None
+    return find(CHAR_CHALLENGE), find(CHAR_RESPONSE)
+
+
+def response_timeout(address: str) -> float:
+    """Adaptiver Timeout für die Response: aus den bisherigen Antwortzeiten des Geräts."""
+    ewma = _response_ewma.get(address.lower())
+    if ewma is None:
+        return RESPONSE_TIMEOUT_MAX
+    return min(RESPONSE_TIMEOUT_MAX, max(RESPONSE_TIMEOUT_MIN, ewma * RESPONSE_TIMEOUT_FACTOR + RESPONSE_TIMEOUT_MARGIN))
+
+
+def _record_response_time(address: str, seconds: float) -> None:
+    key = address.lower()
+    prev = _response_ewma.get(key)
+    _response_ewma[key] = seconds if prev is None else prev + RESPONSE_EWMA_ALPHA * (seconds - prev)
+
+
+class ChallengeSession:
+    """
+    Challenge-Response als explizite Zustandsmaschine:
+        CONNECT -> RESOLVE -> EXCHANGE -> AWAIT -> VERIFY -> DONE | FAILED
+    - keine festen Sleeps: Notify-Subscription und Challenge-Write laufen gepipelined
+    - direkter Read und Notification laufen um die Wette, die erste gültige Antwort gewinnt
+    - Response-Timeout passt sich an die beobachteten Antwortzeiten des Geräts an
+    - pro Phase wird die Dauer in self.timings (ms) festgehalten
+    - 'key_id' wählt den Key des Geräts im key_store (parallele Sitzungen);
+      ohne key_id gilt der global gesetzte Shared Key (set_shared_key_hex)
+    """
 
-            # Kompatibler Zugriff auf Services (je nach Bleak-Version)
+    def __init__(self, device, key_id=None):
+        self.device = device
+        self.address = device.address
+        self.key_id = key_id
+        self.ok = False
+        self.timings = {}
+        self.response = None          # zuletzt empfangene (ggf. ungültige) Response
+        self.client = None
+        self.cached = False           # Handles aus gatt_cache (Connect ohne Service-Suche)
+        self.char_challenge = None
+        self.char_response = None
+        self.challenge = None
+        self._valid = None            # gültige Response (gewinnt das Rennen)
+        self._valid_event = asyncio.Event()
+        self._written_at = 0.0
+        self._handlers = {
+            CONNECT: self._connect,
+            RESOLVE: self._resolve,
+            EXCHANGE: self._exchange,
+            AWAIT: self._await_response,
+            VERIFY: self._verify,
+        }
+
+    async def run(self) -> bool:
+        state = CONNECT
+        try:
+            while state not in (DONE, FAILED):
+                start = time.monotonic()
+                next_state = await self._handlers[state]()
+                self.timings[state] = round((time.monotonic() - start) * 1000.0, 1)
+                state = next_state
+        finally:
+            if self.client is not None:
+                with contextlib.suppress(Exception):
+                    await self.client.stop_notify(self.char_response or CHAR_RESPONSE)
+            if state != DONE:
+                await connection_manager.release(self.address)
+            log.auth.info("Challenge-Response %s (%s)", state, self.address, phases_ms=self.timings)
+        self.ok = state == DONE
+        return self.ok
+
+    # ---------------------------------------------------------
+    # Zustände
+    # ---------------------------------------------------------
+    async def _connect(self):
+        # Verbindung über den ConnectionManager: bleibt bei Erfolg offen
+        # (RSSI-Überwachung + Entsperr-Nachricht laufen auf demselben Link)
+        # Bekanntes Telefon: BlueZ-/bleak-Cache statt Service-Suche beim Verbinden
+        self.cached = gatt_cache.get(self.address) is not None
+        self.client = await connection_manager.connect(self.device, timeout=15.0, use_cache=self.cached)
+        if not self.client.is_connected:
+            print("Verbindung fehlgeschlagen.")
+            return FAILED
+        return RESOLVE
+
+    async def _resolve(self):
+        try:
+            # Bei neueren Versionen ist services bereits eine Property
+            services = self.client.services
+        except Exception:
             try:
-                services = await client.get_services()
-            except Exception:
-                await asyncio.sleep(0.5)
-                try:
-                    # Bei neueren Versionen ist services bereits eine Property
-                    services = client.services
-                except Exception as e2:
-                    print(f"Services konnten nicht gelesen werden ({e2}).")
-                    return False
-
-            # Characteristics per UUID holen (nicht über Handles arbeiten!)
-            # Falls Bleak get_characteristic() hat:
-            get_char = getattr(services, "get_characteristic", None)
-            if callable(get_char):
-                char_challenge = get_char(CHAR_CHALLENGE)
-                char_response  = get_char(CHAR_RESPONSE)
-                if not char_challenge or not char_response:
-                    print("Gesuchte Characteristics nicht gefunden.")
-                    return False
-            else:
-                # Fallback: manuell filtern
-                all_chars = []
-                for s in services:
-                    if hasattr(s, "characteristics"):
-                        all_chars.extend(s.characteristics)
-                def find(uuid):
-                    for c in all_chars:
-                        if getattr(c, "uuid", "").lower() == uuid.lower():
-                            return c
-                    return None
-                char_challenge = find(CHAR_CHALLENGE)
-                char_response  = find(CHAR_RESPONSE)
-                if not char_challenge or not char_response:
-                    print("Gesuchte Characteristics nicht gefunden.")
-                    return False
-
-            # Challenge-Response-Ablauf (nur UUIDs an Bleak übergeben!)
-            import os
-            challenge = os.urandom(16)
-            print(f"Challenge erzeugt: {challenge.hex()}")
-
-            
-            # RCU-ID (z. B. "A116G6") als Bytes anhängen
-            rcu_id_bytes = RCU_ID.encode("utf-8")
-            payload = challenge + rcu_id_bytes
-            print(f"Challenge-Payload gesendet (Challenge + ID): {payload.hex()}")
-
-            # Vorbereitung für Notification
-            response_event = asyncio.Event()
-            response_data = bytearray()
-
-            def handle_response(sender: str, data: bytearray):
-                response_data[:] = data
-                print(f"Notification empfangen: {data.hex()}")
-                response_event.set()
-
-            # Notifications aktivieren
+                # Kompatibler Zugriff auf Services (ältere Bleak-Versionen)
+                services = await self.client.get_services()
+            except Exception as e2:
+                print(f"Services konnten nicht gelesen werden ({e2}).")
+                return FAILED
+
+        entry = gatt_cache.get(self.address) if self.cached else None
+        if entry is not None:
+            self.char_challenge, self.char_response = _cached_characteristics(services, entry)
+            if self.char_challenge and self.char_response:
+                print("Verbunden – GATT-Handles aus Cache übernommen.")
+                return EXCHANGE
+            print("GATT-Cache passt nicht mehr zum Gerät – Eintrag verworfen.")
+            gatt_cache.invalidate(self.address)
+            self.cached = False
+
+        print("Verbunden – Suche nach Service und Characteristics ...")
+        self.char_challenge, self.char_response = _resolve_characteristics(services)
+        if not self.char_challenge or not self.char_response:
+            print("Gesuchte Characteristics nicht gefunden.")
+            return FAILED
+        gatt_cache.put(self.address, self.char_challenge.handle, self.char_response.handle)
+        return EXCHANGE
+
+    async def _exchange(self):
+        self.challenge = os.urandom(16)
+        log.auth.debug("Challenge erzeugt", challenge=self.challenge)
+
+        # RCU-ID (z. B. "A116G6") als Bytes anhängen
+        payload = self.challenge + RCU_ID.encode("utf-8")
+        log.auth.debug("Challenge-Payload gesendet (Challenge + ID)", payload=payload)
+
+        # Erst abonnieren, dann schreiben: die Antwort darf nicht vor der
+        # CCCD-Schreibung eintreffen, sonst geht die Notification verloren.
+        try:
+            await self.client.start_notify(self.char_response, self._on_notify)
+            print("Notification-Handler aktiviert.")
+        except Exception:
+            print(f"Warnung: Notification-Start fehlgeschlagen, fahre fort.")
+        await self._write_challenge(payload)
+        self._written_at = time.monotonic()
+        print("Challenge + RCU-ID an Smartphone gesendet.")
+        return AWAIT
+
+    async def _write_challenge(self, payload: bytes):
+        # WICHTIG: keine rohen Handles – nur die per UUID verifizierten Objekte
+        try:
+            await self.client.write_gatt_char(self.char_challenge, payload)
+        except Exception as e:
+            if not self.cached:
+                raise
+            # Gecachter Handle ungültig -> Cache verwerfen und per UUID wiederholen
+            print(f"Schreiben über gecachten Handle fehlgeschlagen ({e}) – Cache verworfen.")
+            gatt_cache.invalidate(self.address)
+            self.cached = False
+            self.char_challenge, self.char_response = CHAR_CHALLENGE, CHAR_RESPONSE
             try:
-                await client.start_notify(CHAR_RESPONSE, handle_response)
-                print("Notification-Handler aktiviert.")
-            except Exception as e:
+                await self.client.start_notify(self.char_response, self._on_notify)
+            except Exception:
                 print(f"Warnung: Notification-Start fehlgeschlagen, fahre fort.")
+            await self.client.write_gatt_char(self.char_challenge, payload)
+
+    async def _await_response(self):
+        timeout = response_timeout(self.address)
+        read_task = asyncio.ensure_future(self._read_loop())
+        try:
+            await asyncio.wait_for(self._valid_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            if self.response is None:
+                print(f"Keine Response empfangen (weder read noch notify, {timeout:.1f}s).")
+            else:
+                print(f"Keine gültige Response innerhalb von {timeout:.1f}s.")
+        finally:
+            read_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await read_task
+
+        if self._valid is not None:
+            _record_response_time(self.address, time.monotonic() - self._written_at)
+        return VERIFY if self.response is not None else FAILED
+
+    async def _verify(self):
+        response = self._valid if self._valid is not None else self.response
+        log.auth.debug("Response empfangen", response=response)
+
+        if self._valid is not None:
+            print("Tokenprüfung erfolgreich – Authentifizierung bestanden.")
+            return DONE
+        print("Tokenprüfung fehlgeschlagen.")
+        return FAILED
+
+    # ---------------------------------------------------------
+    # Antwortquellen (Read vs. Notification)
+    # ---------------------------------------------------------
+    def _offer(self, data, source: str) -> None:
+        if not data or self._valid is not None:
+            return
+        data = bytes(data)
+        self.response = data
+        if self._is_valid(data):
+            self._valid = data
+            print(f"Response über {source} empfangen.")
+            self._valid_event.set()
+
+    def _is_valid(self, data: bytes) -> bool:
+        try:
+            if self.key_id is not None:
+                if key_store.verify(self.key_id, self.challenge, data):
+                    return True
+            elif DEFAULT_KEY_ID not in key_store:
+                # Absender unbekannt -> gegen alle hinterlegten Geräte-Keys prüfen
+                matched = key_store.verify_any(self.challenge, data)
+                if matched is not None:
+                    self.key_id = matched
+                    return True
+            elif verify_response(self.challenge, data):
+                return True
+        except Exception as e:
+            print(f"Fehler bei der Authentifizierungsprüfung: {e}")
+        if data.endswith(EXPECTED_TOKEN):
+            print("Fallback-Token erkannt.")
+            return True
+        return False
 
-            await asyncio.sleep(0.1)
-
-            # WICHTIG: nicht mit Handles schreiben/lesen, sondern mit UUID
-            await client.write_gatt_char(CHAR_CHALLENGE, payload)
-            print("Challenge + RCU-ID an Smartphone gesendet.")
-
-            # 1. Versuch: direkt lesen (Single-Machine-Fall)
-            await asyncio.sleep(0.2)
-            response = None
-            try:
-                response = await client.read_gatt_char(CHAR_RESPONSE)
-                if response and len(response) > 0:
-                    print("Response direkt über read_gatt_char empfangen.")
-            except Exception as e:
-                print(f"Kein direkter Read möglich, warte auf Notification...")
-
-            # 2️. Wenn keine direkte Antwort kam -> auf Notification warten
-            if not response or len(response) == 0:
-                try:
-                    await asyncio.wait_for(response_event.wait(), timeout=13.5)
-                    response = bytes(response_data)
-                    print("Response über Notification empfangen.")
-                except asyncio.TimeoutError:
-                    print("Keine Response empfangen (weder read noch notify).")
-                    try:
-                        await client.stop_notify(CHAR_RESPONSE)
-                    except Exception:
-                        pass
-                    return False
-                
-            # Notification beenden
+    def _on_notify(self, sender, data: bytearray):
+        log.auth.debug("Notification empfangen", data=bytes(data))
+        self._offer(data, "Notification")
+
+    async def _read_loop(self):
+        # Single-Machine-Fall: Response direkt lesbar. Gelesen wird mit wachsendem
+        # Abstand, bis die Notification oder ein gültiger Read gewinnt.
+        for delay in READ_BACKOFF_S:
+            await asyncio.sleep(delay)
+            if self._valid is not None:
+                return
             try:
-                await client.stop_notify(CHAR_RESPONSE)
+                self._offer(await self.client.read_gatt_char(self.char_response), "read_gatt_char")
             except Exception:
-                pass
-
-            # response = await client.read_gatt_char(CHAR_RESPONSE)
-
-            hex_value = response.hex()
-            try:
-                text_value = response.decode("utf-8")
-            except UnicodeDecodeError:
-                text_value = "<nicht lesbarer Text>"
+                print(f"Kein direkter Read möglich, warte auf Notification...")
+                return
 
-            print(f"Response empfangen (HEX): {hex_value}")
-            print(f"Response als Text: {text_value}")
 
-            if response != None:
-                RESPONSE_STATUS = True
+async def authenticate(device, key_id=None) -> ChallengeSession:
+    """
+    Führt eine Challenge-Response-Sitzung aus und liefert sie zurück
+    (session.ok, session.response, session.timings). Für parallele Sitzungen
+    mit eigenem Key pro Gerät (key_store); die Modul-Globals bleiben unberührt.
+    """
+    print(f"Starte Challenge-Response mit {device.name or 'N/A'} ({device.address})...")
+    session = ChallengeSession(device, key_id=key_id)
+    with span("perform_challenge_response", address=device.address) as s:
+        try:
+            if not await session.run():
+                s.fail()
+        except Exception as e:
+            s.fail()
+            print(f"Fehler bei Challenge-Response: {e}")
+            if "org.bluez.GattService1" in str(e):
+                raise SystemExit("org.bluez.GattService1")
+        finally:
+            s.set(phases=session.timings, cached=session.cached)
+    return session
+
+
+async def perform_challenge_response(device, key_id=None):
+    """Challenge-Response – robust auch ohne vorheriges Pairing.
+    Erwartet, dass der Dauer-Scanner läuft (BlueZ kennt das Gerät dann bereits).
+    """
 
+    global RESPONSE_STATUS, LAST_TIMINGS
+    RESPONSE_STATUS = False
 
-            try:
-                if verify_response(challenge, response):
-                    print("Tokenprüfung erfolgreich – Authentifizierung bestanden.")
-                    return True
-                elif response.endswith(EXPECTED_TOKEN):
-                    print("Fallback-Token erkannt – Authentifizierung bestanden.")
-                    return True
-                else:
-                    print("Tokenprüfung fehlgeschlagen.")
-                    return False
-            except Exception as e:
-                print(f"Fehler bei der Authentifizierungsprüfung: {e}")
-                return False
-
-    except Exception as e:
-        print(f"Fehler bei Challenge-Response: {e}")
-        if "org.bluez.GattService1" in str(e):
-            raise SystemExit("org.bluez.GattService1")
+    if not device:
+        print("Kein Gerät übergeben – Challenge-Response übersprungen.")
         return False
 
+    session = None
+    try:
+        session = await authenticate(device, key_id=key_id)
+        return session.ok
+    finally:
+        if session is not None:
+            RESPONSE_STATUS = session.response is not None
+            LAST_TIMINGS = session.timings
 
 
 
 
-async def send_unlock_status(address: str):
 
-    try:
-        async with BleakClient(address, timeout=10.0, adapter="hci0") as client:
-            if not client.is_connected:
-                print("Wiederverbindung fehlgeschlagen.")
-                return False
+async def send_unlock_status(address: str):
+    """Schreibt 'Entsperrt' auf dem bestehenden Link (Reconnect nur bei Abriss)."""
 
-            payload = b"Entsperrt"  
+    payload = b"Entsperrt"  
 
-            # Vorher mussten wir die Characteristics suchen, 
-            # weil direkt mit ihnen gearbeitet (lesen, Notifies aktivieren) wird 
-            # – für einen einfachen Write reicht die UUID, den Rest erledigt Bleak automatisch.
-            await client.write_gatt_char(CHAR_CHALLENGE, payload)
+    with span("send_unlock_status", reused=connection_manager.is_connected(address)) as s:
+        # Für einen einfachen Write reicht die UUID, den Rest erledigt Bleak automatisch.
+        if await connection_manager.write(address, CHAR_CHALLENGE, payload):
             print("Entsperrt an Smartphone geschickt")
             return True
 
-    except Exception as e:
-        print(f"Fehler beim Senden Entsperrungsnachricht: {e}")
+        s.fail()
+        print("Fehler beim Senden Entsperrungsnachricht.")
         return False
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/matcher.py – Vorkompilierter Abgleich von Manufacturer-Payloads gegen
+die Liste autorisierter deviceIds.
+
+- Ist die Position der deviceId im Payload bekannt (offset), genügt ein
+  Slice + Hash-Lookup pro Advertisement.
+- Sonst wird ein Aho-Corasick-Automat über alle deviceIds gebaut; ein Payload
+  wird dann in einem Durchlauf gegen alle IDs gleichzeitig geprüft.
+Der Aufwand pro Advertisement ist damit unabhängig von der Anzahl der IDs.
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+
+class AdvertisementMatcher:
+    """Findet die erste autorisierte deviceId in einem Payload (oder None)."""
+
+    def __init__(self, device_ids: Iterable[bytes], offset: Optional[int] = None):
+        ids = [bytes(b) for b in device_ids if b]
+        self.offset = offset
+        self.size = len(ids)
+        self._lookup = {b: b for b in ids}
+        self._lengths = sorted({len(b) for b in ids})
+        self._goto: List[Dict[int, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[bytes]] = [None]
+        if offset is None:
+            self._build(ids)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def match(self, payload: bytes) -> Optional[bytes]:
+        if not payload or not self.size:
+            return None
+        if self.offset is not None:
+            return self._match_offset(payload)
+        return self._match_automaton(payload)
+
+    # ---------------------------------------------------------
+    # Fester Offset: Slice + Dict-Lookup
+    # ---------------------------------------------------------
+    def _match_offset(self, payload: bytes) -> Optional[bytes]:
+        start = self.offset
+        for length in self._lengths:
+            hit = self._lookup.get(bytes(payload[start:start + length]))
+            if hit is not None:
+                return hit
+        return None
+
+    # ---------------------------------------------------------
+    # Aho-Corasick
+    # ---------------------------------------------------------
+    def _build(self, ids: List[bytes]) -> None:
+        goto, fail, out = self._goto, self._fail, self._out
+        for pattern in ids:
+            state = 0
+            for byte in pattern:
+                nxt = goto[state].get(byte)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][byte] = nxt
+                    goto.append({})
+                    fail.append(0)
+                    out.append(None)
+                state = nxt
+            if out[state] is None:
+                out[state] = pattern
+
+        # Fail-Links per Breitensuche; out erbt den Treffer des Fail-Zustands
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for byte, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and byte not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(byte, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[nxt] is None:
+                    out[nxt] = out[fail[nxt]]
+
+    def _match_automaton(self, payload: bytes) -> Optional[bytes]:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for byte in payload:
+            while state and byte not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(byte, 0)
+            if out[state] is not None:
+                return out[state]
+        return None
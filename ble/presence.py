@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/presence.py – Prozessweite Anwesenheitstabelle der RCU (Modul)
+Ein einziger, dauerhaft laufender BleakScanner liefert über den
+detection_callback jede Advertisement-Meldung in eine In-Memory-Tabelle
+(Adresse -> letzter RSSI, Zeitpunkt, Manufacturer Data). central, main und
+der Unlocked-Mode lesen nur noch aus dieser Tabelle statt eigene Scans zu starten.
+"""
+
+import asyncio
+import contextlib
+import time
+from typing import Callable, Dict, List, Optional
+
+from ble.adapters import adapter_pool
+from ble.backend import get_backend
+
+PRESENCE_MAX_AGE = 15.0   # Sekunden ohne Advertisement -> Eintrag wird entfernt
+EVICT_INTERVAL = 5.0      # Sekunden zwischen Aufräumläufen
+
+
+class PresenceEntry:
+    """Letzter bekannter Zustand eines BLE-Geräts."""
+    __slots__ = ("address", "name", "rssi", "last_seen", "manufacturer_data", "device")
+
+    def __init__(self, address: str):
+        self.address = address
+        self.name = None
+        self.rssi = None
+        self.last_seen = 0.0
+        self.manufacturer_data = {}
+        self.device = None
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.monotonic()) - self.last_seen
+
+
+class PresenceTable:
+    """Adresse (lowercase) -> PresenceEntry, mit Alterung und Wartepunkten pro Adresse."""
+
+    def __init__(self, max_age: float = PRESENCE_MAX_AGE):
+        self.max_age = max_age
+        self._entries: Dict[str, PresenceEntry] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._listeners: List[Callable] = []
+
+    # ---------------------------------------------------------
+    # Schreiben (aus dem detection_callback)
+    # ---------------------------------------------------------
+    def update(self, device, advertisement_data) -> PresenceEntry:
+        key = device.address.lower()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = PresenceEntry(device.address)
+
+        rssi = getattr(advertisement_data, "rssi", None)
+        if rssi is None:
+            rssi = getattr(device, "rssi", None)
+        mdata = getattr(advertisement_data, "manufacturer_data", None)
+
+        entry.device = device
+        entry.name = device.name or getattr(advertisement_data, "local_name", None) or entry.name
+        entry.rssi = rssi
+        entry.last_seen = time.monotonic()
+        if mdata:
+            entry.manufacturer_data = dict(mdata)
+
+        for fut in self._waiters.pop(key, ()):
+            if not fut.done():
+                fut.set_result(entry)
+        for listener in self._listeners:
+            try:
+                listener(entry)
+            except Exception as e:
+                print(f"[BLE] Fehler im Presence-Listener: {e}")
+        return entry
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """Entfernt Einträge, die länger als max_age nicht gesehen wurden."""
+        now = now if now is not None else time.monotonic()
+        stale = [k for k, e in self._entries.items() if now - e.last_seen > self.max_age]
+        for k in stale:
+            del self._entries[k]
+        return len(stale)
+
+    # ---------------------------------------------------------
+    # Lesen
+    # ---------------------------------------------------------
+    def get(self, address: str, max_age: Optional[float] = None) -> Optional[PresenceEntry]:
+        entry = self._entries.get(address.lower())
+        if entry is None:
+            return None
+        if entry.age() > (max_age if max_age is not None else self.max_age):
+            return None
+        return entry
+
+    def rssi(self, address: str, max_age: Optional[float] = None) -> Optional[int]:
+        entry = self.get(address, max_age)
+        return entry.rssi if entry else None
+
+    def entries(self, max_age: Optional[float] = None) -> List[PresenceEntry]:
+        limit = max_age if max_age is not None else self.max_age
+        now = time.monotonic()
+        return [e for e in self._entries.values() if now - e.last_seen <= limit]
+
+    async def wait_for(self, address: str, timeout: float) -> Optional[PresenceEntry]:
+        """Wartet auf das nächste Advertisement von 'address' (None bei Timeout)."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(address.lower(), []).append(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(address.lower())
+            if waiters and fut in waiters:
+                waiters.remove(fut)
+
+    def add_listener(self, listener: Callable) -> None:
+        """Listener wird bei jedem Advertisement mit dem PresenceEntry aufgerufen."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable) -> None:
+        with contextlib.suppress(ValueError):
+            self._listeners.remove(listener)
+
+
+# ---------------------------------------------------------
+# Prozessweiter Scanner
+# ---------------------------------------------------------
+presence = PresenceTable()
+
+_scanner = None
+_evict_task: Optional[asyncio.Task] = None
+
+
+async def _evict_loop():
+    while True:
+        await asyncio.sleep(EVICT_INTERVAL)
+        presence.evict()
+
+
+async def ensure_scanning(adapter: Optional[str] = None):
+    """Startet den Dauer-Scanner (Standard: Scan-Adapter des Pools), falls er noch nicht läuft."""
+    global _scanner, _evict_task
+    if _scanner is None:
+        adapter = adapter or adapter_pool.scan
+        scanner = get_backend().Scanner(detection_callback=presence.update, adapter=adapter)
+        await scanner.start()
+        _scanner = scanner
+        print(f"[BLE] Dauer-Scanner auf {adapter} gestartet.")
+    if _evict_task is None or _evict_task.done():
+        _evict_task = asyncio.create_task(_evict_loop())
+    return _scanner
+
+
+async def stop_scanning() -> None:
+    """Stoppt den Dauer-Scanner (Tabelle bleibt erhalten)."""
+    global _scanner, _evict_task
+    scanner, _scanner = _scanner, None
+    if _evict_task is not None:
+        _evict_task.cancel()
+        _evict_task = None
+    if scanner is not None:
+        with contextlib.suppress(Exception):
+            await scanner.stop()
+        print("[BLE] Dauer-Scanner gestoppt.")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/recovery.py – Wiederherstellung des BLE-Stacks ohne Prozess-Neustart
+Statt bei hängendem Scanner oder dem BlueZ-Fehler 'org.bluez.GattService1'
+den ganzen Interpreter per os.execv neu zu starten, wird nur die BLE-Schicht
+zurückgesetzt: Auth-Links trennen, Dauer-Scanner stoppen, die genutzten
+Adapter über D-Bus aus- und wieder einschalten (Adapter1.Powered), Scanner
+neu starten. Lässt sich ein zweiter Adapter nicht zurücksetzen, läuft die
+RCU mit dem verbleibenden weiter.
+Anwesenheitstabelle, GATT-Handle-Cache, Token- und Geräte-Cache bleiben erhalten.
+os.execv bleibt nur als letzte Stufe, wenn die Wiederherstellung zu oft nötig ist.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from ble.adapters import adapter_pool
+from ble.backend import get_backend
+from ble.connection import connection_manager
+from ble.presence import ensure_scanning, stop_scanning
+from telemetry import log, tracing
+from telemetry.tracing import span
+
+BLUEZ_SERVICE_NAME = "org.bluez"
+ADAPTER_IF = "org.bluez.Adapter1"
+PROPERTIES_IF = "org.freedesktop.DBus.Properties"
+
+RECOVERY_WINDOW_S = 300.0   # Betrachtungsfenster für Wiederholungen
+MAX_RECOVERIES = 3          # so viele In-Process-Resets pro Fenster, danach execv
+POWER_SETTLE_S = 0.2        # Pause zwischen Aus- und Einschalten
+POWER_ON_TIMEOUT_S = 3.0    # maximale Wartezeit auf Powered=true
+
+
+class BleRecovery:
+    """Setzt Adapter, Scanner und Verbindungen zurück; D-Bus-Verbindung wird wiederverwendet."""
+
+    def __init__(self):
+        self._bus = None
+        self._props: Dict[str, object] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._history = deque()
+        self.stats = {"recoveries": 0, "power_cycles": 0, "failures": 0, "last_ms": 0.0}
+
+    async def _adapter_properties(self, adapter: str):
+        """Properties-Interface des Adapters (Bus und Proxys werden gecacht)."""
+        from dbus_fast import BusType
+        from dbus_fast.aio import MessageBus  # nur mit BlueZ-Backend benötigt
+        if self._bus is None or not self._bus.connected:
+            self._bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+            self._props.clear()
+        props = self._props.get(adapter)
+        if props is None:
+            path = adapter_pool.path(adapter)
+            intro = await self._bus.introspect(BLUEZ_SERVICE_NAME, path)
+            obj = self._bus.get_proxy_object(BLUEZ_SERVICE_NAME, path, intro)
+            props = self._props[adapter] = obj.get_interface(PROPERTIES_IF)
+        return props
+
+    async def _power_cycle(self, adapter: str) -> None:
+        reset_adapter = getattr(get_backend(), "reset_adapter", None)
+        if reset_adapter is not None:
+            await reset_adapter(adapter)
+            self.stats["power_cycles"] += 1
+            return
+        from dbus_fast import Variant
+        props = await self._adapter_properties(adapter)
+        await props.call_set(ADAPTER_IF, "Powered", Variant("b", False))
+        await asyncio.sleep(POWER_SETTLE_S)
+        await props.call_set(ADAPTER_IF, "Powered", Variant("b", True))
+
+        deadline = time.monotonic() + POWER_ON_TIMEOUT_S
+        while time.monotonic() < deadline:
+            powered = await props.call_get(ADAPTER_IF, "Powered")
+            if powered.value:
+                self.stats["power_cycles"] += 1
+                return
+            await asyncio.sleep(0.05)
+        raise TimeoutError(f"{adapter} nach {POWER_ON_TIMEOUT_S}s nicht eingeschaltet")
+
+    def _budget_left(self) -> bool:
+        now = time.monotonic()
+        while self._history and now - self._history[0] > RECOVERY_WINDOW_S:
+            self._history.popleft()
+        return len(self._history) < MAX_RECOVERIES
+
+    async def recover(self, reason: str) -> bool:
+        """
+        Setzt die BLE-Schicht zurück. False, wenn das Budget erschöpft ist oder
+        der Scanner danach nicht wieder läuft – dann bleibt nur der Neustart.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._budget_left():
+                print(f"[BLE] {MAX_RECOVERIES} Wiederherstellungen in {RECOVERY_WINDOW_S:.0f}s – gebe auf.")
+                return False
+            self._history.append(time.monotonic())
+
+            print(f"[BLE] Setze BLE-Stack zurück ({reason}) ...")
+            t0 = time.perf_counter()
+            with span("ble_recovery", reason=reason) as s:
+                await connection_manager.release()
+                await stop_scanning()
+                for adapter in adapter_pool.in_use():
+                    try:
+                        await self._power_cycle(adapter)
+                    except Exception as e:
+                        # Ohne Power-Cycle reicht oft schon der neue Scanner
+                        print(f"[BLE] Adapter-Reset {adapter} über D-Bus fehlgeschlagen: {e}")
+                        self._props.pop(adapter, None)
+                        s.set(power_cycle=False)
+                        adapter_pool.fallback(adapter)
+                try:
+                    await ensure_scanning()
+                except Exception as e:
+                    print(f"[BLE] Scanner-Neustart fehlgeschlagen: {e}")
+                    self.stats["failures"] += 1
+                    s.fail()
+                    return False
+
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            self.stats["recoveries"] += 1
+            self.stats["last_ms"] = elapsed_ms
+            print(f"[BLE] BLE-Stack wiederhergestellt ({elapsed_ms:.0f} ms).")
+            return True
+
+
+def restart_process() -> None:
+    """Letzte Stufe: Interpreter komplett neu starten."""
+    print("[BLE] Starte Programm neu ...")
+    tracing.flush()  # execv überspringt atexit
+    log.flush()
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+async def recover_or_restart(reason: str) -> None:
+    if not await ble_recovery.recover(reason):
+        restart_process()
+
+
+ble_recovery = BleRecovery()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/registry.py – Registry der autorisierten Smartphones einer RCU
+Ersetzt das Neuladen von central und die lineare Suche in der Geräteliste:
+kompakte Records mit O(1)-Indizes nach deviceId (Bytes/Hex), numerischer ID
+und zuletzt gesehener BLE-Adresse. Ein Update baut einen neuen, unveränderlichen
+Snapshot und tauscht ihn mit einer einzigen Zuweisung aus – Leser sehen immer
+entweder den alten oder den neuen Stand, nie einen halben.
+"""
+
+import threading
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+
+class AuthorizedDevice:
+    """Ein autorisiertes Smartphone (aktiv in der Cloud)."""
+    __slots__ = ("id", "device_id", "device_id_bytes", "name")
+
+    def __init__(self, numeric_id: int, device_id: str, name: Optional[str] = None):
+        self.id = numeric_id
+        self.device_id = device_id
+        self.device_id_bytes = bytes.fromhex(device_id)
+        self.name = name
+
+    def __repr__(self):
+        return f"AuthorizedDevice(id={self.id!r}, device_id={self.device_id!r})"
+
+
+class _Snapshot:
+    __slots__ = ("revision", "by_bytes", "by_id", "device_ids")
+
+    def __init__(self, revision: int, devices: Iterable[AuthorizedDevice]):
+        self.revision = revision
+        self.by_bytes: Dict[bytes, AuthorizedDevice] = {}
+        self.by_id: Dict[object, AuthorizedDevice] = {}
+        for dev in devices:
+            self.by_bytes[dev.device_id_bytes] = dev
+            self.by_id[dev.id] = dev
+        # Für den Matcher in central: gleicher Snapshot -> dasselbe Tupel-Objekt
+        self.device_ids: Tuple[bytes, ...] = tuple(self.by_bytes)
+
+
+class AuthorizedDeviceRegistry:
+
+    def __init__(self):
+        self._snapshot = _Snapshot(-1, ())
+        self._by_address: Dict[str, bytes] = {}  # Adresse -> deviceId (über Revisionen hinweg)
+        self._lock = threading.Lock()             # serialisiert nur Schreiber
+
+    # ---------------------------------------------------------
+    # Aktualisierung
+    # ---------------------------------------------------------
+    def update(self, smartphones: Iterable[dict], revision: int) -> bool:
+        """
+        Übernimmt die aktiven Smartphones aus der Cloud-Liste.
+        Gleiche Revision -> nichts zu tun (False).
+        """
+        if revision == self._snapshot.revision:
+            return False
+        devices = []
+        for info in smartphones:
+            numeric_id = info.get("id")
+            device_id = info.get("deviceId")
+            if not numeric_id or not device_id or info.get("status") != "active":
+                continue
+            try:
+                devices.append(AuthorizedDevice(numeric_id, device_id, info.get("name")))
+            except ValueError:
+                print(f"[RCU] Ungültige deviceId '{device_id}' (id={numeric_id}) – ignoriert.")
+        snapshot = _Snapshot(revision, devices)
+        with self._lock:
+            self._snapshot = snapshot
+        print(f"[RCU] {len(snapshot.by_id)} autorisierte Geräte geladen (rev={revision}).")
+        return True
+
+    def note_address(self, address: str, device: AuthorizedDevice) -> None:
+        """Merkt sich die BLE-Adresse, unter der 'device' zuletzt gesehen wurde."""
+        self._by_address[address.lower()] = device.device_id_bytes
+
+    # ---------------------------------------------------------
+    # Lookups (O(1), ohne Lock – der Snapshot wird nie verändert)
+    # ---------------------------------------------------------
+    @property
+    def revision(self) -> int:
+        return self._snapshot.revision
+
+    @property
+    def device_ids(self) -> Tuple[bytes, ...]:
+        return self._snapshot.device_ids
+
+    def ids(self) -> Tuple[object, ...]:
+        return tuple(self._snapshot.by_id)
+
+    def by_device_id(self, device_id: Union[bytes, str]) -> Optional[AuthorizedDevice]:
+        if isinstance(device_id, str):
+            try:
+                device_id = bytes.fromhex(device_id)
+            except ValueError:
+                return None
+        return self._snapshot.by_bytes.get(device_id)
+
+    def by_id(self, numeric_id) -> Optional[AuthorizedDevice]:
+        return self._snapshot.by_id.get(numeric_id)
+
+    def by_address(self, address: str) -> Optional[AuthorizedDevice]:
+        key = self._by_address.get(address.lower())
+        return self._snapshot.by_bytes.get(key) if key is not None else None
+
+    def __len__(self) -> int:
+        return len(self._snapshot.by_id)
+
+    def __bool__(self) -> bool:
+        return bool(self._snapshot.by_id)
+
+
+registry = AuthorizedDeviceRegistry()
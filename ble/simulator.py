@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ble/simulator.py – In-Process-BLE-Simulator als Backend (siehe ble/backend.py)
+Bildet nach, was die RCU von BlueZ/bleak sieht:
+  - Advertisement-Ströme beliebig vieler Geräte mit eigener Rate (+ Jitter)
+  - RSSI-Verläufe über die Zeit (konstant, Annäherung, Vorbeigehen) plus Rauschen
+  - Verbindungsaufbau mit Latenz, GATT-Service mit CHAR_CHALLENGE/CHAR_RESPONSE
+  - Antwort des Telefons (HMAC über die Challenge) per Notification und/oder Read
+Damit laufen central, gatt_client, connection und main ohne Telefon und BlueZ.
+"""
+
+import asyncio
+import hashlib
+import heapq
+import hmac
+import math
+import os
+import random
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ble.gatt_client import CHAR_CHALLENGE, CHAR_RESPONSE, SERVICE_UUID
+
+MANUFACTURER_ID = 0xFFFF
+ADV_JITTER_S = 0.010        # BLE: zufällige Verzögerung 0–10 ms pro Advertising-Event
+OUT_OF_RANGE_DBM = -100.0   # darunter kein Advertisement / kein Connect
+PHONE_POLL_S = 0.1          # so schnell bemerkt ein laufender Scanner neue Telefone
+
+Trajectory = Callable[[float], float]
+
+
+# ---------------------------------------------------------
+# RSSI-Verläufe (t = Sekunden seit Start des Scanners)
+# ---------------------------------------------------------
+def constant(rssi: float) -> Trajectory:
+    return lambda t: rssi
+
+
+def approach(start: float = -90.0, end: float = -55.0, duration: float = 5.0, delay: float = 0.0) -> Trajectory:
+    """Linear von 'start' nach 'end' innerhalb 'duration' Sekunden (ab 'delay')."""
+    def f(t):
+        x = min(1.0, max(0.0, (t - delay) / duration)) if duration > 0 else 1.0
+        return start + (end - start) * x
+    return f
+
+
+def walk_by(floor: float = -95.0, peak: float = -58.0, duration: float = 10.0, delay: float = 0.0) -> Trajectory:
+    """Vorbeigehen: Anstieg bis zur Mitte von 'duration', danach wieder Abfall."""
+    def f(t):
+        x = (t - delay) / duration if duration > 0 else 0.0
+        if x <= 0.0 or x >= 1.0:
+            return floor
+        return floor + (peak - floor) * math.sin(math.pi * x)
+    return f
+
+
+# ---------------------------------------------------------
+# Objekte, wie bleak sie liefert
+# ---------------------------------------------------------
+class SimDevice:
+    __slots__ = ("address", "name", "details", "rssi")
+
+    def __init__(self, address: str, name: Optional[str], adapter: str):
+        self.address = address
+        self.name = name
+        self.details = {"path": f"/org/bluez/{adapter}/dev_{address.replace(':', '_')}",
+                        "props": {"AddressType": "random"}}
+        self.rssi = None
+
+    def __repr__(self):
+        return f"SimDevice({self.address}, {self.name})"
+
+
+class SimAdvertisementData:
+    __slots__ = ("local_name", "rssi", "manufacturer_data", "service_uuids", "tx_power")
+
+    def __init__(self, local_name, rssi, manufacturer_data):
+        self.local_name = local_name
+        self.rssi = rssi
+        self.manufacturer_data = manufacturer_data
+        self.service_uuids = []
+        self.tx_power = None
+
+
+class SimCharacteristic:
+    __slots__ = ("uuid", "handle", "properties")
+
+    def __init__(self, uuid: str, handle: int, properties: List[str]):
+        self.uuid = uuid
+        self.handle = handle
+        self.properties = properties
+
+
+class SimService:
+    def __init__(self, uuid: str, handle: int, characteristics: List[SimCharacteristic]):
+        self.uuid = uuid
+        self.handle = handle
+        self.characteristics = characteristics
+
+
+class SimServices:
+    def __init__(self, services: List[SimService]):
+        self._services = services
+        self._chars = {}
+        for service in services:
+            for c in service.characteristics:
+                self._chars[c.handle] = c
+                self._chars[c.uuid] = c
+
+    def __iter__(self):
+        return iter(self._services)
+
+    def get_characteristic(self, spec):
+        if isinstance(spec, SimCharacteristic):
+            return spec
+        if isinstance(spec, str):
+            spec = spec.lower()
+        return self._chars.get(spec)
+
+
+def _gatt_layout() -> SimServices:
+    return SimServices([SimService(SERVICE_UUID, 10, [
+        SimCharacteristic(CHAR_CHALLENGE, 12, ["write"]),
+        SimCharacteristic(CHAR_RESPONSE, 14, ["read", "notify"]),
+    ])])
+
+
+# ---------------------------------------------------------
+# Simulierte Telefone
+# ---------------------------------------------------------
+class SimPhone:
+    """Ein Telefon (oder beliebiges BLE-Gerät) im Simulator."""
+
+    def __init__(self, address: str, device_id: Optional[bytes] = None, key: Optional[bytes] = None,
+                 name: Optional[str] = None, trajectory: Trajectory = constant(-60.0),
+                 adv_interval: float = 0.1, noise_db: float = 3.0, connect_latency: float = 0.3,
+                 discovery_latency: float = 0.4,
+                 response_latency: float = 0.15, notify: bool = True, readable: bool = True,
+                 app_suffix: bytes = b"\x01"):
+        self.address = address
+        self.name = name
+        self.device_id = device_id
+        self.key = key
+        self.trajectory = trajectory
+        self.adv_interval = adv_interval
+        self.noise_db = noise_db
+        self.connect_latency = connect_latency
+        self.discovery_latency = discovery_latency
+        self.response_latency = response_latency
+        self.notify = notify
+        self.readable = readable
+        payload = (device_id + app_suffix) if device_id else os.urandom(8)
+        self.manufacturer_data = {MANUFACTURER_ID: payload}
+        self.unlocked_at: Optional[float] = None
+
+    def rssi_at(self, t: float, rng: random.Random) -> int:
+        return int(round(self.trajectory(t) + rng.gauss(0.0, self.noise_db)))
+
+    def respond(self, challenge: bytes) -> bytes:
+        if self.key is None:
+            return os.urandom(32)  # nicht autorisiert -> falsche Antwort
+        return hmac.new(self.key, challenge, hashlib.sha256).digest()
+
+
+def background_devices(count: int, rssi: float = -80.0, adv_interval: float = 0.2,
+                       prefix: str = "EE") -> List[SimPhone]:
+    """Fremdgeräte (Kopfhörer, Uhren, andere Telefone) für Lastszenarien."""
+    return [SimPhone(f"{prefix}:00:00:{i >> 16 & 0xFF:02X}:{i >> 8 & 0xFF:02X}:{i & 0xFF:02X}",
+                     name=None, trajectory=constant(rssi), adv_interval=adv_interval)
+            for i in range(count)]
+
+
+# ---------------------------------------------------------
+# Backend
+# ---------------------------------------------------------
+class BleSimulator:
+    name = "sim"
+
+    def __init__(self, phones: Iterable[SimPhone] = (), seed: Optional[int] = None,
+                 adapter_reset_latency: float = 0.05):
+        self.phones: Dict[str, SimPhone] = {}
+        self.rng = random.Random(seed)
+        self.adapter_reset_latency = adapter_reset_latency
+        self.stats = {"advertisements": 0, "connects": 0, "connect_failures": 0,
+                      "writes": 0, "reads": 0, "notifications": 0, "adapter_resets": 0}
+        self.unlocks: List[tuple] = []  # (t, address)
+        self._t0: Optional[float] = None
+        self._clients: List["SimClient"] = []
+        self.revision = 0  # zählt Änderungen an 'phones' (für laufende Scanner)
+        for phone in phones:
+            self.add_phone(phone)
+
+    def add_phone(self, phone: SimPhone) -> None:
+        self.phones[phone.address.lower()] = phone
+        self.revision += 1
+
+    def remove_phone(self, address: str) -> None:
+        if self.phones.pop(address.lower(), None) is not None:
+            self.revision += 1
+
+    def now(self) -> float:
+        loop_time = asyncio.get_running_loop().time()
+        if self._t0 is None:
+            self._t0 = loop_time
+        return loop_time - self._t0
+
+    def phone(self, address: str) -> Optional[SimPhone]:
+        return self.phones.get(address.lower())
+
+    # bleak-kompatible Fabriken (ble/backend.py ruft Scanner(...) / Client(...))
+    def Scanner(self, detection_callback=None, adapter: str = "hci0", **kwargs) -> "SimScanner":
+        return SimScanner(self, detection_callback, adapter)
+
+    def Client(self, device, timeout: float = 10.0, adapter: str = "hci0",
+               disconnected_callback=None, **kwargs) -> "SimClient":
+        return SimClient(self, device, adapter, disconnected_callback)
+
+    async def reset_adapter(self, adapter: str) -> None:
+        self.stats["adapter_resets"] += 1
+        for client in list(self._clients):
+            client._drop()
+        await asyncio.sleep(self.adapter_reset_latency)
+
+
+class SimScanner:
+
+    def __init__(self, sim: BleSimulator, detection_callback, adapter: str):
+        self.sim = sim
+        self.callback = detection_callback
+        self.adapter = adapter
+        self._task: Optional[asyncio.Task] = None
+        self._devices: Dict[str, SimDevice] = {}
+
+    async def start(self) -> None:
+        if self._task is None:
+            self.sim.now()  # Zeitbasis festlegen
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        sim = self.sim
+        rng = sim.rng
+        loop = asyncio.get_running_loop()
+        # Heap der nächsten Advertising-Zeitpunkte, gestaffelt gestartet. Ändert
+        # sich sim.phones, kommen neue Telefone hinzu; entfernte/ersetzte fallen
+        # beim nächsten Pop heraus.
+        heap = []
+        scheduled = set()  # id() der eingeplanten Telefone
+        revision = None
+        counter = 0
+        while True:
+            if revision != sim.revision:
+                revision = sim.revision
+                start = sim.now()
+                for phone in sim.phones.values():
+                    if id(phone) not in scheduled:
+                        scheduled.add(id(phone))
+                        counter += 1
+                        heapq.heappush(heap, (start + rng.uniform(0.0, phone.adv_interval), counter, phone))
+            delay = (heap[0][0] if heap else math.inf) - sim.now()
+            if delay > 0:
+                await asyncio.sleep(min(delay, PHONE_POLL_S))
+                continue
+            now = sim.now()
+            # Alle fälligen Events in einem Durchlauf ausliefern (hohe Raten)
+            while heap and heap[0][0] <= now:
+                _, _, phone = heapq.heappop(heap)
+                if sim.phones.get(phone.address.lower()) is not phone:
+                    scheduled.discard(id(phone))
+                    continue
+                rssi = phone.rssi_at(now, rng)
+                if rssi > OUT_OF_RANGE_DBM and self.callback is not None:
+                    device = self._devices.get(phone.address)
+                    if device is None:
+                        device = self._devices[phone.address] = SimDevice(phone.address, phone.name, self.adapter)
+                    device.rssi = rssi
+                    sim.stats["advertisements"] += 1
+                    self.callback(device, SimAdvertisementData(phone.name, rssi, phone.manufacturer_data))
+                counter += 1
+                heapq.heappush(heap, (now + phone.adv_interval + rng.uniform(0.0, ADV_JITTER_S), counter, phone))
+            if loop.is_closed():
+                return
+
+
+class SimClient:
+
+    def __init__(self, sim: BleSimulator, device, adapter: str, disconnected_callback=None):
+        self.sim = sim
+        self.address = device if isinstance(device, str) else device.address
+        self.adapter = adapter
+        self._disconnected_callback = disconnected_callback
+        self._connected = False
+        self._services = _gatt_layout()
+        self._notify_cb = None
+        self._response = b""
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @property
+    def services(self) -> SimServices:
+        return self._services
+
+    async def get_services(self) -> SimServices:
+        return self._services
+
+    async def connect(self, **kwargs) -> bool:
+        phone = self.sim.phone(self.address)
+        if phone is None or phone.trajectory(self.sim.now()) <= OUT_OF_RANGE_DBM:
+            self.sim.stats["connect_failures"] += 1
+            await asyncio.sleep(0.05)
+            raise OSError(f"[sim] Gerät {self.address} nicht erreichbar")
+        await asyncio.sleep(phone.connect_latency)
+        if not kwargs.get("dangerous_use_bleak_cache"):
+            await asyncio.sleep(phone.discovery_latency)  # Service-Suche (BlueZ: ServicesResolved)
+        self._connected = True
+        self.sim.stats["connects"] += 1
+        self.sim._clients.append(self)
+        return True
+
+    async def disconnect(self) -> bool:
+        if self._connected:
+            self._drop()
+        return True
+
+    def _drop(self) -> None:
+        self._connected = False
+        self._notify_cb = None
+        if self in self.sim._clients:
+            self.sim._clients.remove(self)
+        if self._disconnected_callback is not None:
+            self._disconnected_callback(self)
+
+    def _check(self) -> SimPhone:
+        if not self._connected:
+            raise OSError("[sim] Nicht verbunden")
+        return self.sim.phone(self.address)
+
+    async def start_notify(self, char, callback, **kwargs) -> None:
+        self._check()
+        await asyncio.sleep(0.01)
+        self._notify_cb = callback
+
+    async def stop_notify(self, char) -> None:
+        self._notify_cb = None
+
+    async def write_gatt_char(self, char, data, response: bool = None) -> None:
+        phone = self._check()
+        uuid = getattr(self._services.get_characteristic(char), "uuid", None)
+        if uuid != CHAR_CHALLENGE:
+            raise OSError(f"[sim] Schreiben auf {char} nicht erlaubt")
+        self.sim.stats["writes"] += 1
+        await asyncio.sleep(0.005)
+        data = bytes(data)
+        if data == b"Entsperrt":
+            phone.unlocked_at = self.sim.now()
+            self.sim.unlocks.append((phone.unlocked_at, phone.address))
+            return
+        # Challenge (16 Bytes) + RCU-ID -> Antwort nach response_latency
+        asyncio.get_running_loop().call_later(phone.response_latency, self._answer, phone, data[:16])
+
+    def _answer(self, phone: SimPhone, challenge: bytes) -> None:
+        if not self._connected:
+            return
+        self._response = phone.respond(challenge)
+        if phone.notify and self._notify_cb is not None:
+            self.sim.stats["notifications"] += 1
+            self._notify_cb(self._services.get_characteristic(CHAR_RESPONSE), bytearray(self._response))
+
+    async def read_gatt_char(self, char) -> bytearray:
+        phone = self._check()
+        if not phone.readable:
+            raise OSError("[sim] Characteristic nicht lesbar")
+        self.sim.stats["reads"] += 1
+        await asyncio.sleep(0.005)
+        return bytearray(self._response)
+
+    async def get_rssi(self) -> int:
+        phone = self._check()
+        return phone.rssi_at(self.sim.now(), self.sim.rng)
+
+
+def default_simulator() -> BleSimulator:
+    """
+    Simulator aus Umgebungsvariablen (RCU_BLE_BACKEND=sim):
+      RCU_SIM_DEVICE_ID / RCU_SIM_KEY  Hex von deviceId und Token eines Telefons
+      RCU_SIM_BACKGROUND               Anzahl Fremdgeräte (Standard 0)
+    """
+    phones = []
+    device_id = os.getenv("RCU_SIM_DEVICE_ID")
+    if device_id:
+        key = os.getenv("RCU_SIM_KEY")
+        phones.append(SimPhone("5A:74:B4:51:A5:A0", bytes.fromhex(device_id),
+                               bytes.fromhex(key) if key else None, name="SimPhone",
+                               trajectory=approach(-85.0, -55.0, 3.0)))
+    phones.extend(background_devices(int(os.getenv("RCU_SIM_BACKGROUND", "0"))))
+    return BleSimulator(phones)
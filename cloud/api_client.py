@@ -1,45 +1,84 @@
 # /cloud/api_client.py
 import requests
 from urllib.parse import quote
+from cloud.http_client import cloud_client
 from config import CLOUD_URL
 from config import RCU_ID
 
-def get_assigned_smartphones(rcu_id=RCU_ID, base_url=CLOUD_URL, timeout_s=10):
+def get_assigned_smartphones(rcu_id=RCU_ID, base_url=CLOUD_URL, timeout_s=None):
     """
     Fragt die Cloud nach allen zugewiesenen Smartphones einer RCU.
+    Unbedingte Abfrage über get_assigned_smartphones_conditional (ohne ETag/since).
     """
-    
+
+    rcu_id = str(rcu_id).strip()
+    result = get_assigned_smartphones_conditional(rcu_id, base_url=base_url, timeout_s=timeout_s)
+    if result is None:
+        return []
+    _, data, _, _ = result
+
+    # Sicherstellen, dass immer eine Liste zurückkommt
+    if not isinstance(data, list):
+        data = [data]
+
+    cleaned = []
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        entry["deviceId"] = str(entry.get("deviceId", "")).strip().lower()
+        cleaned.append(entry)
+
+    print(f"[Cloud] {len(cleaned)} Smartphones von RCU {rcu_id} empfangen.")
+    return cleaned
+
+
+def get_assigned_smartphones_conditional(rcu_id=RCU_ID, etag=None, since=None, base_url=CLOUD_URL, timeout_s=None):
+    """
+    Zugewiesene Smartphones einer RCU, optional bedingt (Sync-Layer):
+    sendet If-None-Match (ETag) bzw. ?since=<version>, falls angegeben –
+    auch beim POST-Fallback.
+    Rückgabe: (status_code, data, etag, version)
+              status_code 304 -> data None (unverändert)
+              None bei Verbindungsfehler.
+    data ist entweder eine Liste (Vollstand) oder ein Delta-Dict
+    {"version": ..., "changes": [...], "removed": [ids]}.
+    """
+
     rcu_id = str(rcu_id).strip()
     url = f"{base_url}/api/rcu/{quote(rcu_id)}/smartphones"
     headers = {"Accept": "application/json"}
+    params = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if since is not None:
+        params["since"] = since
 
     try:
-        # GET ist für Listen der passendere Standard
-        resp = requests.get(url, headers=headers, timeout=timeout_s)
+        resp = cloud_client.get("smartphones", url, headers=headers, params=params or None, timeout=timeout_s)
         if resp.status_code == 405:
             # falls Backend fälschlich nur POST zulässt
-            resp = requests.post(url, headers=headers, timeout=timeout_s)
+            resp = cloud_client.post("smartphones", url, headers=headers, params=params or None,
+                                     timeout=timeout_s)
 
-        resp.raise_for_status()
-        data = resp.json() or []
+        new_etag = resp.headers.get("ETag") or etag
+        version = resp.headers.get("X-Version")
+        if resp.status_code == 304:
+            return 304, None, new_etag, version if version is not None else since
 
-        # Sicherstellen, dass immer eine Liste zurückkommt
-        if not isinstance(data, list):
+        resp.raise_for_status()
+        data = resp.json()
+        if data is None:
+            data = []
+        if isinstance(data, dict) and ("changes" in data or "removed" in data):
+            version = data.get("version", version)
+        elif not isinstance(data, list):
             data = [data]
+        return resp.status_code, data, new_etag, version
 
-        cleaned = []
-        for entry in data:
-            if not isinstance(entry, dict):
-                continue
-            entry["deviceId"] = str(entry.get("deviceId", "")).strip().lower()
-            cleaned.append(entry)
-
-        print(f"[Cloud] {len(cleaned)} Smartphones von RCU {rcu_id} empfangen.")
-        return cleaned
+    except (requests.RequestException, ValueError) as e:
+        print(f"[Cloud] Fehler bei Anfrage (get_assigned_smartphones_conditional): {e}")
+        return None
 
-    except requests.RequestException as e:
-        print(f"[Cloud] Fehler bei Anfrage (get_assigned_smartphones): {e}")
-        return []
 
 
     
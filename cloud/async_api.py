@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /cloud/async_api.py
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+
+from cloud.remote_check import check_remote_mode
+from cloud.token_cache import token_cache
+from cloud.token_client import CloudError
+from config import RCU_ID
+from telemetry.tracing import span, traced
+
+CLOUD_WORKERS = 4
+DEFAULT_CALL_TIMEOUT_S = 15.0
+
+_executor = ThreadPoolExecutor(max_workers=CLOUD_WORKERS, thread_name_prefix="cloud")
+
+
+async def run_cloud(func, *args, timeout: Optional[float] = DEFAULT_CALL_TIMEOUT_S, **kwargs):
+    """
+    Führt einen blockierenden Cloud-Aufruf im Cloud-Executor aus, ohne den
+    Event-Loop (und damit BLE-Callbacks) anzuhalten.
+    Wird der aufrufende Task abgebrochen oder läuft 'timeout' ab, wartet der
+    Loop nicht weiter; noch nicht gestartete Aufrufe werden verworfen, laufende
+    enden spätestens mit ihrem eigenen HTTP-Timeout.
+    """
+    loop = asyncio.get_running_loop()
+    # Kontext mitnehmen, damit Spans im Thread die Korrelations-ID des Versuchs tragen
+    ctx = contextvars.copy_context()
+    fut = loop.run_in_executor(_executor, ctx.run, functools.partial(func, *args, **kwargs))
+    if timeout is None:
+        return await fut
+    return await asyncio.wait_for(fut, timeout)
+
+
+async def check_remote_mode_async(rcu_id=RCU_ID) -> bool:
+    """Async-Variante von check_remote_mode (Fehler -> False)."""
+    try:
+        async with span("check_remote_mode"):
+            return bool(await run_cloud(check_remote_mode, rcu_id))
+    except Exception as e:
+        print(f"[Cloud] Fehler bei der Status-Anfrage: {e}")
+        return False
+
+
+def _cloud_unreachable(e: BaseException) -> bool:
+    """Nur Timeout/Verbindungsfehler zählen als 'Cloud nicht erreichbar' – keine HTTP-Antworten."""
+    if isinstance(e, asyncio.TimeoutError):
+        return True
+    return isinstance(e, CloudError) and isinstance(e.__cause__, (requests.ConnectionError, requests.Timeout))
+
+
+@traced("fetch_token")
+async def get_token_async(device_numeric_id: int, timeout_s: float = 5.0) -> str:
+    """
+    Token aus dem Cache oder laufenden Prefetch abwarten, ohne einen Thread zu blockieren.
+    Ist die Cloud nicht erreichbar (Timeout/Verbindungsfehler), wird das letzte bekannte
+    Token verwendet, solange es jünger als OFFLINE_MAX_AGE_S ist. Antwortet die Cloud mit
+    einem Fehler, wird das Offline-Token verworfen.
+    """
+    device_numeric_id = int(device_numeric_id)
+    token_hex = token_cache.peek(device_numeric_id)
+    if token_hex is not None:
+        return token_hex
+    try:
+        # shield: ein Timeout hier bricht den gemeinsamen Prefetch nicht ab
+        fut = asyncio.wrap_future(token_cache.fetch_future(device_numeric_id))
+        return await asyncio.wait_for(asyncio.shield(fut), timeout_s)
+    except Exception as e:
+        if not _cloud_unreachable(e):
+            if isinstance(e, CloudError):
+                # Cloud hat geantwortet (HTTP-Fehler, ungültiges Format) -> Offline-Token ist nicht mehr gültig
+                token_cache.invalidate(device_numeric_id)
+                raise
+            raise CloudError(f"Token GET failed for id={device_numeric_id}: {e}") from e
+        token_hex = token_cache.offline_token(device_numeric_id)
+        if token_hex is not None:
+            print(f"[Cloud] Token für id={device_numeric_id} nicht abrufbar ({e}) – nutze Offline-Token.")
+            return token_hex
+        if isinstance(e, CloudError):
+            raise
+        raise CloudError(f"Token GET timed out for id={device_numeric_id}") from e
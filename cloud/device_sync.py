@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /cloud/device_sync.py
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+from cloud.api_client import get_assigned_smartphones_conditional
+from config import CLOUD_URL, RCU_ID
+
+
+def _clean(entry: dict) -> Optional[dict]:
+    if not isinstance(entry, dict):
+        return None
+    entry = dict(entry)
+    entry["deviceId"] = str(entry.get("deviceId", "")).strip().lower()
+    return entry
+
+
+class SmartphoneSync:
+    """
+    Hält die zuletzt empfangene Smartphone-Liste einer RCU lokal und
+    revalidiert sie per ETag/If-None-Match bzw. ?since=<version>.
+    Volle Listen werden mit dem lokalen Stand verglichen, Deltas direkt
+    angewendet. 'revision' steigt nur, wenn sich tatsächlich etwas geändert hat.
+    """
+
+    def __init__(self, rcu_id=RCU_ID, base_url=CLOUD_URL):
+        self.rcu_id = rcu_id
+        self.base_url = base_url
+        self.etag = None
+        self.version = None
+        self.revision = 0
+        self.loaded = False
+        self.synced_at = 0.0          # time.time() des letzten erfolgreichen Cloud-Kontakts
+        self._by_id: Dict[object, dict] = {}
+        self._lock = threading.Lock()
+
+    def smartphones(self) -> List[dict]:
+        with self._lock:
+            return list(self._by_id.values())
+
+    def sync(self) -> Optional[bool]:
+        """
+        Gleicht den lokalen Stand mit der Cloud ab.
+        Rückgabe: True = geändert, False = unverändert, None = Cloud nicht erreichbar.
+        """
+        result = get_assigned_smartphones_conditional(
+            rcu_id=self.rcu_id, etag=self.etag if self.loaded else None,
+            since=self.version if self.loaded else None, base_url=self.base_url,
+        )
+        if result is None:
+            return None
+
+        status, data, etag, version = result
+        with self._lock:
+            self.synced_at = time.time()
+            self.etag = etag
+            self.version = version
+            if status == 304:
+                print("[Cloud] Smartphone-Liste unverändert (304).")
+                return False
+
+            if isinstance(data, dict):
+                changed = self._apply_delta(data)
+            else:
+                changed = self._apply_full(data)
+            self.loaded = True
+            if changed:
+                self.revision += 1
+                print(f"[Cloud] Smartphone-Liste aktualisiert ({len(self._by_id)} Einträge, rev={self.revision}).")
+            return changed
+
+    def age(self) -> float:
+        """Sekunden seit dem letzten erfolgreichen Abgleich (inkl. Snapshot-Stand)."""
+        return time.time() - self.synced_at if self.synced_at else float("inf")
+
+    def export(self) -> dict:
+        with self._lock:
+            return {"etag": self.etag, "version": self.version, "synced_at": self.synced_at,
+                    "smartphones": list(self._by_id.values())}
+
+    def restore(self, state: dict) -> bool:
+        """Übernimmt den Stand aus dem lokalen Snapshot, falls noch nichts geladen ist."""
+        with self._lock:
+            if self.loaded:
+                return False
+            self._apply_full(state.get("smartphones") or [])
+            self.etag = state.get("etag")
+            self.version = state.get("version")
+            self.synced_at = float(state.get("synced_at") or 0.0)
+            self.loaded = True
+            self.revision += 1
+            return True
+
+    def reset(self) -> None:
+        """Verwirft ETag/Version – nächster sync() lädt den Vollstand."""
+        with self._lock:
+            self.etag = None
+            self.version = None
+            self.loaded = False
+
+    def _apply_full(self, data: list) -> bool:
+        fresh = {}
+        for raw in data:
+            entry = _clean(raw)
+            if entry is not None:
+                fresh[entry.get("id")] = entry
+        changed = fresh != self._by_id or not self.loaded
+        self._by_id = fresh
+        return changed
+
+    def _apply_delta(self, data: dict) -> bool:
+        changed = False
+        for raw in data.get("changes") or []:
+            entry = _clean(raw)
+            if entry is None:
+                continue
+            if self._by_id.get(entry.get("id")) != entry:
+                self._by_id[entry.get("id")] = entry
+                changed = True
+        for removed_id in data.get("removed") or []:
+            if self._by_id.pop(removed_id, None) is not None:
+                changed = True
+        return changed
+
+
+smartphone_sync = SmartphoneSync()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /cloud/http_client.py
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import CLOUD_URL
+
+POOL_SIZE = 8
+
+# Zeitbudget pro Endpunkt: (Verbindungsaufbau, Lesen) in Sekunden
+ENDPOINT_TIMEOUTS = {
+    "smartphones": (3.05, 10),
+    "token":       (3.05, 4),
+    "events":      (3.05, 5),
+    "status":      (3.05, 5),
+    "sse":         (5, 15),     # Lesen = max. Wartezeit zwischen zwei SSE-Zeilen
+}
+DEFAULT_TIMEOUT = (3.05, 10)
+
+
+class CloudClient:
+    """
+    Gemeinsamer HTTP-Client für alle Cloud-Module.
+    Eine requests.Session mit Keep-Alive-Pool, Timeout-Budget pro Endpunkt
+    und Antwortzeit-Statistik (Anzahl, Fehler, Mittel/Max in ms).
+    """
+
+    def __init__(self, base_url: str = CLOUD_URL, pool_size: int = POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}{path}"
+
+    def request(self, method: str, endpoint: str, path: str, timeout=None, **kwargs) -> requests.Response:
+        """Führt einen Request aus und verbucht Dauer/Fehler unter 'endpoint'."""
+        if timeout is None:
+            timeout = ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        start = time.monotonic()
+        try:
+            resp = self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+        except requests.RequestException:
+            self.record(endpoint, time.monotonic() - start, error=True)
+            raise
+        self.record(endpoint, time.monotonic() - start, error=resp.status_code >= 500)
+        return resp
+
+    def get(self, endpoint: str, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", endpoint, path, **kwargs)
+
+    def post(self, endpoint: str, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", endpoint, path, **kwargs)
+
+    def stream(self, endpoint: str, path: str, **kwargs) -> requests.Response:
+        """GET mit stream=True (SSE). Verbucht wird die Zeit bis zu den Headern."""
+        return self.request("GET", endpoint, path, stream=True, **kwargs)
+
+    def stats(self) -> dict:
+        """Antwortzeiten pro Endpunkt (ms)."""
+        with self._lock:
+            out = {}
+            for endpoint, s in self._stats.items():
+                out[endpoint] = dict(s, avg_ms=s["total_ms"] / s["count"] if s["count"] else 0.0)
+            return out
+
+    def record(self, endpoint: str, elapsed_s: float, error: bool = False) -> None:
+        """Verbucht eine Messung – auch für Verbindungen außerhalb der Session (SSE)."""
+        ms = elapsed_s * 1000.0
+        with self._lock:
+            s = self._stats.setdefault(endpoint, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            s["count"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+            if error:
+                s["errors"] += 1
+
+    def close(self) -> None:
+        self.session.close()
+
+
+cloud_client = CloudClient()
@@ -1,31 +1,223 @@
 # /cloud/notify.py
 
-import requests
+import atexit
 import json
-from config import CLOUD_URL
+import os
+import queue
+import threading
+import time
+
+import requests
+from config import CLOUD_URL, DATA_DIR
+from cloud.http_client import cloud_client
 from config import RCU_ID
 
+EVENTS_PATH = "/api/rcu/events/add"
+EVENTS_BULK_PATH = "/api/rcu/events/bulk"
+SPOOL_FILE = os.path.join(DATA_DIR, "events_outbox.jsonl")
+REJECTED_FILE = os.path.join(DATA_DIR, "events_rejected.jsonl")
+
+BATCH_MAX = 20            # max. Events pro Bulk-Request
+BATCH_WAIT_S = 0.2        # kurz sammeln, bevor gesendet wird
+REPLAY_INTERVAL_S = 15.0  # Abstand der Zustellversuche für gespoolte Events
+RETRY_STATUS = (408, 425, 429)  # 4xx, die trotzdem später wiederholt werden
+
+
+def _retryable(e: requests.RequestException) -> bool:
+    """Nur 5xx, Timeouts und Verbindungsfehler lohnen einen späteren Versuch."""
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        status = e.response.status_code
+        return status >= 500 or status in RETRY_STATUS
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+class EventOutbox:
+    """
+    Nicht-blockierende Outbox für RCU-Events.
+    notify_rcu_event() legt nur in eine Queue; ein Hintergrund-Thread sendet
+    gesammelt an den Bulk-Endpunkt (Fallback: einzeln an /events/add).
+    Nicht zustellbare Events landen in einer Append-only-Datei und werden
+    beim nächsten erfolgreichen Kontakt in Reihenfolge nachgeliefert.
+    Von der Cloud abgelehnte Events (4xx) werden nicht wiederholt, sondern
+    nach rejected_file verschoben, damit sie den Spool nicht blockieren.
+    """
+
+    def __init__(self, base_url=CLOUD_URL, spool_file=SPOOL_FILE, rejected_file=REJECTED_FILE):
+        self.base_url = base_url
+        self.spool_file = spool_file
+        self.rejected_file = rejected_file
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._bulk_supported = True
+        self._last_replay = 0.0
+
+    def submit(self, payload: dict) -> None:
+        self.start()
+        self._queue.put(payload)
+
+    def flush(self, timeout: float = 2.0) -> None:
+        """Wartet (begrenzt), bis die Queue abgearbeitet ist – z. B. beim Beenden."""
+        end = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < end:
+            time.sleep(0.05)
+
+    def start(self):
+        """Startet den Sende-Thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="event-outbox", daemon=True)
+            self._thread.start()
+
+    # ---------------------------------------------------------
+    # Worker
+    # ---------------------------------------------------------
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=REPLAY_INTERVAL_S)
+            except queue.Empty:
+                self._replay_spool()
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + BATCH_WAIT_S
+            while len(batch) < BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
 
-def notify_rcu_event(rcu_id=RCU_ID, deviceName: str = 'none', deviceId: str = 'None', result: str = 'none', base_url=CLOUD_URL, timeout_s=10):
+            try:
+                # Reihenfolge wahren: solange gespoolte Events offen sind, hinten anhängen
+                if os.path.exists(self.spool_file):
+                    self._spool(batch)
+                else:
+                    self._spool(self._send(batch))
+                self._replay_spool()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
 
-    rcu_id = str(rcu_id).strip()
-    url = f"{base_url}/api/rcu/events/add"
-    headers = {"Content-Type": "application/json"}
+    def _send(self, batch) -> list:
+        """Sendet einen Batch. Rückgabe: Events, die später erneut versucht werden (leer = erledigt)."""
+        headers = {"Content-Type": "application/json"}
+        if self._bulk_supported and len(batch) > 1:
+            try:
+                r = cloud_client.post("events", f"{self.base_url}{EVENTS_BULK_PATH}",
+                                      headers=headers, data=json.dumps(batch))
+                if r.status_code in (404, 405):
+                    print("[Cloud] Bulk-Endpunkt nicht verfügbar – sende Events einzeln.")
+                    self._bulk_supported = False
+                else:
+                    r.raise_for_status()
+                    print(f"[Cloud] {len(batch)} Events notified.")
+                    return []
+            except requests.RequestException as e:
+                if _retryable(e):
+                    print(f"[Cloud] Fehler bei Zustandsbenachrichtigung: {e} – Events werden gespoolt.")
+                    return batch
+                # Einzeln senden, damit nur die abgelehnten Events aussortiert werden
+                print(f"[Cloud] Bulk-Request abgelehnt ({e}) – sende Events einzeln.")
+
+        for i, payload in enumerate(batch):
+            try:
+                r = cloud_client.post("events", f"{self.base_url}{EVENTS_PATH}",
+                                      headers=headers, data=json.dumps(payload))
+                r.raise_for_status()
+                print(f"[Cloud] Event notified.")
+            except requests.RequestException as e:
+                if _retryable(e):
+                    print(f"[Cloud] Fehler bei Zustandsbenachrichtigung: {e} – Event wird gespoolt.")
+                    return batch[i:]
+                self._reject(payload, e)
+        return []
+
+    def _reject(self, payload: dict, error: Exception) -> None:
+        print(f"[Cloud] Event von der Cloud abgelehnt ({error}) – nach {self.rejected_file} verschoben.")
+        try:
+            os.makedirs(os.path.dirname(self.rejected_file), exist_ok=True)
+            with open(self.rejected_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"event": payload, "error": str(error), "ts": time.time()}) + "\n")
+        except OSError as e:
+            print(f"[Cloud] Abgelehntes Event nicht speicherbar ({e}) – verworfen.")
+
+    def _spool(self, batch) -> None:
+        if not batch:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.spool_file), exist_ok=True)
+            with open(self.spool_file, "a", encoding="utf-8") as f:
+                for payload in batch:
+                    f.write(json.dumps(payload) + "\n")
+        except OSError as e:
+            print(f"[Cloud] Outbox-Spool nicht schreibbar ({e}) – {len(batch)} Events verworfen.")
+
+    def _replay_spool(self) -> None:
+        if not os.path.exists(self.spool_file):
+            return
+        now = time.monotonic()
+        if now - self._last_replay < REPLAY_INTERVAL_S and self._last_replay:
+            return
+        self._last_replay = now
+
+        try:
+            with open(self.spool_file, "r", encoding="utf-8") as f:
+                pending = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            print(f"[Cloud] Outbox-Spool nicht lesbar: {e}")
+            return
+
+        for start in range(0, len(pending), BATCH_MAX):
+            retry = self._send(pending[start:start + BATCH_MAX])
+            if retry:
+                # Zugestellte und abgelehnte Events aus dem Spool entfernen, Rest behalten
+                self._rewrite_spool(retry + pending[start + BATCH_MAX:])
+                return
+        self._rewrite_spool([])
+        self._last_replay = 0.0
+        print(f"[Cloud] {len(pending)} gespoolte Events nachgeliefert.")
+
+    def _rewrite_spool(self, remaining) -> None:
+        try:
+            if not remaining:
+                os.remove(self.spool_file)
+                return
+            tmp = self.spool_file + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for payload in remaining:
+                    f.write(json.dumps(payload) + "\n")
+            os.replace(tmp, self.spool_file)
+        except OSError as e:
+            print(f"[Cloud] Outbox-Spool konnte nicht aktualisiert werden: {e}")
+
+
+outbox = EventOutbox()
+atexit.register(outbox.flush)
+if os.path.exists(SPOOL_FILE):
+    outbox.start()  # Events aus dem letzten Lauf nachliefern
+
+
+def notify_rcu_event(rcu_id=RCU_ID, deviceName: str = 'none', deviceId: str = 'None', result: str = 'none'):
+    """
+    Legt ein Event in die Outbox und kehrt sofort zurück (Zustellung im Hintergrund).
+    Ziel-URL und Timeout bestimmen outbox bzw. cloud_client (ENDPOINT_TIMEOUTS['events']).
+    """
 
     if deviceName == "BlueZ 5.72":
         deviceName = "Laptop-phone"
 
     payload = {
-        "rcuId": RCU_ID,
+        "rcuId": str(rcu_id).strip(),
         "deviceName": deviceName, 
         "deviceId": deviceId,
         "result": result
     }
 
-    try: 
-        r = requests.post(url, headers=headers, data=json.dumps(payload))
-        r.raise_for_status()
-        print(f"[Cloud] Event notified.")
-    except requests.RequestException as e:
-        print(f"[Cloud] Fehler bei Zustandsbenachrichtigung: {e}")
-        return []
+    outbox.submit(payload)
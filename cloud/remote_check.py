@@ -3,6 +3,7 @@
 import requests
 import json
 from urllib.parse import quote
+from cloud.http_client import cloud_client
 from config import CLOUD_URL
 from config import RCU_ID
 
@@ -15,7 +16,7 @@ def check_remote_mode(rcu_id=RCU_ID):
     headers = {"Accept": "application/json"}
 
     try: 
-        resp = requests.get(url, headers=headers)
+        resp = cloud_client.get("status", url, headers=headers)
         resp.raise_for_status()
         print(f"[Cloud] Remote Status angefragt.")
 
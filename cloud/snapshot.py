@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /cloud/snapshot.py
+"""
+Verschlüsselter lokaler Snapshot der Smartphone-Liste und der Tokens.
+Beim Start wird er per mmap gelesen und entschlüsselt, damit der Scan sofort
+beginnen kann, während die Cloud im Hintergrund revalidiert wird. Bei
+Cloud-Ausfall darf mit dem Snapshot bis OFFLINE_MAX_AGE_S entsperrt werden.
+
+Format: MAGIC(4) | FORMAT(1) | Nonce(12) | AES-256-GCM(JSON), AAD = Header + RCU_ID.
+Schlüssel aus RCU_SNAPSHOT_KEY (Hex, 32 Bytes) oder der Datei SNAPSHOT_KEY_FILE
+(0600, beim ersten Speichern erzeugt). Der Schlüssel muss außerhalb von DATA_DIR
+bereitgestellt werden: der Standardpfad DATA_DIR/snapshot.key liegt neben dem
+Snapshot und schützt nur gegen das Auslesen der einzelnen Datei – beim Start
+wird dann gewarnt. Ohne das Paket 'cryptography' ist der Snapshot deaktiviert –
+Tokens werden nie unverschlüsselt abgelegt.
+"""
+
+import json
+import mmap
+import os
+import threading
+import time
+from typing import Optional
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # optional
+    AESGCM = None
+
+from cloud.device_sync import smartphone_sync
+from cloud.token_cache import token_cache
+from config import DATA_DIR, OFFLINE_MAX_AGE_S, RCU_ID, SNAPSHOT_KEY_FILE
+
+SNAPSHOT_FILE = os.path.join(DATA_DIR, "snapshot.bin")
+KEY_FILE = SNAPSHOT_KEY_FILE
+MAGIC = b"RCUS"
+FORMAT = 1
+NONCE_LEN = 12
+HEADER_LEN = len(MAGIC) + 1 + NONCE_LEN
+
+
+class SnapshotStore:
+
+    def __init__(self, path: str = SNAPSHOT_FILE, key_file: str = KEY_FILE,
+                 max_age_s: float = OFFLINE_MAX_AGE_S):
+        self.path = path
+        self.key_file = key_file
+        self.max_age_s = max_age_s
+        self._aead = None
+        self._saved = None  # _state_key() beim letzten Speichern
+        self._lock = threading.Lock()
+        if AESGCM is None:
+            print("[Cloud] Paket 'cryptography' fehlt – lokaler Snapshot deaktiviert.")
+        elif not os.getenv("RCU_SNAPSHOT_KEY") and self._key_beside_snapshot():
+            print(f"[Cloud] WARNUNG: Snapshot-Schlüssel {self.key_file} liegt neben dem Snapshot – "
+                  f"RCU_SNAPSHOT_KEY oder RCU_SNAPSHOT_KEY_FILE außerhalb von DATA_DIR setzen.")
+
+    @property
+    def enabled(self) -> bool:
+        return AESGCM is not None
+
+    # ---------------------------------------------------------
+    # Schlüssel
+    # ---------------------------------------------------------
+    def _key_beside_snapshot(self) -> bool:
+        snapshot_dir = os.path.dirname(os.path.realpath(self.path))
+        key_path = os.path.realpath(self.key_file)
+        return os.path.commonpath([snapshot_dir, key_path]) == snapshot_dir
+
+    def _cipher(self, create: bool):
+        if self._aead is not None:
+            return self._aead
+        key_hex = os.getenv("RCU_SNAPSHOT_KEY")
+        if key_hex:
+            key = bytes.fromhex(key_hex.strip())
+        else:
+            try:
+                with open(self.key_file, "rb") as f:
+                    key = f.read()
+            except FileNotFoundError:
+                if not create:
+                    return None
+                key = AESGCM.generate_key(bit_length=256)
+                os.makedirs(os.path.dirname(self.key_file), exist_ok=True)
+                fd = os.open(self.key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(key)
+        if len(key) != 32:
+            raise ValueError("Snapshot-Schlüssel muss 32 Bytes lang sein")
+        self._aead = AESGCM(key)
+        return self._aead
+
+    @staticmethod
+    def _aad(header: bytes) -> bytes:
+        return header + RCU_ID.encode("utf-8")
+
+    # ---------------------------------------------------------
+    # Lesen / Schreiben
+    # ---------------------------------------------------------
+    def load(self) -> Optional[dict]:
+        """Snapshot lesen (mmap) und entschlüsseln; None, wenn fehlend, defekt oder zu alt."""
+        if not self.enabled:
+            return None
+        try:
+            aead = self._cipher(create=False)
+            if aead is None:
+                return None
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if len(mm) <= HEADER_LEN or mm[:len(MAGIC)] != MAGIC or mm[len(MAGIC)] != FORMAT:
+                    print("[Cloud] Snapshot hat unbekanntes Format – ignoriert.")
+                    return None
+                header = mm[:HEADER_LEN]
+                plain = aead.decrypt(header[len(MAGIC) + 1:], mm[HEADER_LEN:], self._aad(header))
+            state = json.loads(plain.decode("utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[Cloud] Snapshot nicht lesbar ({e}) – ignoriert.")
+            return None
+
+        age = time.time() - float(state.get("synced_at") or 0.0)
+        if age > self.max_age_s:
+            print(f"[Cloud] Snapshot ist {age / 3600:.1f} h alt (Limit {self.max_age_s / 3600:.1f} h) – ignoriert.")
+            return None
+        return state
+
+    def save(self, state: dict) -> bool:
+        if not self.enabled:
+            return False
+        try:
+            aead = self._cipher(create=True)
+            header = MAGIC + bytes([FORMAT]) + os.urandom(NONCE_LEN)
+            blob = header + aead.encrypt(header[len(MAGIC) + 1:], json.dumps(state).encode("utf-8"), self._aad(header))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            return True
+        except Exception as e:
+            print(f"[Cloud] Snapshot konnte nicht gespeichert werden: {e}")
+            return False
+
+    # ---------------------------------------------------------
+    # Anbindung an smartphone_sync / token_cache
+    # ---------------------------------------------------------
+    def restore(self) -> bool:
+        """Beim Start: Geräteliste und Offline-Tokens aus dem Snapshot übernehmen."""
+        state = self.load()
+        if state is None:
+            return False
+        restored = smartphone_sync.restore(state)
+        tokens = token_cache.restore(state.get("tokens") or {})
+        self._saved = self._state_key()
+        age_min = (time.time() - float(state.get("synced_at") or 0.0)) / 60.0
+        print(f"[Cloud] Snapshot geladen: {len(state.get('smartphones') or [])} Smartphones, "
+              f"{tokens} Tokens (Stand vor {age_min:.0f} min).")
+        return restored
+
+    @staticmethod
+    def _state_key():
+        # synced_at grob mitzählen, damit ein bestätigter (304) Stand nicht veraltet gespeichert bleibt
+        return (smartphone_sync.revision, token_cache.generation, int(smartphone_sync.synced_at // 600))
+
+    def persist(self) -> bool:
+        """Speichert, falls sich Geräteliste oder Tokens seit dem letzten Speichern geändert haben."""
+        if not self.enabled or not smartphone_sync.loaded:
+            return False
+        with self._lock:
+            current = self._state_key()
+            if current == self._saved:
+                return False
+            state = smartphone_sync.export()
+            state["tokens"] = token_cache.export()
+            state["saved_at"] = time.time()
+            if self.save(state):
+                self._saved = current
+                return True
+            return False
+
+
+snapshot_store = SnapshotStore()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /cloud/sse.py
+
+import asyncio
+import contextlib
+import random
+import ssl
+import time
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+from cloud.http_client import cloud_client
+from telemetry import log
+
+CONNECT_TIMEOUT_S = 5.0
+IDLE_TIMEOUT_S = 15.0      # keine Daten/Heartbeats so lange -> Verbindung gilt als hängend
+MAX_FAILURES = 4           # aufeinanderfolgende Fehlversuche bis zum Failsafe
+MAX_IDLE_RECONNECTS = 3    # Reconnects wegen Idle ohne ein einziges empfangenes Byte
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 8.0
+
+
+class SSEConnectionLost(RuntimeError):
+    """Stream nach allen Wiederholungsversuchen nicht wiederherstellbar."""
+    pass
+
+
+class SSEHttpError(RuntimeError):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, event: str = "message", data: str = "", id: Optional[str] = None):
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def __repr__(self):
+        return f"SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})"
+
+
+class SSEParser:
+    """
+    Inkrementeller Parser nach dem text/event-stream-Format:
+    'event:', 'id:', mehrzeiliges 'data:', Kommentare (':') und 'retry:'.
+    feed() bekommt eine Zeile ohne Zeilenende und liefert ein Event, sobald
+    eine Leerzeile das Event abschließt.
+    """
+
+    def __init__(self):
+        self.last_event_id: Optional[str] = None
+        self.retry_ms: Optional[int] = None
+        self._event = ""
+        self._data = []
+
+    def feed(self, line: str) -> Optional[SSEEvent]:
+        if not line:
+            return self._dispatch()
+        if line.startswith(":"):
+            return None  # Kommentar / Heartbeat
+
+        field, sep, value = line.partition(":")
+        if sep and value.startswith(" "):
+            value = value[1:]
+
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        elif field == "id":
+            if "\0" not in value:
+                self.last_event_id = value
+        elif field == "retry":
+            if value.isdigit():
+                self.retry_ms = int(value)
+        return None
+
+    def reset(self) -> None:
+        """Halbes Event eines abgebrochenen Streams verwerfen (Last-Event-ID und retry bleiben)."""
+        self._event = ""
+        self._data = []
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        if not self._data:
+            self._event = ""
+            return None
+        ev = SSEEvent(self._event or "message", "\n".join(self._data), self.last_event_id)
+        self._event = ""
+        self._data = []
+        return ev
+
+
+class SSEClient:
+    """
+    Asynchroner SSE-Client direkt auf asyncio-Streams (kein Thread pro Stream).
+    - setzt nach Abbrüchen mit Last-Event-ID fort
+    - Idle-Timeout (keine Bytes, auch keine Heartbeats) -> stiller Reconnect,
+      erst nach MAX_IDLE_RECONNECTS stummen Verbindungen in Folge Failsafe
+    - harte Fehler (Verbindung, HTTP-Status) und regulär beendete Streams ohne
+      ein Event -> Backoff mit Jitter, nach MAX_FAILURES in Folge SSEConnectionLost
+    - auch nach einem regulären Ende mit Events wird kurz gewartet (retry: bzw.
+      BACKOFF_BASE_S), damit ein Server, der sofort schließt, keinen engen
+      Reconnect-Loop erzeugt
+
+    Bewusst nicht über die requests-Session von cloud_client: ein Stream mit
+    stream=True blockiert für die ganze Entsperr-/Remote-Dauer einen Thread, und
+    iter_lines() lässt sich vom Event-Loop aus weder abbrechen noch mit einem
+    Idle-Timeout versehen. Geteilt werden nur Basis-URL (cloud_client.url) und
+    Statistik (cloud_client.record). Einschränkung: keine Redirects, keine
+    Proxy-Unterstützung (HTTP(S)_PROXY) – der SSE-Endpunkt muss direkt erreichbar sein.
+    """
+
+    def __init__(self, path: str, idle_timeout: float = IDLE_TIMEOUT_S,
+                 connect_timeout: float = CONNECT_TIMEOUT_S, max_failures: int = MAX_FAILURES,
+                 headers: Optional[Dict[str, str]] = None):
+        self.url = cloud_client.url(path)
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.max_failures = max_failures
+        self.headers = headers or {}
+        self.parser = SSEParser()
+        self.stats = {"connects": 0, "idle_timeouts": 0, "failures": 0, "events": 0}
+        self._saw_data = False
+
+    async def events(self) -> AsyncIterator[SSEEvent]:
+        failures = 0
+        idle = 0
+        while True:
+            self._saw_data = False
+            received = self.stats["events"]
+            cause = None
+            try:
+                async for ev in self._stream():
+                    self.stats["events"] += 1
+                    yield ev
+                if self.stats["events"] > received:
+                    # Server hat den Stream nach Events regulär beendet -> kurz warten, fortsetzen
+                    failures = 0
+                    await asyncio.sleep(self._backoff(1))
+                    continue
+                # Regulär beendet, aber kein einziges Event: zählt als Fehlversuch
+                failures += 1
+                error = "Stream ohne Events beendet"
+            except asyncio.TimeoutError:
+                self.stats["idle_timeouts"] += 1
+                idle = 1 if self._saw_data else idle + 1
+                if idle > MAX_IDLE_RECONNECTS:
+                    raise SSEConnectionLost(f"{self.url}: {idle - 1} stumme Verbindungen in Folge")
+                log.cloud.info("SSE: keine Daten seit %.0fs – verbinde neu.", self.idle_timeout, url=self.url)
+                continue
+            except (OSError, ConnectionError, SSEHttpError, asyncio.IncompleteReadError, ValueError) as e:
+                # ValueError: ungültige Chunk-Größe im Stream
+                if self._saw_data:
+                    failures = 0
+                failures += 1
+                error = cause = e
+
+            self.stats["failures"] += 1
+            if failures >= self.max_failures:
+                raise SSEConnectionLost(f"{self.url}: {error}") from cause
+            delay = self._backoff(failures)
+            log.cloud.warning("SSE-Verbindungsfehler (%s) – Versuch %d/%d, neuer Versuch in %.1fs.",
+                              error, failures, self.max_failures, delay, url=self.url)
+            await asyncio.sleep(delay)
+
+    def _backoff(self, failures: int) -> float:
+        if self.parser.retry_ms is not None and failures == 1:
+            return self.parser.retry_ms / 1000.0
+        cap = min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** (failures - 1)))
+        return random.uniform(cap / 2, cap)  # Jitter, damit viele RCUs nicht gleichzeitig anklopfen
+
+    async def _stream(self) -> AsyncIterator[SSEEvent]:
+        parts = urlsplit(self.url)
+        secure = parts.scheme == "https"
+        host = parts.hostname
+        port = parts.port or (443 if secure else 80)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        start = time.monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=ssl.create_default_context() if secure else None),
+                self.connect_timeout,
+            )
+        except asyncio.TimeoutError as e:
+            cloud_client.record("sse", time.monotonic() - start, error=True)
+            raise ConnectionError(f"Verbindungsaufbau > {self.connect_timeout}s") from e
+
+        try:
+            headers = {
+                "Host": parts.netloc,
+                "Accept": "text/event-stream",
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+            }
+            headers.update(self.headers)
+            if self.parser.last_event_id is not None:
+                headers["Last-Event-ID"] = self.parser.last_event_id
+            request = f"GET {target} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+            writer.write(request.encode("latin-1"))
+            await writer.drain()
+
+            try:
+                status_line = await asyncio.wait_for(reader.readline(), self.connect_timeout)
+                response_headers = await self._read_headers(reader)
+            except asyncio.TimeoutError as e:
+                # Keine Antwort auf den Request ist ein harter Fehler, kein Idle
+                cloud_client.record("sse", time.monotonic() - start, error=True)
+                raise ConnectionError(f"Keine HTTP-Antwort nach {self.connect_timeout}s") from e
+            status = _parse_status(status_line)
+            cloud_client.record("sse", time.monotonic() - start, error=status != 200)
+            if status != 200:
+                raise SSEHttpError(status)
+            self.stats["connects"] += 1
+
+            chunked = "chunked" in response_headers.get("transfer-encoding", "").lower()
+            async for line in self._iter_lines(reader, chunked):
+                ev = self.parser.feed(line)
+                if ev is not None:
+                    yield ev
+        finally:
+            self.parser.reset()
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def _read_headers(self, reader) -> Dict[str, str]:
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.connect_timeout)
+            if not line:
+                raise ConnectionError("Verbindung während der Header geschlossen")
+            line = line.decode("latin-1").strip()
+            if not line:
+                return headers
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def _iter_lines(self, reader, chunked: bool) -> AsyncIterator[str]:
+        buffer = b""
+        while True:
+            if chunked:
+                size_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                if not size_line:
+                    return
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    return
+                data = await asyncio.wait_for(reader.readexactly(size + 2), self.idle_timeout)
+                data = data[:-2]
+            else:
+                data = await asyncio.wait_for(reader.read(4096), self.idle_timeout)
+                if not data:
+                    return
+
+            buffer += data
+            while True:
+                idx = buffer.find(b"\n")
+                if idx < 0:
+                    break
+                line, buffer = buffer[:idx], buffer[idx + 1:]
+                self._saw_data = True
+                yield line.rstrip(b"\r").decode("utf-8", errors="replace")
+
+
+def _parse_status(status_line: bytes) -> int:
+    try:
+        return int(status_line.split()[1])
+    except (IndexError, ValueError):
+        raise ConnectionError(f"Ungültige Statuszeile: {status_line!r}")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /cloud/token_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+from cloud.token_client import fetch_token_by_numeric_id, CloudError
+from config import OFFLINE_MAX_AGE_S
+
+TOKEN_TTL_S = 300.0      # Token gilt lokal 5 min als frisch
+TOKEN_CACHE_MAX = 1024   # max. Anzahl gecachter Tokens (LRU)
+PREFETCH_WORKERS = 4
+
+
+class TokenCache:
+    """
+    Token-Cache pro numerischer Device-ID mit TTL, LRU-Begrenzung und
+    Hintergrund-Prefetch. Laufende Prefetches werden von get() mitbenutzt,
+    sodass pro ID nie zwei Requests gleichzeitig laufen.
+    Zusätzlich bleibt pro ID das zuletzt erhaltene Token mit Wanduhr-Zeitpunkt
+    erhalten (Offline-Betrieb, lokaler Snapshot – siehe cloud/snapshot.py).
+    """
+
+    def __init__(self, ttl_s: float = TOKEN_TTL_S, max_size: int = TOKEN_CACHE_MAX):
+        self.ttl_s = ttl_s
+        self.max_size = max_size
+        self._tokens = OrderedDict()  # id -> (token_hex, fetched_at)
+        self._pending = {}            # id -> Future
+        self._offline = {}            # id -> (token_hex, time.time() beim Abruf)
+        self.generation = 0           # steigt bei jeder Änderung (Snapshot speichern)
+        self._id_generation: Dict[int, int] = {}  # id -> Zähler der invalidate()-Aufrufe
+        self._epoch = 0               # steigt bei invalidate() ohne ID
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="token-prefetch")
+
+    def peek(self, device_numeric_id: int) -> Optional[str]:
+        """Liefert ein frisches Token aus dem Cache oder None (kein Request)."""
+        with self._lock:
+            item = self._tokens.get(device_numeric_id)
+            if item is None:
+                return None
+            token_hex, fetched_at = item
+            if time.monotonic() - fetched_at > self.ttl_s:
+                del self._tokens[device_numeric_id]
+                return None
+            self._tokens.move_to_end(device_numeric_id)
+            return token_hex
+
+    def get(self, device_numeric_id: int, timeout_s: float = 4.0) -> str:
+        """Token aus dem Cache, sonst (laufenden) Request abwarten. Wirft CloudError."""
+        device_numeric_id = int(device_numeric_id)
+        token_hex = self.peek(device_numeric_id)
+        if token_hex is not None:
+            return token_hex
+        return self._submit(device_numeric_id).result(timeout=timeout_s + 1.0)
+
+    def put(self, device_numeric_id: int, token_hex: str) -> None:
+        with self._lock:
+            self._put_locked(int(device_numeric_id), token_hex)
+
+    def _put_locked(self, device_numeric_id: int, token_hex: str) -> None:
+        self._tokens[device_numeric_id] = (token_hex, time.monotonic())
+        self._tokens.move_to_end(device_numeric_id)
+        while len(self._tokens) > self.max_size:
+            self._tokens.popitem(last=False)
+        previous = self._offline.get(device_numeric_id)
+        self._offline[device_numeric_id] = (token_hex, time.time())
+        if previous is None or previous[0] != token_hex:
+            self.generation += 1
+
+    def offline_token(self, device_numeric_id: int, max_age_s: float = OFFLINE_MAX_AGE_S) -> Optional[str]:
+        """Letztes bekanntes Token, solange es nicht älter als max_age_s ist (Cloud nicht erreichbar)."""
+        with self._lock:
+            item = self._offline.get(int(device_numeric_id))
+        if item is None or time.time() - item[1] > max_age_s:
+            return None
+        return item[0]
+
+    def export(self) -> dict:
+        """Offline-Tokens für den Snapshot: {id: [token_hex, abgerufen_um]}."""
+        with self._lock:
+            return {str(k): [v[0], v[1]] for k, v in self._offline.items()}
+
+    def restore(self, tokens: dict) -> int:
+        """Übernimmt Offline-Tokens aus dem Snapshot (ohne den frischen Cache zu füllen)."""
+        restored = 0
+        with self._lock:
+            for key, (token_hex, fetched_at) in tokens.items():
+                current = self._offline.get(int(key))
+                if current is None or current[1] < fetched_at:
+                    self._offline[int(key)] = (token_hex, float(fetched_at))
+                    restored += 1
+        return restored
+
+    def prefetch(self, device_numeric_ids: Iterable[int]) -> int:
+        """Startet Hintergrund-Requests für alle IDs ohne frisches Token. Rückgabe: Anzahl gestartet."""
+        started = 0
+        for device_numeric_id in device_numeric_ids:
+            device_numeric_id = int(device_numeric_id)
+            if self.peek(device_numeric_id) is None:
+                self._submit(device_numeric_id)
+                started += 1
+        return started
+
+    def invalidate(self, device_numeric_id: Optional[int] = None) -> None:
+        """
+        Verwirft ein Token (oder alle, wenn keine ID angegeben ist). Ein bereits
+        laufender Request für die ID wird nicht mehr mitbenutzt, sein Ergebnis
+        nicht gecacht – er könnte noch das alte Token liefern.
+        """
+        with self._lock:
+            if device_numeric_id is None:
+                self._tokens.clear()
+                self._offline.clear()
+                self._pending.clear()
+                self._epoch += 1
+            else:
+                device_numeric_id = int(device_numeric_id)
+                self._tokens.pop(device_numeric_id, None)
+                self._offline.pop(device_numeric_id, None)
+                self._pending.pop(device_numeric_id, None)
+                self._id_generation[device_numeric_id] = self._id_generation.get(device_numeric_id, 0) + 1
+            self.generation += 1
+
+    def _stamp(self, device_numeric_id: int):
+        return self._epoch, self._id_generation.get(device_numeric_id, 0)
+
+    def fetch_future(self, device_numeric_id: int) -> Future:
+        """Future des (ggf. bereits laufenden) Requests für diese ID."""
+        return self._submit(int(device_numeric_id))
+
+    def _submit(self, device_numeric_id: int) -> Future:
+        with self._lock:
+            fut = self._pending.get(device_numeric_id)
+            if fut is None or fut.cancelled():
+                fut = self._executor.submit(self._fetch, device_numeric_id, self._stamp(device_numeric_id))
+                self._pending[device_numeric_id] = fut
+            return fut
+
+    def _fetch(self, device_numeric_id: int, stamp) -> str:
+        token_hex = None
+        try:
+            token_hex = fetch_token_by_numeric_id(device_numeric_id)
+            return token_hex
+        finally:
+            with self._lock:
+                # Während des Requests invalidiert -> Ergebnis nicht cachen; der
+                # Pending-Eintrag gehört dann ggf. schon einem neuen Request
+                if self._stamp(device_numeric_id) == stamp:
+                    self._pending.pop(device_numeric_id, None)
+                    if token_hex is not None:
+                        self._put_locked(device_numeric_id, token_hex)
+
+
+token_cache = TokenCache()
+
+
+def get_token(device_numeric_id: int) -> str:
+    """Wie fetch_token_by_numeric_id, aber über den Cache."""
+    try:
+        return token_cache.get(device_numeric_id)
+    except CloudError:
+        raise
+    except Exception as e:
+        raise CloudError(f"Token GET failed for id={device_numeric_id}: {e}") from e
@@ -5,13 +5,14 @@
 import os
 import requests
 from config import CLOUD_URL
+from cloud.http_client import cloud_client
 
 
 class CloudError(RuntimeError):
     pass
 
 
-def fetch_token_by_numeric_id(device_numeric_id: int, timeout_s: float = 4.0) -> str:
+def fetch_token_by_numeric_id(device_numeric_id: int, timeout_s: float = None) -> str:
     """
     GET /api/devices/token/{id}
     Erwartet entweder {"token":"<hex>"} oder {"auth_token":"<hex>"} oder Plain-Text "<hex>".
@@ -19,7 +20,7 @@ def fetch_token_by_numeric_id(device_numeric_id: int, timeout_s: float = 4.0) ->
     """
     url = f"{CLOUD_URL}/api/devices/token/{device_numeric_id}"
     try:
-        r = requests.get(url, headers={"Accept": "application/json"}, timeout=timeout_s)
+        r = cloud_client.get("token", url, headers={"Accept": "application/json"}, timeout=timeout_s)
         r.raise_for_status()
     except requests.RequestException as e:
         raise CloudError(f"Token GET failed for id={device_numeric_id}: {e}") from e
@@ -1,3 +1,23 @@
 # config.py
-CLOUD_URL = "http://10.42.0.1:8080"
-RCU_ID = "A116G6"
\ No newline at end of file
+import os
+
+# Überschreibbar (z. B. lokaler Ersatz-Server aus bench/cloud_server.py)
+CLOUD_URL = os.getenv("RCU_CLOUD_URL", "http://10.42.0.1:8080")
+RCU_ID = "A116G6"
+
+# Lokale Laufzeitdaten (Outbox-Spool, Caches)
+DATA_DIR = os.getenv("RCU_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# Schlüssel des lokalen Snapshots (cloud/snapshot.py) – außerhalb von DATA_DIR bereitstellen:
+# RCU_SNAPSHOT_KEY (Hex, 32 Bytes) oder RCU_SNAPSHOT_KEY_FILE (z. B. auf einer eigenen
+# Partition/TPM-gestützt). Fehlt beides, wird der Schlüssel neben dem Snapshot in
+# DATA_DIR erzeugt – wer DATA_DIR kopiert, kann dann auch die Tokens entschlüsseln.
+SNAPSHOT_KEY_FILE = os.getenv("RCU_SNAPSHOT_KEY_FILE", os.path.join(DATA_DIR, "snapshot.key"))
+
+# Wie lange (s) ohne Cloud-Kontakt noch mit lokalem Snapshot (Geräte + Tokens) entsperrt werden darf
+OFFLINE_MAX_AGE_S = float(os.getenv("RCU_OFFLINE_MAX_AGE", str(24 * 3600)))
+
+# Unlocked-Mode: automatisch verriegeln, wenn der geglättete RSSI des Telefons
+# so lange (s) unter dieser Schwelle (dBm) liegt bzw. das Telefon nicht mehr gesehen wird
+AUTO_LOCK_RSSI = float(os.getenv("RCU_AUTO_LOCK_RSSI", "-80"))
+AUTO_LOCK_HOLD_S = float(os.getenv("RCU_AUTO_LOCK_HOLD", "20"))
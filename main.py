@@ -1,59 +1,139 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os 
 import sys
 import signal
 import asyncio
-import importlib
+import time
 from ble import central
-from ble import gatt_client
-from ble.gatt_client import perform_challenge_response
+from ble.registry import registry
+from ble.gatt_client import authenticate
 from ble.gatt_client import send_unlock_status
+from ble.presence import presence, ensure_scanning
+from ble.connection import connection_manager
+from ble.auth_scheduler import auth_scheduler
+from ble.recovery import recover_or_restart, restart_process
+from ble.rssi_filter import rssi_estimator
 from rcu_io.DIO6 import dio6_set
-from bleak import BleakScanner
-from config import CLOUD_URL
 from config import RCU_ID
+from config import OFFLINE_MAX_AGE_S
 
-from cloud.api_client import get_assigned_smartphones  
-from cloud.token_client import fetch_token_by_numeric_id, CloudError 
+from cloud.device_sync import smartphone_sync
+from cloud.token_client import CloudError
+from cloud.token_cache import token_cache
+from cloud.async_api import run_cloud, check_remote_mode_async, get_token_async
+from cloud.snapshot import snapshot_store
 from cloud.notify import notify_rcu_event       
-from cloud.remote_check import check_remote_mode
-from auth.challenge import set_shared_key_hex
+from auth.challenge import key_store
 from unlocked.unlocked_mode import start_unlocked_mode
+from unlocked.distance_check import rcu_advertiser
 from remote.remote_mode import start_remote_mode
+from telemetry import log, tracing
+from telemetry.tracing import span
 
 
 
-# RSSI-Schwelle für Freigabe (z. B. Gerät in Reichweite)
-RSSI_THRESHOLD = -65  # dBm
-RSSI_INTERVAL = 2      # Sekunden zwischen RSSI-Abfragen
+# Freigabe-Schwellen (ENTER/EXIT): siehe ble/rssi_filter.py
+RSSI_INTERVAL = 2      # Wartezeit nach fehlgeschlagener Entsperr-Nachricht
+RSSI_SAMPLE_TIMEOUT = 2  # Sekunden ohne Advertisement -> "nicht gefunden"
+RSSI_POLL_INTERVAL = 1.0  # max. Wartezeit auf ein Advertisement, bevor der Link-RSSI gelesen wird
 RETRY_DELAY = 5       # Zeit zum Programm Neustart      
 TIMEOUT = 5    # Scanning Zeit
 
 NOT_FOUND = 3  # Versuche nach Authent. zum Neustart
 
-async def monitor_rssi(address: str, selected_device_name, matched_device_id):
+async def sample_rssi(address: str):
+    """Ein RSSI-Messwert: nächstes Advertisement, bei Funkstille über den offenen Auth-Link."""
+    if connection_manager.is_connected(address):
+        # Telefone advertisen meist auch bei offenem Link weiter – das kostet nichts.
+        # Erst wenn keins kommt, den Link-RSSI lesen (btmgmt-Prozess, gedrosselt).
+        entry = await presence.wait_for(address, timeout=RSSI_POLL_INTERVAL)
+        if entry is not None:
+            return entry.rssi
+        return await connection_manager.read_rssi(address)
+    # Auf das nächste Advertisement des Geräts im Dauer-Scanner warten
+    entry = await presence.wait_for(address, timeout=RSSI_SAMPLE_TIMEOUT)
+    return entry.rssi if entry else None
+
+
+async def wait_until_near(address: str) -> bool:
+    """
+    Wartet, bis das (authentifizierte) Telefon die Entsperr-Schwelle erreicht.
+    False, wenn es NOT_FOUND-mal in Folge nicht mehr gemessen wurde.
+    """
+    rssi_estimator.reset(address)
+    not_found_count = 0
+    while not_found_count < NOT_FOUND:
+        rssi_value = await sample_rssi(address)
+        if rssi_value is None:
+            not_found_count += 1
+            continue
+        not_found_count = 0
+        if rssi_estimator.update(address, rssi_value).near:
+            return True
+    return False
+
+
+async def authenticate_candidate(candidate):
+    """
+    Eine Sitzung des Auth-Schedulers: Token holen, Challenge-Response mit dem
+    Key dieses Geräts, danach auf die Entsperr-Schwelle warten.
+    Rückgabe: Registry-Eintrag des Gewinners oder None.
+    """
+    device, matched_device_id, _ = candidate
+    matched_entry = registry.by_device_id(matched_device_id)
+    if matched_entry is None:
+        # Liste wurde während des Scans ausgetauscht und das Gerät entfernt
+        print(f"[RCU] deviceId {matched_device_id} nicht mehr autorisiert – überspringe.")
+        return None
+    registry.note_address(device.address, matched_entry)
+
+    try: 
+        token_hex = await get_token_async(int(matched_entry.id))
+        print(f"[CLOUD] Token für {device.name} erhalten (id={matched_entry.id}).")
+    except CloudError as e:
+        print(f"[CLOUD] Kein Token für {device.name} erhalten: {e} – überspringe Verbindung.")
+        return None
+
+    key_store.set_hex(matched_entry.id, token_hex)  # Kontext wird nur bei neuem Token neu aufgebaut
+    session = await authenticate(device, key_id=matched_entry.id)  # Dauer-Scanner läuft weiter
+
+    if not session.ok:
+        print(f"Authentifizierung von {device.address} fehlgeschlagen – Zugang verweigert.")
+        if session.response is not None: # Falls doch ein Response erhalten wurde -> Fehler notify
+            token_cache.invalidate(matched_entry.id)  # Token evtl. rotiert -> beim nächsten Mal neu laden
+            key_store.remove(matched_entry.id)
+            notify_rcu_event(RCU_ID, device.name, matched_device_id, 'Zugang verweigert')
+        return None
+
+    print(f"Authentifizierung von {device.address} erfolgreich.")
+    notify_rcu_event(RCU_ID, device.name, matched_device_id, 'Zugang autorisiert')
+    if not await wait_until_near(device.address):
+        print(f"{device.address} hat die Entsperr-Schwelle nicht erreicht – Slot frei.")
+        await connection_manager.release(device.address)
+        return None
+    return matched_entry
+
+
+async def monitor_rssi(address: str, selected_device_name, matched_device_id, reset: bool = True):
     """Überwacht die Signalstärke und steuert DIO6 entsprechend."""
-    print(f"Starte RSSI-Überwachung für {address} (Schwelle: {RSSI_THRESHOLD} dBm)")
+    print(f"Starte RSSI-Überwachung für {address} (nah ab {rssi_estimator.enter} dBm, fern unter {rssi_estimator.exit} dBm)")
 
     not_found_count = 0  # Zähler für aufeinanderfolgende Nicht-Funde
+    if reset:
+        rssi_estimator.reset(address)  # neue Sitzung, keine alten Schätzwerte
 
     while True:
         try:
-            # Kurzen Scan durchführen, um aktuellen RSSI des bekannten Geräts zu ermitteln
-            devices = await BleakScanner.discover(timeout=2)
-            rssi_value = None
-
-            for d in devices:
-                if d.address.lower() == address.lower():
-                    rssi_value = d.rssi
-                    break
+            rssi_value = await sample_rssi(address)
 
             if rssi_value is not None:
-                print(f"Aktueller RSSI: {rssi_value} dBm")
+                estimate = rssi_estimator.update(address, rssi_value)
+                log.ble.info("Aktueller RSSI: %d dBm (geglättet %.1f dBm, Konfidenz %.2f)",
+                             rssi_value, estimate.rssi, estimate.confidence, key=address, every=1.0)
 
-                if rssi_value > RSSI_THRESHOLD:
+                # Entscheidung auf dem geglätteten Wert mit Hysterese statt Einzelmessung
+                if estimate.near:
                     success = await send_unlock_status(address)
                     if success: 
                         notify_rcu_event(RCU_ID, selected_device_name, matched_device_id, 'Entriegelt')
@@ -63,19 +143,19 @@ async def monitor_rssi(address: str, selected_device_name, matched_device_id):
                     else: 
                         print(f"Maschine bleibt verriegelt") # Erneut versuchen Nachricht an Smartphone
                         dio6_set(1) 
+                        await asyncio.sleep(RSSI_INTERVAL)  # nicht sofort neu verbinden
                 else:
                     dio6_set(1)  # rot -> zu weit entfernt
                 not_found_count = 0  # Zähler zurücksetzen
             else:
-                print("Gerät im Scan nicht gefunden – vermutlich außer Reichweite.")
+                log.ble.warning("Gerät %s im Scan nicht gefunden – vermutlich außer Reichweite.", address)
                 dio6_set(1)  # Sicherheit: rot
                 not_found_count += 1
 
                 if not_found_count >= NOT_FOUND:
-                    print("Gerät 3x in Folge nicht gefunden – starte Programm neu.")
-                    os.execv(sys.executable, [sys.executable] + sys.argv)
-
-            await asyncio.sleep(RSSI_INTERVAL)
+                    print("Gerät 3x in Folge nicht gefunden – setze BLE-Stack zurück.")
+                    await recover_or_restart("Gerät nicht gefunden")
+                    return False  # zurück in den Main Loop, neuer Scan
 
         except Exception as e:
             print(f"Fehler beim RSSI-Check: {e}")
@@ -84,57 +164,85 @@ async def monitor_rssi(address: str, selected_device_name, matched_device_id):
 
 def init_devices_from_cloud(rcu_id=RCU_ID):
     """
-    Lädt alle zugewiesenen Smartphones dieser RCU und deren Tokens.
-    Rückgabe: Liste autorisierter Geräte mit Feldern:
-        [
-            {"id": 2, "deviceId": "6f0e2d2f34a1f4f8", "token": "<hexstring>"},
-            ...
-        ]
-    Smartphones ohne gültiges Token werden übersprungen.
+    Lädt alle zugewiesenen Smartphones dieser RCU (bedingt, über smartphone_sync)
+    und übernimmt die aktiven in die Registry. Die Registry wird nur neu
+    aufgebaut, wenn sich der Cloud-Stand geändert hat (smartphone_sync.revision).
+    Rückgabe: registry
     """
     print(f"[RCU] Lade zugewiesene Smartphones für RCU {rcu_id} ...")
-    smartphones = get_assigned_smartphones(rcu_id=rcu_id, base_url=CLOUD_URL)
-    if not smartphones:
+    with span("init_devices_from_cloud") as s:
+        changed = smartphone_sync.sync()
+        s.set(changed=changed)
+        if changed is None:
+            s.fail()
+    if changed is None:
         raise RuntimeError("Keine Smartphones von der Cloud erhalten.")
 
-    authorized = []
-    for info in smartphones:
-        numeric_id = info.get("id")
-        device_id = info.get("deviceId")
-        status = info.get("status")
-        if not numeric_id or not device_id:
-            continue
-
-        if status == "active": 
-            authorized.append({
-                "id": numeric_id,
-                "deviceId": device_id,
-            })
+    if smartphone_sync.revision != registry.revision:
+        registry.update(smartphone_sync.smartphones(), smartphone_sync.revision)
 
-    if not authorized:
+    if not registry:
         raise RuntimeError("Keine aktive Smartphones vorhanden - Scannen wird übersprungen")
 
-    print(f"[CLOUD] {len(authorized)} autorisierte Geräte geladen.")
-    return authorized
+    return registry
 
 
 
+def _log_sync_result(task) -> None:
+    """Ergebnis des Hintergrund-Abgleichs abholen (sonst 'exception never retrieved')."""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[CLOUD] Abgleich der Geräteliste fehlgeschlagen: {task.exception()}")
+
+
 async def main():
 
     # Immer beim Keyboard Interrupt DIO -> 1 setzen
     def handle_sigint(signum, frame):
-        dio6_set(1)
+        dio6_set(1, wait=True)
         raise KeyboardInterrupt
 
     signal.signal(signal.SIGINT, handle_sigint)
+    log.install_dump_signal()  # kill -USR1 <pid> -> letzte Log-Einträge nach DATA_DIR/log
+
+    # Lokalen Snapshot laden: Scan kann sofort beginnen, die Cloud revalidiert im Hintergrund
+    if snapshot_store.restore():
+        registry.update(smartphone_sync.smartphones(), smartphone_sync.revision)
+
+    # Dauer-Scanner einmalig starten – speist die Anwesenheitstabelle
+    await ensure_scanning()
+    sync_task = None
 
     # --- MAIN-LOOP ---
     while True: 
+        tracing.new_attempt()  # Korrelations-ID für alle Spans dieses Durchlaufs
         dio6_set(1)
-        mode = check_remote_mode(RCU_ID)
-        if mode:
+
+        # Geräteliste revalidieren; läuft ein Abgleich noch, wird er weiterverwendet
+        if sync_task is None or sync_task.done():
+            sync_task = asyncio.ensure_future(run_cloud(init_devices_from_cloud))
+            sync_task.add_done_callback(_log_sync_result)
+
+        if registry and smartphone_sync.age() <= OFFLINE_MAX_AGE_S:
+            # Bekannter Stand (Snapshot oder letzter Abgleich) -> nicht auf die Cloud warten
+            mode = await check_remote_mode_async(RCU_ID)
+            devices_result = registry
+        else:
+            # Remote-Status und Geräteliste unabhängig voneinander -> parallel abfragen
+            mode, devices_result = await asyncio.gather(
+                check_remote_mode_async(RCU_ID),
+                asyncio.shield(sync_task),
+                return_exceptions=True,
+            )
+            if not isinstance(devices_result, BaseException) and smartphone_sync.age() > OFFLINE_MAX_AGE_S:
+                devices_result = RuntimeError("Offline-Limit überschritten – Geräteliste zu alt")
+        try:
+            await run_cloud(snapshot_store.persist)
+        except Exception as e:
+            # Snapshot ist nur Offline-Vorrat – ein Fehler darf die Schleife nicht beenden
+            log.cloud.warning("Snapshot konnte nicht gespeichert werden: %r", e)
+        if mode is True:
             print("Starte Remote Mode...")
-            start_remote_mode()
+            await start_remote_mode()
             print("Main Loop restartet")
             continue 
 
@@ -142,91 +250,92 @@ async def main():
 
         print("Starte Verbindungsversuch...")
 
-        try:
-            authorized_devices = init_devices_from_cloud()
-        except Exception as e:
-            print(f"Cloud Verbindung fehlgeschlagen: {e}")
+        if isinstance(devices_result, BaseException):
+            print(f"Cloud Verbindung fehlgeschlagen: {devices_result}")
             dio6_set(1)
             await asyncio.sleep(RETRY_DELAY)
             continue
 
-        importlib.reload(central)
-        central.TARGET_DEVICE_BYTES_LIST = [bytes.fromhex(d["deviceId"]) for d in authorized_devices]
-        print(f"[RCU] {len(central.TARGET_DEVICE_BYTES_LIST)} autorisierte Geräte an central übergeben.")
+        # Tokens aller aktiven Geräte parallel zum Scan vorab laden
+        token_cache.prefetch(registry.ids())
 
 
     
-        selected_device, matched_device_id, scanner = await central.find_best_authorized_device(
-            central.TARGET_DEVICE_BYTES_LIST, timeout=TIMEOUT
-        )
-        # selected_device, scanner = await central.find_target_device_keep_scanning(timeout=10)
-        if not selected_device:
+        async with span("find_authorized_candidates", known=len(registry)) as s:
+            candidates = await central.find_authorized_candidates(registry.device_ids, timeout=TIMEOUT)
+            s.set(found=len(candidates))
+        selected_at = time.time()
+        if not candidates:
             print("Kein passendes Gerät gefunden. Neuer Versuch in wenigen Sekunden...")
             dio6_set(1)
             await asyncio.sleep(RETRY_DELAY)
             continue
 
-        print(f"Verwende Gerät: {selected_device.name or 'N/A'} ({selected_device.address})") # z.B. Xiaomi 14T Pro (5A:74:B4:51:A5:A0)
-        print(f"[RCU] matched deviceId: {matched_device_id}")  # z.B. 6f0e2d2f34a1f4f8
-
-        matched_entry = next((d for d in authorized_devices if d["deviceId"] == matched_device_id), None)
-        
-        try: 
-            token_hex = fetch_token_by_numeric_id(int(matched_entry["id"]))
-            print(f"[CLOUD] Token für {selected_device.name} erhalten (id={matched_entry['id']}).")
-        except CloudError as e:
-            print(f"[CLOUD] Kein Token für {selected_device.name} erhalten: {e} – überspringe Verbindung.")
+        # Mehrere Telefone parallel authentifizieren; das erste an der Schwelle gewinnt
+        try:
+            won = await auth_scheduler.run(candidates, authenticate_candidate)
+        except SystemExit as e:
+            if "org.bluez.GattService1" not in str(e):
+                raise
+            print("BlueZ-GattService-Fehler erkannt – setze BLE-Stack zurück ...")
             dio6_set(1)
-            await asyncio.sleep(RETRY_DELAY)
+            await recover_or_restart("org.bluez.GattService1")
             continue
 
-        set_shared_key_hex(token_hex)
-        print(f"[RCU] Shared Key für deviceId={matched_device_id} gesetzt.")
+        if not won:
+            print("Kein Telefon authentifiziert und in Reichweite – Zugang verweigert.")
+            dio6_set(1)  # rot
+            await asyncio.sleep(RETRY_DELAY)
+            continue
 
+        (selected_device, matched_device_id, _), matched_entry = won
+        # Name aus der Cloud-Liste bevorzugen – der BLE-Name fehlt im Advertisement oft
+        device_name = matched_entry.name or selected_device.name
+        print(f"Verwende Gerät: {device_name or 'N/A'} ({selected_device.address})") # z.B. Xiaomi 14T Pro (5A:74:B4:51:A5:A0)
+        print(f"[RCU] matched deviceId: {matched_device_id}")  # z.B. 6f0e2d2f34a1f4f8
+        print("Authentifizierung erfolgreich – Freigabe aktiv.")
         try:
-            success = await perform_challenge_response(selected_device)  # Scanner läuft noch
-        finally:
-            if scanner:
-                await scanner.stop()
-        # print(f"Verwende Gerät: {selected_device.name or 'N/A'} ({selected_device.address})")
-
-        # success = await perform_challenge_response(selected_device)
-
-        if success:
-            print("Authentifizierung erfolgreich – Freigabe aktiv.")
-            # dio6_set(0) sofort grün
-            notify_rcu_event(RCU_ID, selected_device.name, matched_device_id, 'Zugang autorisiert')
-            result = await monitor_rssi(selected_device.address, selected_device.name, matched_device_id)
+            async with span("monitor_rssi") as s:
+                # Schätzer nicht zurücksetzen: das Telefon ist bereits an der Schwelle
+                result = await monitor_rssi(selected_device.address, device_name, matched_device_id, reset=False)
+                s.set(unlocked=bool(result))
             if result:
-                start_unlocked_mode(selected_device.name, matched_device_id)
-            continue 
+                # Gesamtzeit: Kandidaten gefunden -> Relais geschaltet
+                tracing.record_span("time_to_unlock", selected_at, time.time() - selected_at)
+        finally:
+            # Auth-Link wird nach Entsperren bzw. Abbruch nicht mehr gebraucht
+            await connection_manager.release()
+        if result:
+            # Läuft als Task-Gruppe: Cloud-LOCK, Anwesenheit des Telefons (Auto-Lock) und Advertiser
+            await start_unlocked_mode(device_name, matched_device_id, selected_device.address)
+        continue 
 
-        else:
-            print("Authentifizierung fehlgeschlagen – Zugang verweigert.")
-            dio6_set(1)  # rot
-            if gatt_client.RESPONSE_STATUS: # Falls doch ein Response erhalten wurde -> Fehler notify
-                notify_rcu_event(RCU_ID, selected_device.name, matched_device_id, 'Zugang verweigert')
 
-            await asyncio.sleep(RETRY_DELAY)
-            continue
+async def run():
+    """main() mit Aufräumen: auch bei Ctrl+C/Fehler das Advertisement bei BlueZ abmelden."""
+    try:
+        await main()
+    finally:
+        await rcu_advertiser.close()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(run())
     except SystemExit as e:
         # Wenn der Exit-Code der bekannte BlueZ-Fehler ist → Neustart
         if "org.bluez.GattService1" in str(e):
+            # Letzte Stufe, falls der Fehler außerhalb des Main Loops auftritt
             print("BlueZ-GattService-Fehler erkannt – starte Programm neu ...")
-            os.execv(sys.executable, [sys.executable] + sys.argv)
+            restart_process()
         else:
             # andere SystemExit-Fälle normal beenden
             raise
     except KeyboardInterrupt:
-        dio6_set(1)  
+        dio6_set(1, wait=True)
         sys.exit(1)
     except Exception as e:
-        dio6_set(1)
+        dio6_set(1, wait=True)
         # andere Ausnahmen nur anzeigen
         print(f"Unerwarteter Fehler: {e}")
         raise
\ No newline at end of file
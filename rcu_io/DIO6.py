@@ -2,20 +2,152 @@
 # -*- coding: utf-8 -*-
 """
 io/output_control.py – Steuerung der DIO6-LED (rot/grün) über Test_owa4x
+
+Statt für jeden Schaltvorgang einen neuen Test_owa4x-Prozess zu starten, hält
+der DioDriver eine Sitzung dauerhaft offen und arbeitet die Befehle über eine
+Queue in einem Hintergrund-Thread ab. Aufrufer (auch aus async main) blockieren
+dadurch nicht mehr auf Prozessstart und Prompt.
 """
 
+import atexit
+import queue
+import threading
+import time
+
 import pexpect
 
-def dio6_set(value: int):
+from telemetry import log
+from telemetry.tracing import current_attempt, record_span
+
+DIO_COMMAND = "Test_owa4x"
+DIO_PROMPT = ">>"
+DIO_TIMEOUT = 5          # Sekunden pro Befehl / Prompt
+DIO_PIN = 6
+
+
+class DioDriver:
+    """Langlebige Test_owa4x-Sitzung mit Befehls-Queue und Latenzstatistik."""
+
+    def __init__(self, command: str = DIO_COMMAND, pin: int = DIO_PIN):
+        self.command = command
+        self.pin = pin
+        self._child = None
+        self._spawned = False
+        self._state = None  # zuletzt erfolgreich geschriebener Wert
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats = {"writes": 0, "skipped": 0, "errors": 0, "restarts": 0,
+                       "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+
+    # ---------------------------------------------------------
+    # Öffentliche API
+    # ---------------------------------------------------------
+    def set(self, value: int, wait: bool = False, timeout: float = DIO_TIMEOUT * 2):
+        """Stellt einen Schaltbefehl in die Queue. Mit wait=True wird auf die Ausführung gewartet."""
+        self._ensure_worker()
+        done = threading.Event() if wait else None
+        self._queue.put((int(value), done, current_attempt(), time.time()))
+        if done is not None:
+            done.wait(timeout)
+
+    def stats(self) -> dict:
+        """Kopie der Latenz-/Fehlerzähler (Zeiten in ms)."""
+        s = dict(self._stats)
+        s["avg_ms"] = s["total_ms"] / s["writes"] if s["writes"] else 0.0
+        s["state"] = self._state
+        return s
+
+    def close(self):
+        """Beendet die Sitzung sauber (EXIT an Test_owa4x)."""
+        child, self._child = self._child, None
+        if child is None:
+            return
+        try:
+            if child.isalive():
+                child.sendline("EXIT")
+        except Exception:
+            pass
+        try:
+            child.close(force=True)
+        except Exception:
+            pass
+
+    # ---------------------------------------------------------
+    # Worker
+    # ---------------------------------------------------------
+    def _ensure_worker(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="dio-driver", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            value, done, attempt, queued_at = self._queue.get()
+            try:
+                # Ausgang steht bereits auf dem gewünschten Wert -> nichts schreiben, kein Span
+                if value == self._state and self._child is not None and self._child.isalive():
+                    self._stats["skipped"] += 1
+                    continue
+                ok = self._apply(value)
+                # Span ab Einreihen: enthält auch die Wartezeit in der Queue
+                record_span("dio6_set", queued_at, time.time() - queued_at, ok=ok, attempt=attempt, value=value)
+            finally:
+                if done is not None:
+                    done.set()
+
+    def _apply(self, value: int):
+        # Ein Versuch + ein Versuch mit frisch gestarteter Sitzung
+        for attempt in (1, 2):
+            try:
+                start = time.monotonic()
+                self._write(value)
+                elapsed_ms = (time.monotonic() - start) * 1000.0
+                self._state = value
+                self._stats["writes"] += 1
+                self._stats["total_ms"] += elapsed_ms
+                self._stats["last_ms"] = elapsed_ms
+                self._stats["max_ms"] = max(self._stats["max_ms"], elapsed_ms)
+                log.io.debug("DIO%d gesetzt auf %d", self.pin, value, ms=round(elapsed_ms, 1))
+                return True
+            except Exception as e:
+                self._stats["errors"] += 1
+                self._state = None
+                self.close()
+                if attempt == 2:
+                    log.io.error("Fehler bei DIO%d_set(%d): %s", self.pin, value, e)
+        return False
+
+    def _write(self, value: int):
+        if self._child is None or not self._child.isalive():
+            self._spawn()
+        self._child.sendline(f"IOSet DIGOUT {self.pin} {value}")
+        self._child.expect(DIO_PROMPT)
+
+    def _spawn(self):
+        if self._spawned:
+            self._stats["restarts"] += 1
+        self.close()
+        child = pexpect.spawn(self.command, encoding="utf-8", timeout=DIO_TIMEOUT)
+        child.delaybeforesend = None  # pexpect wartet sonst 50 ms vor jedem sendline
+        child.expect(DIO_PROMPT)
+        self._child = child
+        self._spawned = True
+
+
+_driver = DioDriver()
+atexit.register(_driver.close)
+
+
+def dio6_set(value: int, wait: bool = False):
     """Setzt den Digital Output 6 auf 0 (aktiv/grün) oder 1 (inaktiv/rot)."""
-    try:
-        child = pexpect.spawn("Test_owa4x", encoding="utf-8", timeout=5)
-        child.expect(">>")
-        cmd = f"IOSet DIGOUT 6 {value}"
-        child.sendline(cmd)
-        child.expect(">>")
-        child.sendline("EXIT")
-        child.close(force=True)
-        print(f"DIO6 gesetzt auf {value}")
-    except Exception as e:
-        print(f"Fehler bei DIO6_set({value}): {e}")
+    _driver.set(value, wait=wait)
+
+
+def dio6_stats() -> dict:
+    """Latenzstatistik der DIO-Befehle (siehe DioDriver.stats)."""
+    return _driver.stats()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+telemetry/log.py – Strukturiertes Logging für die heißen Pfade
+Statt print() auf dem Event-Loop-Thread (Konsole/Flash blockieren) gehen
+Meldungen über eine Queue an einen Hintergrund-Thread; formatiert wird erst dort.
+  - Level pro Subsystem: log.ble, log.cloud, log.io, log.auth
+    RCU_LOG_LEVEL=info (Standard), RCU_LOG="ble=debug,cloud=warning"
+  - Drosselung wiederkehrender Meldungen: every=<s> pro key (unterdrückte werden
+    mitgezählt) oder sample=<Anteil>
+  - Ringpuffer der letzten RCU_LOG_RING Einträge aller Level (auch abgeschalteter
+    Debug-Meldungen), abrufbar per dump() bzw. SIGUSR1 -> DATA_DIR/log/ring-*.jsonl
+Ein abgeschalteter Debug-Aufruf kostet einen Vergleich und ein deque.append
+(ohne Ringpuffer nur den Vergleich).
+
+    from telemetry import log
+    log.ble.debug("Advertisement von %s", address, rssi=rssi, key=address, every=5.0)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import signal
+import sys
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from config import DATA_DIR
+
+DEBUG, INFO, WARNING, ERROR = logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR
+_LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "off": logging.CRITICAL + 1}
+
+DEFAULT_LEVEL = os.getenv("RCU_LOG_LEVEL", "info").lower()
+RING_SIZE = int(os.getenv("RCU_LOG_RING", "2000"))
+LOG_FILE = os.getenv("RCU_LOG_FILE")          # optional zusätzlich in Datei
+LOG_MAX_BYTES = 2 * 1024 * 1024
+LOG_BACKUPS = 2
+DUMP_DIR = os.path.join(DATA_DIR, "log")
+RATE_KEYS_MAX = 4096                          # begrenzt die Drossel-Tabelle (rotierende Adressen)
+
+_ring: Optional[deque] = deque(maxlen=RING_SIZE) if RING_SIZE > 0 else None
+_queue = queue.SimpleQueue()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _configured_levels() -> Dict[str, int]:
+    levels = {}
+    for item in os.getenv("RCU_LOG", "").split(","):
+        name, sep, level = item.partition("=")
+        if sep and level.strip().lower() in _LEVELS:
+            levels[name.strip().lower()] = _LEVELS[level.strip().lower()]
+    return levels
+
+
+def _render(record) -> str:
+    """'[TAG] Meldung k=v ...' – Bytes in Feldern als Hex."""
+    text = f"[{record.tag}] {record.getMessage()}"
+    if record.fields:
+        text += " " + " ".join(f"{k}={v.hex() if isinstance(v, (bytes, bytearray)) else v}"
+                               for k, v in record.fields.items())
+    if record.suppressed:
+        text += f" (+{record.suppressed} gleichartige unterdrückt)"
+    return text
+
+
+class _Formatter(logging.Formatter):
+    def format(self, record):
+        return _render(record)
+
+
+class _FileFormatter(logging.Formatter):
+    def format(self, record):
+        return f"{self.formatTime(record)} {record.levelname} {_render(record)}"
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Formatierung erst im Listener-Thread (Standard-QueueHandler formatiert im Aufrufer)
+        return record
+
+
+def _start_listener() -> None:
+    global _listener
+    if _listener is not None:
+        return
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(_Formatter())
+    handlers = [console]
+    if LOG_FILE:
+        try:
+            file_handler = logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+            file_handler.setFormatter(_FileFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"[LOG] Log-Datei {LOG_FILE} nicht nutzbar: {e}")
+    _listener = logging.handlers.QueueListener(_queue, *handlers)
+    _listener.start()
+
+
+class SubsystemLogger:
+    """Logger eines Subsystems; Level zur Laufzeit änderbar (set_level)."""
+
+    def __init__(self, name: str, tag: str, level: int):
+        self.name = name
+        self.tag = tag
+        self.level = level
+        self._logger = logging.getLogger(f"rcu.{name}")
+        self._logger.propagate = False
+        self._logger.setLevel(DEBUG)
+        self._logger.addHandler(_DeferredQueueHandler(_queue))
+        self._last: Dict[object, list] = {}  # key -> [letzte Ausgabe (monotonic), unterdrückt]
+
+    def set_level(self, level) -> None:
+        self.level = _LEVELS[level.lower()] if isinstance(level, str) else int(level)
+
+    def enabled(self, level: int = DEBUG) -> bool:
+        return level >= self.level
+
+    def _log(self, level: int, msg: str, args, key, every, sample, fields) -> None:
+        if _ring is not None:
+            _ring.append((time.time(), self.name, level, msg, args, fields))
+        if level < self.level:
+            return
+        if sample is not None and random.random() >= sample:
+            return
+        suppressed = 0
+        if every is not None:
+            k = msg if key is None else key
+            now = time.monotonic()
+            last = self._last.get(k)
+            if last is not None and now - last[0] < every:
+                last[1] += 1
+                return
+            if last is not None:
+                suppressed = last[1]
+            elif len(self._last) >= RATE_KEYS_MAX:
+                self._last.clear()
+            self._last[k] = [now, 0]
+        _start_listener()
+        record = self._logger.makeRecord(self._logger.name, level, self.name, 0, msg, args, None,
+                                         extra={"tag": self.tag, "fields": fields, "suppressed": suppressed})
+        self._logger.handle(record)
+
+    def debug(self, msg: str, *args, key=None, every: Optional[float] = None,
+              sample: Optional[float] = None, **fields) -> None:
+        self._log(DEBUG, msg, args, key, every, sample, fields)
+
+    def info(self, msg: str, *args, key=None, every: Optional[float] = None,
+             sample: Optional[float] = None, **fields) -> None:
+        self._log(INFO, msg, args, key, every, sample, fields)
+
+    def warning(self, msg: str, *args, key=None, every: Optional[float] = None,
+                sample: Optional[float] = None, **fields) -> None:
+        self._log(WARNING, msg, args, key, every, sample, fields)
+
+    def error(self, msg: str, *args, key=None, every: Optional[float] = None,
+              sample: Optional[float] = None, **fields) -> None:
+        self._log(ERROR, msg, args, key, every, sample, fields)
+
+
+_configured = _configured_levels()
+_default = _LEVELS.get(DEFAULT_LEVEL, INFO)
+
+ble = SubsystemLogger("ble", "BLE", _configured.get("ble", _default))
+cloud = SubsystemLogger("cloud", "CLOUD", _configured.get("cloud", _default))
+io = SubsystemLogger("io", "IO", _configured.get("io", _default))
+auth = SubsystemLogger("auth", "AUTH", _configured.get("auth", _default))
+
+SUBSYSTEMS = {"ble": ble, "cloud": cloud, "io": io, "auth": auth}
+
+
+# ---------------------------------------------------------
+# Ringpuffer
+# ---------------------------------------------------------
+def dump(path: Optional[str] = None) -> Optional[str]:
+    """Schreibt den Ringpuffer als JSONL (ältester Eintrag zuerst). Rückgabe: Pfad."""
+    if _ring is None:
+        return None
+    records = list(_ring)
+    if path is None:
+        path = os.path.join(DUMP_DIR, f"ring-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for ts, name, level, msg, args, fields in records:
+                try:
+                    text = msg % args if args else msg
+                except (TypeError, ValueError):
+                    text = f"{msg} {args}"
+                entry = {"ts": round(ts, 6), "sub": name, "level": logging.getLevelName(level), "msg": text}
+                if fields:
+                    entry.update({k: v.hex() if isinstance(v, (bytes, bytearray)) else v
+                                  for k, v in fields.items()})
+                f.write(json.dumps(entry, default=str) + "\n")
+    except OSError as e:
+        print(f"[LOG] Ringpuffer konnte nicht geschrieben werden: {e}")
+        return None
+    print(f"[LOG] {len(records)} Einträge nach {path} geschrieben.")
+    return path
+
+
+def install_dump_signal(signum: int = signal.SIGUSR1) -> None:
+    """Ringpuffer per Signal abrufen, z. B. 'kill -USR1 <pid>'."""
+    signal.signal(signum, lambda s, f: dump())
+
+
+def flush() -> None:
+    """Ausstehende Meldungen schreiben (beim Beenden)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(flush)
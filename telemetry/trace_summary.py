@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+telemetry/trace_summary.py – Auswertung der Span-Dateien aus telemetry/tracing.py
+
+    python3 -m telemetry.trace_summary [spans.jsonl] [--stage STAGE] [--ok-only]
+
+Gibt pro Stufe Anzahl, Fehler sowie p50/p95/p99/max (ms) aus. Rotierte
+Dateien (spans.jsonl.1, .2, ...) werden automatisch mit eingelesen.
+"""
+
+import argparse
+import glob
+import json
+import sys
+from collections import defaultdict
+
+from telemetry.tracing import TRACE_FILE
+
+
+def percentile(sorted_values, p: float) -> float:
+    """Perzentil mit linearer Interpolation (Werte müssen sortiert sein)."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _rotated(path: str):
+    """Rotierte Dateien (path.1 = jüngste) nach Nummer, älteste zuerst – .10 vor .2."""
+    numbered = []
+    for name in glob.glob(path + ".*"):
+        suffix = name[len(path) + 1:]
+        if suffix.isdigit():
+            numbered.append((int(suffix), name))
+    return [name for _, name in sorted(numbered, reverse=True)]
+
+
+def load_spans(path: str):
+    files = _rotated(path) + [path]
+    for name in files:
+        try:
+            with open(name, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def summarize(spans, ok_only: bool = False, stage=None) -> dict:
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    for s in spans:
+        name = s.get("stage")
+        if stage and name != stage:
+            continue
+        if not s.get("ok", True):
+            errors[name] += 1
+            if ok_only:
+                continue
+        durations[name].append(float(s.get("ms", 0.0)))
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="p50/p95/p99 pro Stufe der Entsperr-Pipeline")
+    parser.add_argument("path", nargs="?", default=TRACE_FILE)
+    parser.add_argument("--stage", help="nur diese Stufe auswerten")
+    parser.add_argument("--ok-only", action="store_true", help="fehlgeschlagene Spans nicht mitzählen")
+    args = parser.parse_args(argv)
+
+    summary = summarize(load_spans(args.path), ok_only=args.ok_only, stage=args.stage)
+    if not summary:
+        print(f"Keine Spans in {args.path} gefunden.")
+        return 1
+
+    print(f"{'Stufe':<32}{'n':>7}{'err':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, s in sorted(summary.items(), key=lambda kv: -kv[1]["p50"]):
+        print(f"{name:<32}{s['count']:>7}{s['errors']:>6}"
+              f"{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['max']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+telemetry/tracing.py – Leichtgewichtiges Tracing der Entsperr-Pipeline
+Jede Stufe (Cloud-Abfragen, Scan, Token, Challenge-Response, RSSI, Unlock,
+DIO) wird als Span mit Dauer und Korrelations-ID des Entsperrversuchs
+festgehalten. Geschrieben wird nicht-blockierend (QueueHandler) in eine
+rotierende JSONL-Datei; Auswertung mit telemetry/trace_summary.py.
+"""
+
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+import uuid
+from typing import Optional
+
+from config import DATA_DIR
+
+TRACE_ENABLED = os.getenv("RCU_TRACE", "1") != "0"
+TRACE_FILE = os.path.join(DATA_DIR, "trace", "spans.jsonl")
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_BACKUPS = 3
+
+_attempt_id: contextvars.ContextVar = contextvars.ContextVar("rcu_attempt_id", default=None)
+_logger: Optional[logging.Logger] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _get_logger() -> Optional[logging.Logger]:
+    """Richtet Logger + Queue-Listener beim ersten Span ein."""
+    global _logger, _listener
+    if _logger is not None:
+        return _logger
+    try:
+        os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS, encoding="utf-8")
+    except OSError as e:
+        print(f"[TRACE] Trace-Datei nicht nutzbar ({e}) – Tracing deaktiviert.")
+        disable()
+        return None
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    q = queue.SimpleQueue()
+    logger = logging.getLogger("rcu.trace")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.handlers.QueueHandler(q))
+    _listener = logging.handlers.QueueListener(q, file_handler)
+    _listener.start()
+    atexit.register(flush)
+    _logger = logger
+    return logger
+
+
+def disable() -> None:
+    global TRACE_ENABLED
+    TRACE_ENABLED = False
+
+
+def flush() -> None:
+    """
+    Schreibt ausstehende Spans (beim Beenden). Danach ist Tracing aus: ohne
+    Listener würden weitere Spans nur noch in der Queue liegen bleiben.
+    """
+    global _listener
+    disable()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _logger is not None:
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+
+
+# ---------------------------------------------------------
+# Korrelations-ID pro Entsperrversuch
+# ---------------------------------------------------------
+def new_attempt() -> str:
+    attempt = uuid.uuid4().hex[:12]
+    _attempt_id.set(attempt)
+    return attempt
+
+
+def current_attempt() -> Optional[str]:
+    return _attempt_id.get()
+
+
+# ---------------------------------------------------------
+# Spans
+# ---------------------------------------------------------
+def record_span(stage: str, start: float, duration_s: float, ok: bool = True,
+                attempt: Optional[str] = None, **attrs) -> None:
+    """Schreibt einen fertigen Span (start = time.time(), Dauer in Sekunden)."""
+    if not TRACE_ENABLED:
+        return
+    logger = _get_logger()
+    if logger is None:
+        return
+    record = {
+        "ts": round(start, 6),
+        "attempt": attempt if attempt is not None else _attempt_id.get(),
+        "stage": stage,
+        "ms": round(duration_s * 1000.0, 3),
+        "ok": ok,
+    }
+    if attrs:
+        record.update(attrs)
+    logger.info(json.dumps(record, default=str))
+
+
+class span:
+    """
+    Span als (async) Context-Manager:
+        with span("dio6_set"): ...
+        async with span("find_authorized_candidates") as s: s.set(hits=3)
+    Ausnahmen werden als ok=False verbucht und weitergereicht.
+    """
+    __slots__ = ("stage", "attrs", "ok", "_start", "_t0")
+
+    def __init__(self, stage: str, **attrs):
+        self.stage = stage
+        self.attrs = attrs
+        self.ok = True
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def fail(self) -> None:
+        self.ok = False
+
+    def __enter__(self):
+        self._start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if TRACE_ENABLED:
+            if exc_type is not None:
+                self.ok = False
+                self.attrs.setdefault("error", exc_type.__name__)
+            record_span(self.stage, self._start, time.perf_counter() - self._t0, self.ok, **self.attrs)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def traced(stage: str):
+    """Decorator für Coroutines: ganzer Aufruf als Span."""
+    def wrap(func):
+        @functools.wraps(func)
+        async def inner(*args, **kwargs):
+            with span(stage):
+                return await func(*args, **kwargs)
+        return inner
+    return wrap
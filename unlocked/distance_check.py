@@ -1,14 +1,13 @@
 # unlocked/distance_check.py
 
-import threading
 import asyncio
-from dbus_fast import BusType, Variant
+from dbus_fast import BusType, DBusError, Variant
 from dbus_fast.aio import MessageBus
 from dbus_fast.service import ServiceInterface, method, dbus_property, PropertyAccess
+from ble.adapters import adapter_pool
 from config import RCU_ID
 
 BLUEZ_SERVICE_NAME = "org.bluez"
-ADAPTER_PATH = "/org/bluez/hci0"
 AD_MANAGER_IF = "org.bluez.LEAdvertisingManager1"
 
 
@@ -29,6 +28,7 @@ class RcuAdvertisement(ServiceInterface):
         }
 
         self.service_uuids = ["0000aaa0-0000-1000-8000-aabbccddeeff"]
+        self.on_release = None
 
     @dbus_property(access=PropertyAccess.READ)
     def Type(self) -> "s":
@@ -46,80 +46,135 @@ class RcuAdvertisement(ServiceInterface):
     def ServiceUUIDs(self) -> "as":
         return self.service_uuids
 
+    def set_payload(self, payload: bytes) -> bool:
+        """Setzt die Manufacturer-Payload. True, wenn sie sich geändert hat."""
+        if self.manufacturer_data[0xFFFF].value == payload:
+            return False
+        self.manufacturer_data = {0xFFFF: Variant("ay", payload)}
+        return True
+
     @method()
     def Release(self):
         print("[RCU-ADV] Advertisement released")
+        if self.on_release is not None:
+            self.on_release()
 
 
 # -------------------------------------------------------------------
-#   ASYNC Advertising functions (unchanged)
-# -------------------------------------------------------------------
-
-async def start_rcu_advertising():
-    print(f"[RCU-ADV] Starte Advertising für RCU={RCU_ID}")
-
-    bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
-    advertisement = RcuAdvertisement(RCU_ID)
-    path = f"/org/bluez/rcu_advertisement_{RCU_ID}"
-
-    bus.export(path, advertisement)
-
-    intro = await bus.introspect(BLUEZ_SERVICE_NAME, ADAPTER_PATH)
-    obj = bus.get_proxy_object(BLUEZ_SERVICE_NAME, ADAPTER_PATH, intro)
-
-    ad_manager = obj.get_interface(AD_MANAGER_IF)
-    await ad_manager.call_register_advertisement(path, {})
-
-    print("[RCU-ADV] Advertising läuft")
-
-    return bus, ad_manager, path
-
-
-async def stop_rcu_advertising(bus, ad_manager, path):
-    print("[RCU-ADV] Stoppe Advertising…")
-
-    try:
-        await ad_manager.call_unregister_advertisement(path)
-    except Exception as e:
-        print(f"[RCU-ADV] Fehler beim Unregister: {e}")
-
-    bus.unexport(path)
-    print("[RCU-ADV] Advertising gestoppt.")
-
-
-# -------------------------------------------------------------------
-#   THREAD WRAPPERS (solution)
+#   Dauerhafter Advertiser auf dem Main-Loop
 # -------------------------------------------------------------------
 
-def start_advertising_thread():
-    
-    loop = asyncio.new_event_loop()
-    container = {}
-
-    def runner():
-        asyncio.set_event_loop(loop)
-        bus, ad_manager, path = loop.run_until_complete(start_rcu_advertising())
-        container["bus"] = bus
-        container["ad_manager"] = ad_manager
-        container["path"] = path
-        loop.run_forever()    
-
-    t = threading.Thread(target=runner, daemon=True)
-    t.start()
-
-    return container, loop
-
-
-def stop_advertising_thread(container, loop):
-    
-    future = asyncio.run_coroutine_threadsafe(
-        stop_rcu_advertising(
-            container["bus"],
-            container["ad_manager"],
-            container["path"]
-        ),
-        loop
-    )
-    future.result()
-
-    loop.stop()
+class RcuAdvertiser:
+    """
+    Eine System-Bus-Verbindung, ein exportiertes Advertisement-Objekt und ein
+    gecachter LEAdvertisingManager1-Proxy für die ganze Laufzeit.
+    start()/stop() kosten danach je genau einen D-Bus-Aufruf
+    (RegisterAdvertisement / UnregisterAdvertisement); geänderte
+    ManufacturerData gehen per PropertiesChanged raus, ohne neu zu registrieren.
+    close() beim Beenden (main.py) meldet ab und schließt den Bus.
+    """
+
+    def __init__(self, rcu_id: str = RCU_ID):
+        self.rcu_id = rcu_id
+        self.path = f"/org/bluez/rcu_advertisement_{rcu_id}"
+        self.advertisement = RcuAdvertisement(rcu_id)
+        self.advertisement.on_release = self._released
+        self._bus = None
+        self._manager = None
+        self._manager_adapter = None
+        self._registered = False
+        self._lock = None
+        self.stats = {"registers": 0, "unregisters": 0, "updates": 0, "bus_connects": 0}
+
+    @property
+    def active(self) -> bool:
+        return self._registered
+
+    async def _ensure_bus(self):
+        if self._bus is None or not self._bus.connected:
+            self._bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+            self._bus.export(self.path, self.advertisement)
+            self._manager = None
+            self._registered = False
+            self.stats["bus_connects"] += 1
+        return self._bus
+
+    async def _ensure_manager(self):
+        bus = await self._ensure_bus()
+        # Advertising auf dem Connect-Adapter, der Scan-Adapter bleibt frei
+        adapter = adapter_pool.advertise
+        if self._manager is None or self._manager_adapter != adapter:
+            adapter_path = adapter_pool.path(adapter)
+            intro = await bus.introspect(BLUEZ_SERVICE_NAME, adapter_path)
+            obj = bus.get_proxy_object(BLUEZ_SERVICE_NAME, adapter_path, intro)
+            self._manager = obj.get_interface(AD_MANAGER_IF)
+            self._manager_adapter = adapter
+            self._registered = False
+        return self._manager
+
+    async def start(self) -> bool:
+        """Advertising einschalten (idempotent)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._registered:
+                return True
+            try:
+                manager = await self._ensure_manager()
+                await manager.call_register_advertisement(self.path, {})
+            except DBusError as e:
+                if "AlreadyExists" not in str(e.type):
+                    print(f"[RCU-ADV] Advertising konnte nicht gestartet werden: {e}")
+                    return False
+            except Exception as e:
+                print(f"[RCU-ADV] Advertising konnte nicht gestartet werden: {e}")
+                self._manager = None  # beim nächsten Mal Proxy neu aufbauen
+                return False
+            self._registered = True
+            self.stats["registers"] += 1
+            print(f"[RCU-ADV] Advertising läuft (RCU={self.rcu_id}, {self._manager_adapter}).")
+            return True
+
+    async def stop(self) -> None:
+        """Advertising ausschalten; Bus und Objekt bleiben für den nächsten Start erhalten."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._registered:
+                return
+            self._registered = False
+            try:
+                await self._manager.call_unregister_advertisement(self.path)
+                self.stats["unregisters"] += 1
+            except DBusError as e:
+                if "DoesNotExist" not in str(e.type):
+                    print(f"[RCU-ADV] Fehler beim Unregister: {e}")
+            except Exception as e:
+                print(f"[RCU-ADV] Fehler beim Unregister: {e}")
+            print("[RCU-ADV] Advertising gestoppt.")
+
+    def set_manufacturer_data(self, payload: bytes) -> None:
+        """Neue ManufacturerData; registriertes Advertisement wird per PropertiesChanged aktualisiert."""
+        if self.advertisement.set_payload(payload) and self._registered:
+            self.advertisement.emit_properties_changed(
+                {"ManufacturerData": self.advertisement.manufacturer_data})
+            self.stats["updates"] += 1
+
+    async def close(self) -> None:
+        """Beim Beenden: abmelden, Objekt entfernen, Bus schließen."""
+        await self.stop()
+        bus, self._bus = self._bus, None
+        self._manager = None
+        if bus is not None:
+            try:
+                bus.unexport(self.path)
+                bus.disconnect()
+            except Exception as e:
+                print(f"[RCU-ADV] Fehler beim Schließen des Busses: {e}")
+
+    def _released(self) -> None:
+        # BlueZ hat das Advertisement selbst entfernt (z. B. Adapter aus)
+        self._registered = False
+
+
+rcu_advertiser = RcuAdvertiser()
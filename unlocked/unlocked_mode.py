@@ -1,20 +1,49 @@
 # unlocked_mode.py
+import asyncio
+import contextlib
 import time
-import requests
 from rcu_io.DIO6 import dio6_set
-from unlocked.distance_check import start_advertising_thread, stop_advertising_thread
-from cloud.notify import notify_rcu_event   
-from config import CLOUD_URL, RCU_ID
+from unlocked.distance_check import rcu_advertiser
+from ble.presence import presence, ensure_scanning
+from ble.rssi_filter import rssi_estimator
+from cloud.notify import notify_rcu_event
+from cloud.sse import SSEClient
+from config import RCU_ID, AUTO_LOCK_RSSI, AUTO_LOCK_HOLD_S
+from telemetry import log
 
+PRESENCE_SAMPLE_S = 2.0     # max. Wartezeit auf ein Advertisement des Telefons
+ADVERTISER_CHECK_S = 5.0    # Abstand der Prüfung, ob das Advertising noch registriert ist
 
+# Status-Byte hinter der RCU-ID in den ManufacturerData des Advertisements
+ADV_STATE_UNLOCKED = 0x01   # entsperrt, Telefon in Reichweite
+ADV_STATE_LEAVING = 0x02    # Telefon entfernt sich – Auto-Lock läuft
 
 
+class _AdvertisedState:
+    """Status für das Advertisement; _keep_advertising wird bei jeder Änderung geweckt."""
 
-def start_unlocked_mode(selected_device_name, matched_device_id):
+    def __init__(self):
+        self.value = ADV_STATE_UNLOCKED
+        self.changed = asyncio.Event()
+
+    def set(self, value: int) -> None:
+        if value != self.value:
+            self.value = value
+            self.changed.set()
+
+    def payload(self) -> bytes:
+        return RCU_ID.encode("utf-8") + bytes([self.value])
+
+
+
+async def start_unlocked_mode(selected_device_name, matched_device_id, address=None):
     """
     Dieser Modus wird nach erfolgreicher BLE + RSSI-Freigabe betreten.
-    Die Maschine ist entsperrt und wartet auf LOCK von der Cloud.
-    Bei LOCK wird verriegelt und die Funktion beendet -> main() läuft weiter.
+    Die Maschine ist entsperrt, bis einer der Wächter-Tasks auslöst:
+      - Cloud sendet LOCK per SSE (oder die Verbindung ist endgültig verloren)
+      - das Telefon ('address') ist AUTO_LOCK_HOLD_S lang unter AUTO_LOCK_RSSI
+        bzw. nicht mehr zu sehen (Dauer-Scanner + RSSI-Filter)
+    Danach wird verriegelt und die Funktion beendet -> main() läuft weiter.
     """
 
     print("\n[RCU] >>> ENTSPERRT-MODUS AKTIV <<<")
@@ -24,64 +53,108 @@ def start_unlocked_mode(selected_device_name, matched_device_id):
     # Maschine ist offen → LED grün
     dio6_set(0)
 
-    #
-    container, loop = start_advertising_thread()
-
-    # SSE-Endpunkt der Cloud
-    sse_url = f"{CLOUD_URL}/api/rcu/sse/{RCU_ID}"
-    headers = {
-        "Accept": "text/event-stream",
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive"
-    }
-
-    while True:  # Endlos-Schleide -> verbunden bleiben
-        try:   # Verbindung offen bleiben Cloud "LOCK" sendet, oder Verbindung verloren
-            # Persistente SSE-Verbindung zur Cloud starten
-            with requests.get(sse_url, headers=headers, stream=True, timeout=(5, 15)) as resp: ## 5s Verbindungsaufbau, 15s max. Wartezeit zwischen Daten
-                for raw_line in resp.iter_lines(decode_unicode=True):
-
-                    # LOG COMPLETO
-                    print(f"[RAW SSE] >> '{raw_line}'")
-
-                    if not raw_line:
-                        continue
-
-                    line = raw_line
-
-                    if line.startswith("data:"):
-                        # Limpieza robusta
-                        cleaned = line.replace("data:", "").strip()
-                        event = cleaned.upper()
-
-                        print(f"[UNLOCKED][SSE] Event: '{event}'")
-
-                        if event == "LOCK":
-                            return handle_lock(container, loop, selected_device_name, matched_device_id)
-
-        except Exception as e:
-            print("\n[UNLOCKED][FAILSAFE] Cloud-Verbindung dauerhaft verloren – Maschine wird verriegelt!\n") 
-            # stop_advertising_thread(container, loop)
-            return handle_lock(container, loop, selected_device_name, matched_device_id)
-
-        
-
+    # Dauerhafter Advertiser: nur RegisterAdvertisement, kein neuer Thread/Bus
+    state = _AdvertisedState()
+    rcu_advertiser.set_manufacturer_data(state.payload())
+    await rcu_advertiser.start()
+
+    watchers = [asyncio.create_task(_watch_cloud()), asyncio.create_task(_keep_advertising(state))]
+    if address:
+        # Derselbe Dauer-Scanner wie im Scan-Modus – keine zusätzlichen Discovery-Scans
+        await ensure_scanning()
+        watchers.append(asyncio.create_task(_watch_presence(address, state)))
+
+    try:
+        done, _ = await asyncio.wait(watchers, return_when=asyncio.FIRST_COMPLETED)
+        task = done.pop()
+        reason = task.result() if not task.cancelled() else "abgebrochen"
+    except Exception as e:
+        print(f"\n[UNLOCKED][FAILSAFE] Unerwarteter Fehler ({e}) – Maschine wird verriegelt!\n")
+        reason = "Fehler"
+    finally:
+        for task in watchers:
+            task.cancel()
+        for task in watchers:
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+
+    return await handle_lock(selected_device_name, matched_device_id, reason)
+
+
+async def _watch_cloud() -> str:
+    # SSE-Endpunkt der Cloud (Reconnect/Resume/Backoff übernimmt SSEClient)
+    client = SSEClient(f"/api/rcu/sse/{RCU_ID}")
+
+    try:   # Verbindung offen bleiben bis Cloud "LOCK" sendet, oder Verbindung endgültig verloren
+        async with contextlib.aclosing(client.events()) as events:
+            async for sse_event in events:
+                event = sse_event.data.strip().upper()
+
+                log.cloud.info("[UNLOCKED] SSE-Event: '%s'", event)
+
+                if event == "LOCK":
+                    return "LOCK"
+        return "LOCK"  # Generator endet nur durch Fehler – sicherheitshalber verriegeln
+
+    except Exception as e:  # SSEConnectionLost nach allen Wiederholungen oder unerwarteter Fehler
+        print(f"\n[UNLOCKED][FAILSAFE] Cloud-Verbindung dauerhaft verloren ({e}) – Maschine wird verriegelt!\n")
+        return "Cloud-Verbindung verloren"
+
+
+async def _watch_presence(address: str, state: _AdvertisedState) -> str:
+    """Auto-Lock: geglätteter RSSI AUTO_LOCK_HOLD_S lang unter AUTO_LOCK_RSSI oder kein Advertisement."""
+    away_since = None
+    while True:
+        entry = await presence.wait_for(address, timeout=PRESENCE_SAMPLE_S)
+        now = time.monotonic()
+        if entry is not None:
+            estimate = rssi_estimator.update(address, entry.rssi, now)
+            away = estimate.rssi < AUTO_LOCK_RSSI
+        else:
+            away = True  # Telefon sendet nicht mehr (außer Reichweite oder ausgeschaltet)
+
+        if not away:
+            away_since = None
+            state.set(ADV_STATE_UNLOCKED)
+            continue
+        if away_since is None:
+            away_since = now
+            state.set(ADV_STATE_LEAVING)
+            log.ble.info("[UNLOCKED] Telefon %s entfernt sich – Auto-Lock in %.0fs.", address, AUTO_LOCK_HOLD_S,
+                         key=address, every=AUTO_LOCK_HOLD_S)
+        elif now - away_since >= AUTO_LOCK_HOLD_S:
+            print(f"\n[UNLOCKED][BLE] Telefon {address} seit {AUTO_LOCK_HOLD_S:.0f}s außer Reichweite – Auto-Lock.")
+            return "Telefon außer Reichweite"
+
+
+async def _keep_advertising(state: _AdvertisedState) -> str:
+    """
+    Neuer Status -> ManufacturerData per PropertiesChanged (kein Unregister/Register).
+    Hat BlueZ das Advertisement verworfen (z. B. Adapter-Reset), wird es neu registriert.
+    """
+    while True:
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(state.changed.wait(), ADVERTISER_CHECK_S)
+        state.changed.clear()
+        rcu_advertiser.set_manufacturer_data(state.payload())
+        if not rcu_advertiser.active:
+            await rcu_advertiser.start()
 
 
-def handle_lock(container, loop, selected_device_name, matched_device_id):
+async def handle_lock(selected_device_name, matched_device_id, reason="LOCK"):
 
-    print("\n[RCU] >>> LOCK von der Cloud erhalten – Maschine wird verriegelt <<<")
+    if reason == "LOCK":
+        print("\n[RCU] >>> LOCK von der Cloud erhalten – Maschine wird verriegelt <<<")
+    else:
+        print(f"\n[RCU] >>> {reason} – Maschine wird verriegelt <<<")
     # Verriegeln
     dio6_set(1)
     # Optional: Cloud über Verriegelung informieren
-    notify_rcu_event(RCU_ID, selected_device_name, matched_device_id, 'Verriegelt')
-    stop_advertising_thread(container, loop)
+    result = 'Verriegelt' if reason == "LOCK" else f'Verriegelt ({reason})'
+    notify_rcu_event(RCU_ID, selected_device_name, matched_device_id, result)
+    await rcu_advertiser.stop()
     # Kleine Pause für Hardware-Stabilität
-    time.sleep(1)
+    await asyncio.sleep(1)
 
     print("[RCU] Maschine verriegelt. Rückkehr zum Scan-Modus.\n")
     return  # <-- kehrt zu main() zurück
-
-
-
-